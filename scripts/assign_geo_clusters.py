@@ -0,0 +1,56 @@
+"""
+保存済みの地理クラスタモデルで新しい物件にgeo_clusterを割り当て
+
+再学習せずに、重心のKD-treeで最近傍のクラスタを割り当てる。
+
+使い方:
+    uv run python scripts/assign_geo_clusters.py INPUT.csv OUTPUT.csv [--model-dir DIR]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import pandas as pd  # noqa: E402
+
+from src.features.geo_cluster import GeoClusterModel  # noqa: E402
+
+GEO_CLUSTER_MODEL_DIR = project_root / "experiments" / "models" / "geo_cluster"
+
+
+def latest_model_dir(base_dir: Path) -> Path:
+    """最後に保存されたモデルのディレクトリ"""
+    model_dirs = [p for p in base_dir.iterdir() if p.is_dir()]
+    if not model_dirs:
+        raise FileNotFoundError(f"地理クラスタモデルがありません: {base_dir}")
+    return max(model_dirs, key=lambda p: p.stat().st_mtime)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("input", type=Path, help="lat, lon列を含むCSV")
+parser.add_argument("output", type=Path, help="geo_cluster列を追加したCSVの出力先")
+parser.add_argument(
+    "--model-dir", type=Path, default=None, help="モデルのディレクトリ（省略時は最新）"
+)
+args = parser.parse_args()
+
+model_dir = args.model_dir or latest_model_dir(GEO_CLUSTER_MODEL_DIR)
+model = GeoClusterModel.load(model_dir)
+print(f"✓ モデル読み込み: {model_dir.name}（{model.n_clusters}クラスタ）")
+
+df = pd.read_csv(args.input)
+lat_col = model.params.get("lat_col", "lat")
+lon_col = model.params.get("lon_col", "lon")
+
+start = time.perf_counter()
+df["geo_cluster"] = model.assign(df[lat_col], df[lon_col])
+elapsed = time.perf_counter() - start
+
+df.to_csv(args.output, index=False)
+print(f"✓ {len(df):,}行を割り当て: {elapsed:.3f}秒（{len(df) / max(elapsed, 1e-9):,.0f}行/秒）")
+print(f"✓ 保存: {args.output}")
@@ -0,0 +1,82 @@
+"""
+国土数値情報のポリゴン（行政区域・用途地域など）を物件に割り当て
+
+ポリゴンのレイヤーから格子インデックスを1回だけ作成してnpzに保存し、
+以降はインデックスを作成せずに保存したものを読み込んで内外判定を行う。
+保存したインデックスがレイヤーの内容・セルの大きさと一致しない場合は作成し直す。
+判定の速度（行/秒）を表示する。
+
+使い方:
+    uv run python scripts/assign_polygons.py LAYER INPUT.csv OUTPUT.csv \\
+        --attributes N03_007 [--index INDEX.npz] [--n-jobs -1]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import pandas as pd  # noqa: E402
+
+from src.data.kokudo import POLYGON, load_layer  # noqa: E402
+from src.features.polygon_index import (PolygonIndex,  # noqa: E402
+                                        assign_polygons)
+from src.utils.unique import broadcast_unique  # noqa: E402
+
+
+def main() -> None:
+    """ポリゴンの属性を割り当ててCSVに保存"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("layer", type=Path, help="ポリゴンのレイヤー（GeoJSONまたは.shp）")
+    parser.add_argument("input", type=Path, help="lat, lon列を含むCSV")
+    parser.add_argument("output", type=Path, help="属性の列を追加したCSVの出力先")
+    parser.add_argument("--attributes", nargs="+", required=True, help="追加する属性")
+    parser.add_argument("--index", type=Path, default=None, help="格子インデックスのnpz")
+    parser.add_argument("--cell-size", type=float, default=0.01, help="セルの大きさ（度）")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="プロセス数（-1は全コア）")
+    args = parser.parse_args()
+
+    # インデックスは保存したものがない・一致しない場合のみ作成する
+    layer = load_layer(args.layer, columns=args.attributes, build_index=False)
+    if layer.kind != POLYGON:
+        raise ValueError(f"ポリゴンのレイヤーではありません: {args.layer}")
+    geometry = (layer.coords, layer.ring_offsets, layer.part_offsets)
+
+    index = None
+    if args.index is not None and args.index.exists():
+        index = PolygonIndex.load(args.index)
+        if index.matches(*geometry, args.cell_size):
+            print(f"✓ インデックス読み込み: {args.index}")
+        else:
+            print(f"⚠ レイヤー・セルの大きさが異なるため作成し直します: {args.index}")
+            index = None
+
+    if index is None:
+        index = PolygonIndex.build(*geometry, cell_size=args.cell_size)
+        if args.index is not None:
+            index.save(args.index)
+            print(f"✓ インデックス保存: {args.index}")
+
+    df = pd.read_csv(args.input)
+
+    start = time.perf_counter()
+    polygon_ids = assign_polygons(index, df["lat"], df["lon"], n_jobs=args.n_jobs)
+    elapsed = time.perf_counter() - start
+
+    for attribute in args.attributes:
+        df[f"{args.layer.stem}_{attribute}"] = broadcast_unique(
+            layer.attributes[attribute], polygon_ids
+        )
+
+    df.to_csv(args.output, index=False)
+    print(f"✓ {len(df):,}行を判定: {elapsed:.3f}秒（{len(df) / max(elapsed, 1e-9):,.0f}行/秒）")
+    print(f"✓ ポリゴン内: {(polygon_ids >= 0).mean():.1%}")
+    print(f"✓ 保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
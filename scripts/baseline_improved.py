@@ -19,6 +19,7 @@ import numpy as np
 from datetime import datetime
 import warnings
 
+from src.data.load import load_raw_csv
 from src.data.preprocess import preprocess_for_catboost
 from src.models.train_catboost import train_catboost_cv, predict_with_models
 
@@ -37,8 +38,8 @@ print("=" * 60)
 
 # データ読み込み
 print("\n[1] データ読み込み...")
-train = pd.read_csv(TRAIN_PATH)
-test = pd.read_csv(TEST_PATH)
+train = load_raw_csv(TRAIN_PATH)
+test = load_raw_csv(TEST_PATH)
 sample_sub = pd.read_csv(SAMPLE_PATH, header=None, names=['id', 'money_room'])
 
 print(f"Train shape: {train.shape}")
@@ -9,10 +9,10 @@
 """
 
 import gc
-import pickle
 import sys
 import time
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
 # プロジェクトルートをパスに追加
@@ -25,13 +25,13 @@ import numpy as np  # noqa: E402
 import pandas as pd  # noqa: E402
 from tqdm import tqdm  # noqa: E402
 
-from src.data.preprocess import preprocess_for_catboost  # noqa: E402
-from src.features.geo_features import (  # noqa: E402
-    create_cluster_aggregation_features, create_derived_features,
-    create_distance_features, create_kmeans_clusters,
-    create_target_encoding_features)
-from src.models.train_catboost import (predict_with_models,  # noqa: E402
-                                       train_catboost_cv)
+from src.data.preprocess import save_slash_vocabulary  # noqa: E402
+from src.features.geo_pipeline import (GEO_PIPELINE_TARGETS,  # noqa: E402
+                                       build_geo_pipeline)
+from src.models.train_catboost import (concat_fold_features,  # noqa: E402
+                                       predict_with_models, train_catboost_cv)
+from src.utils.cache import FeatureCache  # noqa: E402
+from src.utils.pipeline import Pipeline  # noqa: E402
 
 # warnings.filterwarnings("ignore")  # Warning表示を有効化
 
@@ -42,329 +42,302 @@ TEST_PATH = DATA_DIR / "raw" / "test.csv"
 SAMPLE_PATH = DATA_DIR / "raw" / "sample_submit.csv"
 OUTPUT_DIR = project_root / "submissions" / "exp003_geo_features"
 PROCESSED_DIR = DATA_DIR / "processed"
+KOKUDO_DIR = DATA_DIR / "raw" / "kokudo_suuchi"
+# make ingest で作成するParquetデータセット（存在する場合はCSVの代わりに使用）
+TRAIN_DATASET = DATA_DIR / "interim" / "train_parquet"
+TEST_DATASET = DATA_DIR / "interim" / "test_parquet"
+
+# 特徴量キャッシュ（入力ファイル・パラメータ・コードのハッシュをノードごとのキーとする）
+CACHE_DIR = PROCESSED_DIR / "cache"
+CACHE_MAX_BYTES = 20 * 1024**3
+# make target-stats で月ごとに更新するTarget Encodingの統計量
+TARGET_STATS_PATH = PROCESSED_DIR / "target_stats.parquet"
+# 推論時に再利用するタグ語彙（学習データのみから作成）
+TAG_VOCABULARY_PATH = PROCESSED_DIR / "tag_vocabulary.json"
+# 地理クラスタモデル（標準化パラメータと重心）の保存先（<version>/ に保存）
+GEO_CLUSTER_MODEL_DIR = project_root / "experiments" / "models" / "geo_cluster"
+
+# スラッシュ区切り特徴量の展開列をSparseで保持する（メモリ削減）
+SPARSE_TAGS = True
+
+# 依存関係のないノードを並列に実行するスレッド数
+PIPELINE_WORKERS = 4
+
+# 前処理のパラメータ（変更すると前処理以降のノードが再実行される）
+PREPROCESS_PARAMS = {
+    "target_col": "money_room",
+    "apply_log": True,
+    "sparse_tags": SPARSE_TAGS,
+}
 
-# 前処理済みデータのパス
-PROCESSED_TRAIN = PROCESSED_DIR / "train_processed.parquet"
-PROCESSED_TEST = PROCESSED_DIR / "test_processed.parquet"
-PROCESSED_TARGET = PROCESSED_DIR / "target.parquet"
-PROCESSED_CAT_FEATURES = PROCESSED_DIR / "cat_features.pkl"
-
-print("=" * 80)
-print("🚀 地理空間特徴量を追加したベースライン")
-print("=" * 80)
-print(f"開始時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("=" * 80)
-
-# 全体の処理時間を計測
-overall_start_time = time.time()
-
-# 前処理済みデータの確認とロード
-PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
-use_cache = all(
-    [
-        PROCESSED_TRAIN.exists(),
-        PROCESSED_TEST.exists(),
-        PROCESSED_TARGET.exists(),
-        PROCESSED_CAT_FEATURES.exists(),
-    ]
-)
-
-if use_cache:
-    print("\n✅ 前処理済みデータを読み込みます...")
-    load_start = time.time()
-
-    train_features = pd.read_parquet(PROCESSED_TRAIN)
-    print(f"  📁 train_processed.parquet 読み込み完了")
-
-    test_features = pd.read_parquet(PROCESSED_TEST)
-    print(f"  📁 test_processed.parquet 読み込み完了")
-
-    target = pd.read_parquet(PROCESSED_TARGET).squeeze()
-    print(f"  📁 target.parquet 読み込み完了")
-
-    with open(PROCESSED_CAT_FEATURES, "rb") as f:
-        cat_features = pickle.load(f)
-    print(f"  📁 cat_features.pkl 読み込み完了")
-
-    load_time = time.time() - load_start
-    print(f"\n  ⏱️  データ読み込み時間: {load_time:.2f}秒")
-    print(f"\n  📊 Train shape: {train_features.shape}")
-    print(f"  📊 Test shape: {test_features.shape}")
-    print(f"  📊 カテゴリカル特徴量数: {len(cat_features)}")
+# CV分割数（目的変数の統計量のOOF計算にも同じ分割を使う）
+CV_N_SPLITS = 3
+# 目的変数の統計量をCVのfoldごとにOOFで計算する（検証データへのリークを防ぐ）
+OOF_TARGET_STATS = True
+
+# 地理空間特徴量のパラメータ（変更したノードとその下流だけが再実行される）
+GEO_PARAMS = {
+    "n_clusters": 50,
+    "random_state": 42,
+    # "minibatch" にするとMiniBatchKMeansで学習（クラスタ数が多い場合に高速）
+    "kmeans_engine": "kmeans",
+    # 格子セル（学習不要で再実行しても同じID）。例: "mesh_levels": [3] とし、
+    # cluster_colsやtarget_encoding_colsに "mesh3" を加えるとキーとして使える
+    "geohash_precisions": [],
+    "mesh_levels": [],
+    # クラスター集約特徴量のキー
+    "cluster_cols": ["geo_cluster"],
+    "agg_cols": ["house_area", "year_built", "walk_distance1", "money_kyoueki"],
+    "target_encoding_cols": ["city", "prefecture", "eki_name1"],
+    # 組み合わせキーと、件数の少ないキーを上位の階層に近づける階層的なTarget Encoding
+    # （oof_target_stats=Trueの場合のみ）
+    "target_encoding_combinations": [["city", "building_type"]],
+    "target_encoding_hierarchies": [["prefecture", "city", "eki_name1", "geo_cluster"]],
+    "smoothing": 10.0,
+    # 保存済みの統計量からTarget Encodingを計算する（OOFの場合は使用できないため、
+    # oof_target_stats=Falseで統計量が存在する場合のみ。それ以外は学習データから集計）
+    "target_stats_path": (
+        str(TARGET_STATS_PATH)
+        if not OOF_TARGET_STATS and TARGET_STATS_PATH.exists()
+        else None
+    ),
+    # 近い参照地点（都道府県庁所在地・主要ターミナル駅）までの大円距離
+    "reference_sets": ["prefecture_capitals", "major_stations"],
+    "reference_k": 2,
+    # 近い学習データの物件k件の価格（平均・中央値・距離で重み付けした平均）
+    # （oof_target_stats=Trueの場合のみ。0で無効）
+    "knn_k": 10,
+    # 自身のtarget_ymより前の時点の近い物件k件の価格（oof_target_stats=Trueの場合のみ）
+    "temporal_knn_k": 10,
+    "temporal_knn_max_lag_months": None,
+    # 国土数値情報のレイヤー（GeoJSONまたはシェープファイル）との空間結合。例:
+    # "stations": {"path": str(KOKUDO_DIR / "N02-22_Station.geojson"), "radii_km": [0.5, 1.0]},
+    # "land_price": {"path": str(KOKUDO_DIR / "L01-23.geojson"), "attributes": ["L01_006"]},
+    # ポリゴンのレイヤーは点を含むポリゴンの属性を追加（categoricalはカテゴリカル特徴量）:
+    # "zoning": {"path": str(KOKUDO_DIR / "A29-19.geojson"), "attributes": ["A29_004"],
+    #            "categorical": ["A29_004"]},
+    "kokudo_layers": {},
+    # 半径内の物件数（train/testの全物件）と、building_typeごとの物件数
+    "density_radii_km": [0.25, 0.5, 1.0],
+    "density_category_cols": ["building_type"],
+    # 各ノードはDataFrameをコピーせず新しい列だけを追加する（メモリ削減。
+    # 前後の比較は make benchmark-memory）
+    "inplace_features": True,
+    "oof_target_stats": OOF_TARGET_STATS,
+    "n_splits": CV_N_SPLITS,
+}
 
-else:
-    print("\n🔄 前処理を実行します...")
-    preprocess_start = time.time()
 
-    # データ読み込み
-    print("\n" + "=" * 80)
-    print("[STEP 1/7] 📂 データ読み込み")
+def main() -> None:
+    """特徴量の作成・CV・提出ファイルの作成"""
+    print("=" * 80)
+    print("🚀 地理空間特徴量を追加したベースライン")
+    print("=" * 80)
+    print(f"開始時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 80)
-    step_start = time.time()
 
-    train = pd.read_csv(TRAIN_PATH, low_memory=False)
-    print(f"  ✓ Train data loaded: {train.shape}")
+    # 全体の処理時間を計測
+    overall_start_time = time.time()
 
-    test = pd.read_csv(TEST_PATH, low_memory=False)
-    print(f"  ✓ Test data loaded: {test.shape}")
+    # パイプラインの作成（ノードごとにキャッシュし、変更されたノードと下流だけを再実行）
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+    cache = FeatureCache(CACHE_DIR, max_bytes=CACHE_MAX_BYTES)
 
-    print(f"  ⏱️  読み込み時間: {time.time() - step_start:.2f}秒")
+    use_dataset = TRAIN_DATASET.exists() and TEST_DATASET.exists()
+    train_source, test_source = (
+        (TRAIN_DATASET, TEST_DATASET) if use_dataset else (TRAIN_PATH, TEST_PATH)
+    )
+    pipeline = Pipeline(
+        build_geo_pipeline(train_source, test_source, PREPROCESS_PARAMS, GEO_PARAMS),
+        cache=cache,
+        max_workers=PIPELINE_WORKERS,
+    )
 
-    # 基本前処理
     print("\n" + "=" * 80)
-    print("[STEP 2/7] 🔧 基本前処理")
+    print("[STEP 1-4/7] 🔄 読み込み・前処理・地理空間特徴量（パイプライン）")
     print("=" * 80)
-    step_start = time.time()
-
-    train_features, test_features, target, cat_features = preprocess_for_catboost(
-        train, test, target_col="money_room", apply_log=True
-    )
-
-    print(f"  ⏱️  前処理時間: {time.time() - step_start:.2f}秒")
-
-    # 元のデータフレームをメモリから削除
-    del train, test
+    pipeline_start = time.time()
+
+    results = pipeline.run(GEO_PIPELINE_TARGETS)
+    train_features = results["train_features"]
+    test_features = results["test_features"]
+    target = results["train_target"]
+    cat_features = results["cat_features"]
+    fold_ids = results["fold_ids"]
+    # 目的変数を使い、CVのfoldごとに特徴量を計算するエンコーダ
+    fold_encoders = {
+        name: results[name]
+        for name in ["target_encoder", "knn_encoder", "temporal_knn_encoder"]
+    }
+
+    # 推論時に再利用するタグ語彙と地理クラスタモデルを保存
+    save_slash_vocabulary(results["tag_vocabulary"], TAG_VOCABULARY_PATH)
+    print(f"  ✓ タグ語彙を保存: {TAG_VOCABULARY_PATH.name}")
+    geo_cluster_dir = results["geo_cluster_model"].save(GEO_CLUSTER_MODEL_DIR)
+    print(f"  ✓ 地理クラスタモデルを保存: {geo_cluster_dir.relative_to(project_root)}")
+
+    del results
     gc.collect()
 
-    # 地理空間特徴量の追加
+    pipeline_time = time.time() - pipeline_start
+    print(f"\n  📊 Train shape: {train_features.shape}")
+    print(f"  📊 Test shape: {test_features.shape}")
+    print(f"  📊 カテゴリカル特徴量数: {len(cat_features)}")
+    print(f"\n  ✅ 特徴量作成 完了: {pipeline_time:.2f}秒 ({pipeline_time/60:.1f}分)")
+
+    # sample_submitは常に読み込む（軽いので）
+    sample_sub = pd.read_csv(SAMPLE_PATH, header=None, names=["id", "money_room"])
+
+    # モデルパラメータ
+    params = {
+        "iterations": 500,  # メモリ削減
+        "learning_rate": 0.05,
+        "depth": 5,  # メモリ削減
+        "loss_function": "MAE",
+        "eval_metric": "MAE",
+        "random_seed": 42,
+        "verbose": 100,
+        "early_stopping_rounds": 50,
+    }
+
+    # Cross Validation
     print("\n" + "=" * 80)
-    print("[STEP 3/7] 🌍 地理空間特徴量の作成")
+    print(f"[STEP 5/7] 🤖 Cross Validation ({CV_N_SPLITS}-Fold)")
+    print("=" * 80)
+    print(f"  📊 Train samples: {len(train_features):,}")
+    print(f"  📊 Features: {len(train_features.columns)}")
+    print(f"  📊 Categorical features: {len(cat_features)}")
+    print(f"  🎯 Model: CatBoost Regressor")
+    print(
+        f"  🔧 Iterations: {params['iterations']}, Depth: {params['depth']}, LR: {params['learning_rate']}"
+    )
     print("=" * 80)
-    geo_start = time.time()
-
-    # 目的変数を一時的に結合（Target Encoding用）
-    train_with_target = train_features.copy()
-    train_with_target["money_room"] = target
-
-    # train_featuresは一旦不要
-    del train_features
-    gc.collect()
 
-    # 1. K-meansクラスタリング
-    print("\n  [3-1] K-meansクラスタリング...")
-    substep_start = time.time()
-    train_with_target, test_features, kmeans = create_kmeans_clusters(
-        train_with_target,
-        test_features,
-        lat_col="lat",
-        lon_col="lon",
-        n_clusters=50,
-        random_state=42,
+    # 目的変数の統計量と近傍物件の価格はfoldごとに計算し、キャッシュする
+    train_fold_features = None
+    test_fold_features = None
+    if GEO_PARAMS["oof_target_stats"]:
+        train_fold_features = concat_fold_features(
+            *[
+                partial(
+                    encoder.fold_features, cache=cache, cache_key=pipeline.keys[name]
+                )
+                for name, encoder in fold_encoders.items()
+            ]
+        )
+        test_fold_features = concat_fold_features(
+            *[
+                partial(encoder.test_features, test_features)
+                for encoder in fold_encoders.values()
+            ]
+        )
+
+    cv_start = time.time()
+    models, cv_scores = train_catboost_cv(
+        train_features,
+        target,
+        cat_features,
+        n_splits=CV_N_SPLITS,
+        params=params,
+        verbose=100,  # メモリ削減
+        fold_ids=fold_ids,
+        fold_features=train_fold_features,
     )
-    print(f"        ⏱️  {time.time() - substep_start:.2f}秒")
+    cv_time = time.time() - cv_start
+    print(f"\n  ⏱️  CV時間: {cv_time:.2f}秒 ({cv_time/60:.1f}分)")
 
-    # kmeansモデルは不要
-    del kmeans
+    # targetはもう不要
+    del target
     gc.collect()
 
-    # 2. クラスターごとの集約特徴量
-    print("\n  [3-2] クラスター集約特徴量...")
-    substep_start = time.time()
-    train_with_target, test_features = create_cluster_aggregation_features(
-        train_with_target,
-        test_features,
-        target_col="money_room",
-        cluster_col="geo_cluster",
-        agg_cols=["house_area", "year_built", "walk_distance1", "money_kyoueki"],
-    )
-    print(f"        ⏱️  {time.time() - substep_start:.2f}秒")
+    # テストデータで予測
+    print("\n" + "=" * 80)
+    print("[STEP 6/7] 🔮 テストデータで予測")
+    print("=" * 80)
+    pred_start = time.time()
 
-    # 3. Target Encoding
-    print("\n  [3-3] Target Encoding...")
-    substep_start = time.time()
-    train_with_target, test_features = create_target_encoding_features(
-        train_with_target,
+    predictions = predict_with_models(
+        models,
         test_features,
-        target_col="money_room",
-        categorical_cols=["city", "prefecture", "eki_name1"],
-        smoothing=10.0,
-    )
-    print(f"        ⏱️  {time.time() - substep_start:.2f}秒")
-
-    # 4. 距離特徴量
-    print("\n  [3-4] 距離特徴量...")
-    substep_start = time.time()
-    train_with_target = create_distance_features(
-        train_with_target, lat_col="lat", lon_col="lon"
+        cat_features,
+        apply_expm1=True,
+        fold_features=test_fold_features,
     )
-    test_features = create_distance_features(
-        test_features, lat_col="lat", lon_col="lon"
-    )
-    print(f"        ⏱️  {time.time() - substep_start:.2f}秒")
-
-    # 5. 派生特徴量
-    print("\n  [3-5] 派生特徴量...")
-    substep_start = time.time()
-    train_with_target = create_derived_features(train_with_target)
-    test_features = create_derived_features(test_features)
-    print(f"        ⏱️  {time.time() - substep_start:.2f}秒")
-
-    print(f"\n  🌍 地理空間特徴量作成 完了: {time.time() - geo_start:.2f}秒")
 
-    # 目的変数を分離
-    target = train_with_target["money_room"]
-    train_features = train_with_target.drop(columns=["money_room"])
+    pred_time = time.time() - pred_start
+    print(f"  ✓ 予測完了")
+    print(f"  ⏱️  予測時間: {pred_time:.2f}秒")
 
-    # train_with_targetは不要
-    del train_with_target
+    # test_featuresはもう不要
+    del test_features, test_fold_features
     gc.collect()
 
-    print(f"\n  📊 最終的な特徴量数: {len(train_features.columns)}")
-
-    # カテゴリカル特徴量の更新（新しく追加された特徴量は数値型）
-    # geo_clusterはカテゴリカルとして扱う
-    if "geo_cluster" in train_features.columns:
-        train_features["geo_cluster"] = train_features["geo_cluster"].astype(str)
-        test_features["geo_cluster"] = test_features["geo_cluster"].astype(str)
-        if "geo_cluster" not in cat_features:
-            cat_features.append("geo_cluster")
-
-    print(f"  📊 カテゴリカル特徴量数: {len(cat_features)}")
-
-    # 前処理済みデータを保存
+    # Submission作成
     print("\n" + "=" * 80)
-    print("[STEP 4/7] 💾 前処理済みデータを保存")
+    print("[STEP 7/7] 📝 Submission作成")
     print("=" * 80)
-    save_start = time.time()
+    submission_start = time.time()
 
-    train_features.to_parquet(PROCESSED_TRAIN, index=False)
-    print(f"  ✓ train_processed.parquet 保存完了")
+    submission = sample_sub.copy()
+    submission["money_room"] = predictions.astype(int)
 
-    test_features.to_parquet(PROCESSED_TEST, index=False)
-    print(f"  ✓ test_processed.parquet 保存完了")
+    # predictionsは不要
+    del predictions, sample_sub
+    gc.collect()
 
-    pd.DataFrame({"target": target}).to_parquet(PROCESSED_TARGET, index=False)
-    print(f"  ✓ target.parquet 保存完了")
+    # 保存
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_path = OUTPUT_DIR / f"submission_{timestamp}.csv"
+    submission.to_csv(output_path, index=False, header=False)
 
-    with open(PROCESSED_CAT_FEATURES, "wb") as f:
-        pickle.dump(cat_features, f)
-    print(f"  ✓ cat_features.pkl 保存完了")
+    print(f"  ✓ Submission saved: {output_path}")
 
-    print(f"  ⏱️  保存時間: {time.time() - save_start:.2f}秒")
-    print(f"  📁 保存先: {PROCESSED_DIR}/")
+    # 特徴量重要度の保存
+    feature_importance = pd.DataFrame(
+        {
+            "feature": models[0].feature_names_,
+            "importance": models[0].feature_importances_,
+        }
+    ).sort_values("importance", ascending=False)
 
-    preprocess_time = time.time() - preprocess_start
-    print(f"\n  ✅ 前処理 完了: {preprocess_time:.2f}秒 ({preprocess_time/60:.1f}分)")
+    importance_path = OUTPUT_DIR / f"feature_importance_{timestamp}.csv"
+    feature_importance.to_csv(importance_path, index=False)
+    print(f"  ✓ Feature importance saved: {importance_path}")
 
-# sample_submitは常に読み込む（軽いので）
-sample_sub = pd.read_csv(SAMPLE_PATH, header=None, names=["id", "money_room"])
+    submission_time = time.time() - submission_start
+    print(f"  ⏱️  Submission作成時間: {submission_time:.2f}秒")
+
+    # 結果サマリー
+    print("\n" + "=" * 80)
+    print("🎉 完了!")
+    print("=" * 80)
+    print(f"📊 CV結果:")
+    print(f"  - MAPE: {np.mean(cv_scores):.4f}% (± {np.std(cv_scores):.4f}%)")
+    print(f"  - Fold scores: {[f'{s:.4f}%' for s in cv_scores]}")
+    print(f"\n📈 予測値の統計:")
+    stats = submission["money_room"].describe()
+    print(f"  - Count: {int(stats['count']):,}")
+    print(f"  - Mean:  ¥{int(stats['mean']):,}")
+    print(f"  - Std:   ¥{int(stats['std']):,}")
+    print(f"  - Min:   ¥{int(stats['min']):,}")
+    print(f"  - Max:   ¥{int(stats['max']):,}")
+    print(f"\n📂 出力ファイル:")
+    print(f"  - Submission: {output_path.name}")
+    print(f"  - Feature importance: {importance_path.name}")
+    print(
+        f"\n⏱️  総実行時間: {time.time() - overall_start_time:.2f}秒 ({(time.time() - overall_start_time)/60:.1f}分)"
+    )
+    print("\nTop 30 重要な特徴量:")
+    print(feature_importance.head(30).to_string(index=False))
+    print("\n" + "=" * 80)
+    print("✅ Ready to submit! 🚀")
+    print("=" * 80)
+
+    # 最終的なクリーンアップ
+    del train_features, models, feature_importance, submission
+    gc.collect()
 
-# モデルパラメータ
-params = {
-    "iterations": 500,  # メモリ削減
-    "learning_rate": 0.05,
-    "depth": 5,  # メモリ削減
-    "loss_function": "MAE",
-    "eval_metric": "MAE",
-    "random_seed": 42,
-    "verbose": 100,
-    "early_stopping_rounds": 50,
-}
 
-# Cross Validation
-print("\n" + "=" * 80)
-print("[STEP 5/7] 🤖 Cross Validation (3-Fold)")
-print("=" * 80)
-print(f"  📊 Train samples: {len(train_features):,}")
-print(f"  📊 Features: {len(train_features.columns)}")
-print(f"  📊 Categorical features: {len(cat_features)}")
-print(f"  🎯 Model: CatBoost Regressor")
-print(
-    f"  🔧 Iterations: {params['iterations']}, Depth: {params['depth']}, LR: {params['learning_rate']}"
-)
-print("=" * 80)
-
-cv_start = time.time()
-models, cv_scores = train_catboost_cv(
-    train_features,
-    target,
-    cat_features,
-    n_splits=3,
-    params=params,
-    verbose=100,  # メモリ削減
-)
-cv_time = time.time() - cv_start
-print(f"\n  ⏱️  CV時間: {cv_time:.2f}秒 ({cv_time/60:.1f}分)")
-
-# targetはもう不要
-del target
-gc.collect()
-
-# テストデータで予測
-print("\n" + "=" * 80)
-print("[STEP 6/7] 🔮 テストデータで予測")
-print("=" * 80)
-pred_start = time.time()
-
-predictions = predict_with_models(models, test_features, cat_features, apply_expm1=True)
-
-pred_time = time.time() - pred_start
-print(f"  ✓ 予測完了")
-print(f"  ⏱️  予測時間: {pred_time:.2f}秒")
-
-# test_featuresはもう不要
-del test_features
-gc.collect()
-
-# Submission作成
-print("\n" + "=" * 80)
-print("[STEP 7/7] 📝 Submission作成")
-print("=" * 80)
-submission_start = time.time()
-
-submission = sample_sub.copy()
-submission["money_room"] = predictions.astype(int)
-
-# predictionsは不要
-del predictions, sample_sub
-gc.collect()
-
-# 保存
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-output_path = OUTPUT_DIR / f"submission_{timestamp}.csv"
-submission.to_csv(output_path, index=False, header=False)
-
-print(f"  ✓ Submission saved: {output_path}")
-
-# 特徴量重要度の保存
-feature_importance = pd.DataFrame(
-    {"feature": train_features.columns, "importance": models[0].feature_importances_}
-).sort_values("importance", ascending=False)
-
-importance_path = OUTPUT_DIR / f"feature_importance_{timestamp}.csv"
-feature_importance.to_csv(importance_path, index=False)
-print(f"  ✓ Feature importance saved: {importance_path}")
-
-submission_time = time.time() - submission_start
-print(f"  ⏱️  Submission作成時間: {submission_time:.2f}秒")
-
-# 結果サマリー
-print("\n" + "=" * 80)
-print("🎉 完了!")
-print("=" * 80)
-print(f"📊 CV結果:")
-print(f"  - MAPE: {np.mean(cv_scores):.4f}% (± {np.std(cv_scores):.4f}%)")
-print(f"  - Fold scores: {[f'{s:.4f}%' for s in cv_scores]}")
-print(f"\n📈 予測値の統計:")
-stats = submission["money_room"].describe()
-print(f"  - Count: {int(stats['count']):,}")
-print(f"  - Mean:  ¥{int(stats['mean']):,}")
-print(f"  - Std:   ¥{int(stats['std']):,}")
-print(f"  - Min:   ¥{int(stats['min']):,}")
-print(f"  - Max:   ¥{int(stats['max']):,}")
-print(f"\n📂 出力ファイル:")
-print(f"  - Submission: {output_path.name}")
-print(f"  - Feature importance: {importance_path.name}")
-print(
-    f"\n⏱️  総実行時間: {time.time() - overall_start_time:.2f}秒 ({(time.time() - overall_start_time)/60:.1f}分)"
-)
-print("\nTop 30 重要な特徴量:")
-print(feature_importance.head(30).to_string(index=False))
-print("\n" + "=" * 80)
-print("✅ Ready to submit! 🚀")
-print("=" * 80)
-
-# 最終的なクリーンアップ
-del train_features, models, feature_importance, submission
-gc.collect()
+if __name__ == "__main__":
+    main()
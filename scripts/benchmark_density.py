@@ -0,0 +1,113 @@
+"""
+半径内の物件数（密度）の計算のベンチマーク
+
+物件の密度（1km²あたりの件数）を一定にして点数を増やし、
+src.features.density.count_neighbors（格子への振り分け）の処理時間が
+点数に比例することを確認する。参考としてKD-tree（src.features.distance.count_within、
+カテゴリ別の件数なし）、少ない点数では全組の距離を計算する方法（O(n²)）とも比較する。
+
+使い方:
+    uv run python scripts/benchmark_density.py [--sizes 100000 200000 ...] \\
+        [--density 1000] [--naive-max 20000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import numpy as np  # noqa: E402
+
+from src.features.density import KM_PER_DEGREE, count_neighbors  # noqa: E402
+from src.features.distance import (build_spherical_tree,  # noqa: E402
+                                   count_within, haversine_distance)
+
+RADII_KM = [0.25, 0.5, 1.0]
+N_CATEGORIES = 3
+CENTER_LAT = 35.68
+
+
+def sample_points(n: int, density: float, rng: np.random.Generator):
+    """1km²あたりdensity件の密度で、東京駅を中心とする正方形内に点を配置"""
+    side_km = np.sqrt(n / density)
+    half_lat = side_km / KM_PER_DEGREE / 2
+    half_lon = half_lat / np.cos(np.radians(CENTER_LAT))
+    lat = rng.uniform(CENTER_LAT - half_lat, CENTER_LAT + half_lat, n)
+    lon = rng.uniform(139.77 - half_lon, 139.77 + half_lon, n)
+    return lat, lon, rng.integers(0, N_CATEGORIES, n)
+
+
+def naive_counts(lat: np.ndarray, lon: np.ndarray, chunk_size: int = 1000) -> np.ndarray:
+    """全組の大円距離から半径内の点数を計算（O(n²)）"""
+    counts = np.zeros((len(lat), len(RADII_KM)), dtype=np.int64)
+    for start in range(0, len(lat), chunk_size):
+        rows = slice(start, start + chunk_size)
+        distances = haversine_distance(
+            lat[rows, None], lon[rows, None], lat[None, :], lon[None, :]
+        )
+        for j, radius in enumerate(RADII_KM):
+            # 自身（距離0）を除く
+            counts[rows, j] = (distances <= radius).sum(axis=1) - 1
+    return counts
+
+
+def kdtree_counts(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """KD-treeで半径内の点数を計算（自身を除く）"""
+    tree = build_spherical_tree(lat, lon)
+    return np.column_stack([count_within(tree, lat, lon, r) - 1 for r in RADII_KM])
+
+
+def measure(func):
+    """関数の実行時間（秒）と戻り値"""
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--sizes",
+    type=int,
+    nargs="+",
+    default=[5_000, 20_000, 50_000, 100_000, 200_000, 400_000],
+    help="点数",
+)
+parser.add_argument("--density", type=float, default=1000.0, help="1km²あたりの件数")
+parser.add_argument("--naive-max", type=int, default=20_000, help="全組を計算する最大点数")
+parser.add_argument("--seed", type=int, default=42, help="乱数シード")
+args = parser.parse_args()
+
+rng = np.random.default_rng(args.seed)
+
+print("=" * 80)
+print(f"密度の計算ベンチマーク（半径 {RADII_KM} km、{args.density:g}件/km²）")
+print("=" * 80)
+print(
+    f"{'点数':>10}{'格子':>10}{'1点あたり':>12}{'KD-tree':>10}{'全組':>10}"
+    f"{'1km内の平均':>14}"
+)
+
+for n in args.sizes:
+    lat, lon, categories = sample_points(n, args.density, rng)
+    grid_time, (counts, _) = measure(
+        lambda: count_neighbors(
+            lat, lon, RADII_KM, categories=categories, n_categories=N_CATEGORIES
+        )
+    )
+    kdtree_time, kdtree = measure(lambda: kdtree_counts(lat, lon))
+    if not (counts == kdtree).all():
+        raise RuntimeError(f"KD-treeと件数が一致しません（{n}点）")
+    naive = "-"
+    if n <= args.naive_max:
+        naive_time, expected = measure(lambda: naive_counts(lat, lon))
+        if not (counts == expected).all():
+            raise RuntimeError(f"全組の計算と件数が一致しません（{n}点）")
+        naive = f"{naive_time:.2f}s"
+    print(
+        f"{n:>10,}{grid_time:>9.2f}s{grid_time / n * 1e6:>10.2f}µs"
+        f"{kdtree_time:>9.2f}s{naive:>10}{counts[:, -1].mean():>14.1f}"
+    )
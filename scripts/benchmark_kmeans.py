@@ -0,0 +1,78 @@
+"""
+K-meansの学習方法のベンチマーク
+
+train.csvの緯度経度で create_kmeans_clusters の engine="kmeans"（全件・n_init=10）と
+engine="minibatch" の処理時間とinertia（標準化した座標での重心までの二乗距離の和）を比較する。
+
+使い方:
+    uv run python scripts/benchmark_kmeans.py [--nrows N] [--clusters 50 200 1000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import numpy as np  # noqa: E402
+from sklearn.preprocessing import StandardScaler  # noqa: E402
+
+from src.data.load import load_raw_csv  # noqa: E402
+from src.features.geo_features import (KMEANS_ENGINES,  # noqa: E402
+                                       create_kmeans_clusters)
+
+TRAIN_PATH = project_root / "data" / "raw" / "train.csv"
+
+
+def inertia(coords: np.ndarray, labels: np.ndarray) -> float:
+    """各点から所属クラスタの重心までの二乗距離の和"""
+    counts = np.bincount(labels)
+    nonempty = counts > 0
+    total = 0.0
+    for dim in range(coords.shape[1]):
+        sums = np.bincount(labels, weights=coords[:, dim])[nonempty]
+        total += (coords[:, dim] ** 2).sum() - (sums**2 / counts[nonempty]).sum()
+    return total
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--nrows", type=int, default=None, help="使用する行数")
+parser.add_argument(
+    "--clusters", type=int, nargs="+", default=[50, 200, 1000], help="クラスタ数"
+)
+parser.add_argument("--seed", type=int, default=42, help="乱数シード")
+args = parser.parse_args()
+
+train = load_raw_csv(TRAIN_PATH, usecols=["lat", "lon"])
+if args.nrows is not None:
+    train = train.head(args.nrows)
+test = train.iloc[:0]
+
+valid = train[["lat", "lon"]].dropna()
+coords = StandardScaler().fit_transform(valid)
+
+print("=" * 80)
+print(f"K-meansベンチマーク（{len(valid):,}点）")
+print("=" * 80)
+print(f"{'クラスタ数':>10}{'engine':>12}{'時間':>10}{'inertia':>14}{'比率':>8}")
+
+for n_clusters in args.clusters:
+    baseline_inertia = None
+    for engine in KMEANS_ENGINES:
+        start = time.perf_counter()
+        train_clustered, _, _ = create_kmeans_clusters(
+            train, test, n_clusters=n_clusters, random_state=args.seed, engine=engine
+        )
+        elapsed = time.perf_counter() - start
+
+        labels = train_clustered.loc[valid.index, "geo_cluster"].to_numpy()
+        score = inertia(coords, labels)
+        if baseline_inertia is None:
+            baseline_inertia = score
+        print(
+            f"{n_clusters:>10}{engine:>12}{elapsed:>9.2f}s"
+            f"{score:>14.2f}{score / baseline_inertia:>7.3f}x"
+        )
@@ -0,0 +1,157 @@
+"""
+地理空間特徴量のパイプラインのメモリ使用量のベンチマーク
+
+読み込みから特徴量の確定まで（build_geo_pipeline の train_features, test_features）を
+以下の設定ごとに別プロセスで実行し、ピークのRSS（最大常駐メモリ）と処理時間を比較する。
+- load: 読み込みのみ（基準）
+- copy: 各ノードがDataFrameをコピーし、中間成果物をrunの終了まで保持（従来）
+- copy_release: 各ノードがDataFrameをコピーし、使用済みの中間成果物を破棄
+- inplace: 各ノードは新しい列だけを追加し（inplace_features=True）、中間成果物を破棄
+
+キャッシュは使用しない。ピークのRSSは resource.getrusage の ru_maxrss（Linux）。
+
+使い方:
+    uv run python scripts/benchmark_memory.py [--train PATH] [--test PATH] \\
+        [--modes load copy copy_release inplace]
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.features.geo_pipeline import build_geo_pipeline  # noqa: E402
+from src.utils.pipeline import Pipeline  # noqa: E402
+
+DATA_DIR = project_root / "data"
+# make ingest で作成するParquetデータセット（存在する場合はCSVの代わりに使用）
+TRAIN_DATASET = DATA_DIR / "interim" / "train_parquet"
+TEST_DATASET = DATA_DIR / "interim" / "test_parquet"
+TRAIN_PATH = DATA_DIR / "raw" / "train.csv"
+TEST_PATH = DATA_DIR / "raw" / "test.csv"
+
+PREPROCESS_PARAMS = {
+    "target_col": "money_room",
+    "apply_log": True,
+    "sparse_tags": True,
+}
+
+# baseline_with_geo_features.py の特徴量（foldごとのエンコーダを除く）
+GEO_PARAMS = {
+    "n_clusters": 50,
+    "random_state": 42,
+    "kmeans_engine": "kmeans",
+    "geohash_precisions": [],
+    "mesh_levels": [],
+    "cluster_cols": ["geo_cluster"],
+    "agg_cols": ["house_area", "year_built", "walk_distance1", "money_kyoueki"],
+    "target_encoding_cols": ["city", "prefecture", "eki_name1"],
+    "smoothing": 10.0,
+    "reference_sets": ["prefecture_capitals", "major_stations"],
+    "reference_k": 2,
+    "density_radii_km": [0.25, 0.5, 1.0],
+    "density_category_cols": ["building_type"],
+    "oof_target_stats": True,
+}
+
+# 設定名 -> (inplace_features, release_intermediates)
+MODES = {
+    "load": None,
+    "copy": (False, False),
+    "copy_release": (False, True),
+    "inplace": (True, True),
+}
+
+
+def peak_rss_mb() -> float:
+    """このプロセスのピークのRSS（MB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode: str, train_path: Path, test_path: Path) -> dict:
+    """1つの設定でパイプラインを実行し、ピークのRSSと処理時間を返す"""
+    targets = ["train_raw", "test_raw"]
+    inplace, release = False, True
+    if MODES[mode] is not None:
+        targets = ["train_features", "test_features"]
+        inplace, release = MODES[mode]
+
+    pipeline = Pipeline(
+        build_geo_pipeline(
+            train_path,
+            test_path,
+            PREPROCESS_PARAMS,
+            {**GEO_PARAMS, "inplace_features": inplace},
+        ),
+        release_intermediates=release,
+    )
+    start = time.perf_counter()
+    results = pipeline.run(targets)
+    elapsed = time.perf_counter() - start
+
+    frame = results[targets[0]]
+    return {
+        "mode": mode,
+        "peak_rss_mb": peak_rss_mb(),
+        "seconds": elapsed,
+        "columns": frame.shape[1],
+        "train_mb": frame.memory_usage(index=True).sum() / 1024**2,
+    }
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--train", type=Path, default=None, help="学習データ")
+parser.add_argument("--test", type=Path, default=None, help="テストデータ")
+parser.add_argument(
+    "--modes", nargs="+", choices=list(MODES), default=list(MODES), help="設定"
+)
+# 子プロセスで1つの設定を実行する（内部用）
+parser.add_argument(
+    "--child", choices=list(MODES), default=None, help=argparse.SUPPRESS
+)
+args = parser.parse_args()
+
+use_dataset = TRAIN_DATASET.exists() and TEST_DATASET.exists()
+train_path = args.train or (TRAIN_DATASET if use_dataset else TRAIN_PATH)
+test_path = args.test or (TEST_DATASET if use_dataset else TEST_PATH)
+
+if args.child is not None:
+    # 結果は最後の行にJSONで出力する（パイプラインのログと区別する）
+    print(json.dumps(run_mode(args.child, train_path, test_path)))
+    sys.exit(0)
+
+print("=" * 80)
+print("地理空間特徴量のパイプラインのメモリ使用量")
+print(f"train: {train_path}")
+print(f"test: {test_path}")
+print("=" * 80)
+print(f"{'設定':<14}{'ピークRSS':>12}{'時間':>10}{'列数':>8}{'train':>12}")
+
+for mode in args.modes:
+    completed = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--child",
+            mode,
+            "--train",
+            str(train_path),
+            "--test",
+            str(test_path),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    print(
+        f"{mode:<14}{result['peak_rss_mb']:>10,.0f}MB{result['seconds']:>9.1f}s"
+        f"{result['columns']:>8}{result['train_mb']:>10,.0f}MB"
+    )
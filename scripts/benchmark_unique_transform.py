@@ -0,0 +1,108 @@
+"""
+ユニーク値単位の変換のベンチマーク
+
+train.csvの実際のカーディナリティで、行ごとのapplyと
+src.utils.unique.map_unique を使った変換の処理時間を比較する。
+
+使い方:
+    uv run python scripts/benchmark_unique_transform.py [--nrows N]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import pandas as pd  # noqa: E402
+
+from src.data.preprocess import (expand_slash_features,  # noqa: E402
+                                 parse_addresses)
+from src.utils.unique import map_unique  # noqa: E402
+
+TRAIN_PATH = project_root / "data" / "raw" / "train.csv"
+
+STRING_COLS = ["full_address", "eki_name1", "rosen_name1"]
+SLASH_COLS = ["building_tag_id", "unit_tag_id", "statuses"]
+
+
+def split_city_per_row(x):
+    """従来の行ごとの市区町村抽出"""
+    for suffix in ["市", "区", "町", "村"]:
+        if suffix in str(x):
+            return x.split(suffix)[0] + suffix
+    return str(x)[:10]
+
+
+def expand_slash_per_row(df, col):
+    """従来の行ごとのone-hot展開"""
+    unique_values = set()
+    for val in df[col].dropna():
+        if isinstance(val, str) and "/" in val:
+            unique_values.update(val.split("/"))
+    return pd.DataFrame(
+        {
+            f"{col}_{value}": df[col].apply(
+                lambda x: 1 if isinstance(x, str) and value in x.split("/") else 0
+            )
+            for value in sorted(unique_values)
+        },
+        index=df.index,
+    )
+
+
+def measure(func):
+    """関数の実行時間（秒）を計測"""
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--nrows", type=int, default=None, help="読み込む行数")
+args = parser.parse_args()
+
+train = pd.read_csv(TRAIN_PATH, usecols=STRING_COLS + SLASH_COLS, nrows=args.nrows)
+
+print("=" * 80)
+print(f"ユニーク値単位の変換ベンチマーク（{len(train):,}行）")
+print("=" * 80)
+print(f"{'処理':<40}{'ユニーク数':>10}{'行ごと':>10}{'ユニーク':>10}{'高速化':>8}")
+
+results = [
+    (
+        "full_address -> city",
+        train["full_address"],
+        lambda: train["full_address"].apply(split_city_per_row),
+        lambda: parse_addresses(train["full_address"]),
+    ),
+]
+for col in STRING_COLS:
+    results.append(
+        (
+            f"{col} -> str",
+            train[col],
+            lambda col=col: train[col].fillna("missing").astype(str),
+            lambda col=col: map_unique(train[col], str, fill_value="missing"),
+        )
+    )
+for col in SLASH_COLS:
+    results.append(
+        (
+            f"{col} -> one-hot",
+            train[col],
+            lambda col=col: expand_slash_per_row(train, col),
+            lambda col=col: expand_slash_features(train[[col]], [col]),
+        )
+    )
+
+for name, series, per_row, per_unique in results:
+    per_row_time = measure(per_row)
+    per_unique_time = measure(per_unique)
+    print(
+        f"{name:<40}{series.nunique():>10,}{per_row_time:>9.2f}s"
+        f"{per_unique_time:>9.2f}s{per_row_time / per_unique_time:>7.1f}x"
+    )
@@ -0,0 +1,33 @@
+"""
+特徴量キャッシュの統計
+
+data/processed/cache のステージごとのヒット・ミス数とサイズを表示する。
+
+使い方:
+    uv run python scripts/cache_stats.py
+"""
+
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils.cache import FeatureCache  # noqa: E402
+
+CACHE_DIR = project_root / "data" / "processed" / "cache"
+
+stats = FeatureCache(CACHE_DIR).stats()
+
+print("=" * 60)
+print(f"特徴量キャッシュ: {CACHE_DIR}")
+print("=" * 60)
+if stats.empty:
+    print("キャッシュはまだありません")
+else:
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] / lookups.where(lookups > 0)).fillna(0)
+    print(stats.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    print("-" * 60)
+    print(f"合計サイズ: {stats['size_mb'].sum():.1f}MB")
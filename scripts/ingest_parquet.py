@@ -0,0 +1,29 @@
+"""
+生データのParquet変換（初回のみ実行）
+
+data/raw/train.csv, test.csv を target_ym でパーティション分割した
+Parquetデータセットに変換し、data/interim/ に保存する。
+以降は src.data.load.load_parquet_dataset で必要な列・期間だけを読み込める。
+
+使い方:
+    uv run python scripts/ingest_parquet.py
+"""
+
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.load import convert_csv_to_parquet  # noqa: E402
+
+DATA_DIR = project_root / "data"
+TRAIN_PATH = DATA_DIR / "raw" / "train.csv"
+TEST_PATH = DATA_DIR / "raw" / "test.csv"
+TRAIN_DATASET = DATA_DIR / "interim" / "train_parquet"
+TEST_DATASET = DATA_DIR / "interim" / "test_parquet"
+
+for csv_path, dataset_dir in [(TRAIN_PATH, TRAIN_DATASET), (TEST_PATH, TEST_DATASET)]:
+    convert_csv_to_parquet(csv_path, dataset_dir)
+    print(f"✓ {csv_path.name} -> {dataset_dir.relative_to(project_root)}")
@@ -0,0 +1,65 @@
+"""
+Target Encodingの十分統計量の月次更新
+
+data/interim/train_parquet のうち未取り込みの月（target_ym）だけを読み込み、
+data/processed/target_stats.parquet の統計量に加算する。
+過去の月は再集計しないため、新しい月のデータを追加するたびに実行すればよい。
+
+使い方:
+    uv run python scripts/update_target_stats.py [--target-yms 202301 202302]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from src.data.load import PARTITION_COLUMN, load_parquet_dataset  # noqa: E402
+from src.data.preprocess import parse_addresses  # noqa: E402
+from src.features.target_stats import TargetStatsStore  # noqa: E402
+
+DATA_DIR = project_root / "data"
+TRAIN_DATASET = DATA_DIR / "interim" / "train_parquet"
+STORE_PATH = DATA_DIR / "processed" / "target_stats.parquet"
+
+TARGET_COL = "money_room"
+KEY_COLS = ["prefecture", "city", "eki_name1"]
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--target-yms", type=int, nargs="+", default=None, help="取り込む月（省略時は未取り込みの全月）"
+)
+args = parser.parse_args()
+
+store = TargetStatsStore.load(STORE_PATH) if STORE_PATH.exists() else TargetStatsStore()
+
+target_yms = args.target_yms
+if target_yms is None:
+    months = load_parquet_dataset(TRAIN_DATASET, columns=[PARTITION_COLUMN])
+    target_yms = sorted(months[PARTITION_COLUMN].unique().tolist())
+target_yms = [ym for ym in target_yms if str(ym) not in store.batches]
+
+if not target_yms:
+    print("✓ 取り込む月はありません")
+    sys.exit(0)
+
+for ym in target_yms:
+    df = load_parquet_dataset(
+        TRAIN_DATASET,
+        columns=["full_address", "eki_name1", TARGET_COL],
+        target_yms=[ym],
+    )
+    df = pd.concat([df, parse_addresses(df["full_address"])], axis=1)
+    # 学習時と同じく対数変換した目的変数の統計量を保持する
+    target = np.log1p(df[TARGET_COL].clip(lower=0))
+    store.update(df, target, KEY_COLS, batch_id=str(ym))
+    print(f"✓ {ym}: {len(df):,}行")
+
+store.save(STORE_PATH)
+print(f"✓ 保存: {STORE_PATH.relative_to(project_root)}（{len(store.batches)}か月分）")
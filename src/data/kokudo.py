@@ -0,0 +1,259 @@
+"""
+国土数値情報（GeoJSON・シェープファイル）の読み込み
+
+レイヤーを座標のNumPy配列と属性のDataFrameに変換する。点のレイヤーは
+最近傍検索用のKD-tree、ポリゴンのレイヤーは内外判定用の格子インデックスも作成し、
+Layerごとpickleできるため、パイプラインのキャッシュにそのまま保存できる。
+
+- 点（Point, MultiPoint）: 地物ごとに1点（MultiPointは構成点の平均）
+- 線（LineString, MultiLineString）: 頂点の平均を代表点とする点（駅のN02など）
+- ポリゴン（Polygon, MultiPolygon）: 全リングの頂点を連結した配列とオフセット
+
+座標は国土数値情報の緯度経度（JGD2011）をそのまま使う。
+シェープファイルの読み込みには pyshp が必要（uv sync --extra gis）。
+"""
+
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from src.features.distance import build_spherical_tree
+from src.features.polygon_index import PolygonIndex
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+POINT = "point"
+POLYGON = "polygon"
+
+# GeoJSONのジオメトリの種類 -> レイヤーの種類
+GEOMETRY_KINDS = {
+    "Point": POINT,
+    "MultiPoint": POINT,
+    "LineString": POINT,
+    "MultiLineString": POINT,
+    "Polygon": POLYGON,
+    "MultiPolygon": POLYGON,
+}
+
+# (ジオメトリの種類, 座標, 属性)
+Feature = Tuple[str, Any, Dict[str, Any]]
+
+
+@dataclass
+class Layer:
+    """
+    国土数値情報のレイヤー
+
+    coordsは (lon, lat) の順（GeoJSONと同じ）。ポリゴンの場合、
+    coords[ring_offsets[i]:ring_offsets[i + 1]] がi番目のリング、
+    ring_offsets[part_offsets[j]:part_offsets[j + 1] + 1] がj番目の地物のリング。
+    """
+
+    kind: str
+    coords: np.ndarray
+    attributes: pd.DataFrame
+    ring_offsets: Optional[np.ndarray] = None
+    part_offsets: Optional[np.ndarray] = None
+    tree: Optional[cKDTree] = field(default=None, repr=False)
+    index: Optional[PolygonIndex] = field(default=None, repr=False)
+
+    @property
+    def n_features(self) -> int:
+        """地物数"""
+        return len(self.attributes)
+
+    @property
+    def lat(self) -> np.ndarray:
+        """緯度（点のレイヤー）"""
+        return self.coords[:, 1]
+
+    @property
+    def lon(self) -> np.ndarray:
+        """経度（点のレイヤー）"""
+        return self.coords[:, 0]
+
+
+def _read_geojson(path: Path) -> Iterable[Feature]:
+    """GeoJSONの地物を読み込み"""
+    with open(path, encoding="utf-8") as f:
+        collection = json.load(f)
+    for feature in collection["features"]:
+        geometry = feature.get("geometry")
+        if geometry is None:
+            continue
+        properties = feature.get("properties") or {}
+        yield geometry["type"], geometry["coordinates"], properties
+
+
+def _read_shapefile(path: Path, encoding: str) -> Iterable[Feature]:
+    """シェープファイルの地物をGeoJSONと同じ形式で読み込み"""
+    try:
+        import shapefile
+    except ImportError as e:
+        raise ImportError("シェープファイルの読み込みには pyshp が必要です（uv sync --extra gis）") from e
+
+    with shapefile.Reader(str(path), encoding=encoding) as reader:
+        for shape_record in reader.iterShapeRecords():
+            geometry = shape_record.shape.__geo_interface__
+            if geometry is None or geometry.get("type") is None:
+                continue
+            properties = shape_record.record.as_dict()
+            yield geometry["type"], geometry["coordinates"], properties
+
+
+def _representative_point(geometry_type: str, coordinates: Any) -> List[float]:
+    """点・線のジオメトリの代表点（構成点の平均）"""
+    if geometry_type == "Point":
+        return coordinates[:2]
+    if geometry_type == "MultiLineString":
+        coordinates = [point for line in coordinates for point in line]
+    return np.asarray(coordinates, dtype=np.float64)[:, :2].mean(axis=0).tolist()
+
+
+def _polygon_rings(geometry_type: str, coordinates: Any) -> List[Any]:
+    """ポリゴンのジオメトリの全リング（外周と穴）"""
+    if geometry_type == "Polygon":
+        return coordinates
+    return [ring for polygon in coordinates for ring in polygon]
+
+
+def build_layer(
+    features: Iterable[Feature],
+    columns: Optional[List[str]] = None,
+    cell_size: float = 0.01,
+    build_index: bool = True,
+) -> Layer:
+    """
+    地物のリストからLayerを作成
+
+    Args:
+        features: (ジオメトリの種類, 座標, 属性) のリスト
+        columns: 残す属性（Noneの場合は全属性）
+        cell_size: ポリゴンの格子インデックスのセルの大きさ（度）
+        build_index: ポリゴンの格子インデックスを作成するか（保存済みの
+            インデックスを使う場合はFalse）
+
+    Returns:
+        Layer（点のレイヤーはKD-tree、ポリゴンのレイヤーは格子インデックスを含む）
+    """
+    kind = None
+    points = []
+    ring_coords = []
+    ring_lengths = []
+    rings_per_feature = []
+    records = []
+
+    for geometry_type, coordinates, properties in features:
+        if geometry_type not in GEOMETRY_KINDS:
+            raise ValueError(f"未対応のジオメトリです: {geometry_type}")
+        if kind is None:
+            kind = GEOMETRY_KINDS[geometry_type]
+        elif kind != GEOMETRY_KINDS[geometry_type]:
+            raise ValueError("点・線とポリゴンが混在したレイヤーは読み込めません")
+
+        if kind == POINT:
+            points.append(_representative_point(geometry_type, coordinates))
+        else:
+            rings = _polygon_rings(geometry_type, coordinates)
+            for ring in rings:
+                ring_coords.append(np.asarray(ring, dtype=np.float64)[:, :2])
+                ring_lengths.append(len(ring))
+            rings_per_feature.append(len(rings))
+        records.append(
+            properties if columns is None else {c: properties.get(c) for c in columns}
+        )
+
+    if kind is None:
+        raise ValueError("地物がありません")
+
+    attributes = pd.DataFrame.from_records(records, columns=columns)
+    if kind == POLYGON:
+        coords = np.concatenate(ring_coords)
+        ring_offsets = np.concatenate([[0], np.cumsum(ring_lengths)])
+        part_offsets = np.concatenate([[0], np.cumsum(rings_per_feature)])
+        return Layer(
+            POLYGON,
+            coords,
+            attributes,
+            ring_offsets=ring_offsets,
+            part_offsets=part_offsets,
+            index=(
+                PolygonIndex.build(coords, ring_offsets, part_offsets, cell_size)
+                if build_index
+                else None
+            ),
+        )
+
+    coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return Layer(
+        POINT, coords, attributes, tree=build_spherical_tree(coords[:, 1], coords[:, 0])
+    )
+
+
+def load_layer(
+    path: Union[str, Path],
+    columns: Optional[List[str]] = None,
+    encoding: str = "cp932",
+    cell_size: float = 0.01,
+    build_index: bool = True,
+) -> Layer:
+    """
+    国土数値情報のレイヤーを読み込み
+
+    Args:
+        path: GeoJSON（.geojson, .json）またはシェープファイル（.shp）のパス
+        columns: 残す属性（Noneの場合は全属性）
+        encoding: シェープファイルの属性の文字コード
+        cell_size: ポリゴンの格子インデックスのセルの大きさ（度）
+        build_index: ポリゴンの格子インデックスを作成するか
+
+    Returns:
+        Layer
+    """
+    path = Path(path)
+    start = time.perf_counter()
+
+    suffix = path.suffix.lower()
+    if suffix in (".geojson", ".json"):
+        features = _read_geojson(path)
+    elif suffix == ".shp":
+        features = _read_shapefile(path, encoding)
+    else:
+        raise ValueError(f"未対応の形式です: {path}")
+
+    layer = build_layer(features, columns, cell_size=cell_size, build_index=build_index)
+    logger.info(
+        f"{path.name}: {layer.kind}, {layer.n_features}件, "
+        f"読み込み {time.perf_counter() - start:.2f}秒"
+    )
+    return layer
+
+
+def load_layers(specs: Dict[str, Dict[str, Any]]) -> Dict[str, Layer]:
+    """
+    複数のレイヤーを読み込み
+
+    Args:
+        specs: レイヤー名 -> {"path": パス, "attributes": 属性, "encoding": 文字コード,
+            "cell_size": 格子の大きさ}（spatial_join_featuresと同じ設定。
+            attributesの属性のみ残す）
+
+    Returns:
+        レイヤー名 -> Layer
+    """
+    return {
+        name: load_layer(
+            spec["path"],
+            columns=list(spec.get("attributes", [])),
+            encoding=spec.get("encoding", "cp932"),
+            cell_size=spec.get("cell_size", 0.01),
+        )
+        for name, spec in specs.items()
+    }
@@ -0,0 +1,245 @@
+"""
+データ読み込みモジュール
+"""
+
+import shutil
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data.preprocess import DATE_COLUMNS, SLASH_COLUMNS, TEXT_COLUMNS_TO_DROP
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 前処理で削除されるため読み込まない列
+SKIP_COLUMNS = TEXT_COLUMNS_TO_DROP
+
+# category型で読み込む文字列の列
+CATEGORY_COLUMNS = [
+    "full_address",
+    "addr2_name",
+    "addr3_name",
+    "rosen_name1",
+    "eki_name1",
+    "bus_stop1",
+    "rosen_name2",
+    "eki_name2",
+    "bus_stop2",
+    "traffic_other",
+    "traffic_car",
+    "school_ele_name",
+    "school_jun_name",
+    "est_other_name",
+    *SLASH_COLUMNS,
+]
+
+# Parquetデータセットのパーティション列
+PARTITION_COLUMN = "target_ym"
+# パーティション分割で失われるCSVの行順を保持する列
+ROW_ORDER_COLUMN = "_row_order"
+
+
+def _memory_mb(df: pd.DataFrame) -> float:
+    """DataFrameのメモリ使用量（MB）"""
+    return df.memory_usage(deep=True).sum() / 1024**2
+
+
+def downcast_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    数値列を値を変えずに小さい型に変換
+
+    整数はint32に収まる場合のみint32にする（前処理のカテゴリ判定がint64/int32を対象とするため）。
+    浮動小数点はfloat32で値が変わらない場合のみfloat32にする。
+
+    Args:
+        df: DataFrame
+
+    Returns:
+        変換後のDataFrame（同じオブジェクトを更新）
+    """
+    int32_info = np.iinfo(np.int32)
+
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == np.int64:
+            if len(values) == 0 or (
+                values.min() >= int32_info.min and values.max() <= int32_info.max
+            ):
+                df[col] = values.astype(np.int32)
+        elif values.dtype == np.float64:
+            downcasted = values.astype(np.float32)
+            if np.array_equal(
+                downcasted.to_numpy(dtype=np.float64),
+                values.to_numpy(),
+                equal_nan=True,
+            ):
+                df[col] = downcasted
+
+    return df
+
+
+def load_raw_csv(
+    path: Union[str, Path],
+    usecols: Optional[List[str]] = None,
+    skip_columns: Optional[List[str]] = None,
+    downcast: bool = True,
+) -> pd.DataFrame:
+    """
+    train.csv / test.csv を宣言したスキーマで読み込み
+
+    前処理で削除される列は読み込まず、文字列の列はcategory型で読み込む。
+    pyarrowエンジンで読み込み、列の型推論に失敗した場合はCエンジンで読み直す。
+
+    Args:
+        path: CSVのパス
+        usecols: 読み込む列（Noneの場合はskip_columns以外の全列）
+        skip_columns: 読み込まない列（Noneの場合はSKIP_COLUMNS）
+        downcast: 数値列を小さい型に変換するか
+
+    Returns:
+        DataFrame
+    """
+    path = Path(path)
+    if skip_columns is None:
+        skip_columns = SKIP_COLUMNS
+
+    header = pd.read_csv(path, nrows=0).columns
+    if usecols is None:
+        skip = set(skip_columns)
+        usecols = [col for col in header if col not in skip]
+    dtype = {col: "category" for col in CATEGORY_COLUMNS if col in usecols}
+
+    start = time.perf_counter()
+    try:
+        df = pd.read_csv(path, usecols=usecols, dtype=dtype, engine="pyarrow")
+    except pa.ArrowInvalid as e:
+        logger.warning(f"{path.name}: pyarrowでの読み込みに失敗したためCエンジンで再試行 ({e})")
+        df = pd.read_csv(path, usecols=usecols, dtype=dtype, low_memory=False)
+    load_time = time.perf_counter() - start
+
+    memory_before = _memory_mb(df)
+    if downcast:
+        df = downcast_numeric(df)
+    memory_after = _memory_mb(df)
+
+    logger.info(
+        f"{path.name}: shape={df.shape}, 読み込み {load_time:.2f}秒, "
+        f"メモリ {memory_before:.1f}MB -> {memory_after:.1f}MB "
+        f"（スキップした列: {len(header) - len(usecols)}）"
+    )
+
+    return df
+
+
+def convert_csv_to_parquet(
+    csv_path: Union[str, Path],
+    dataset_dir: Union[str, Path],
+    partition_col: str = PARTITION_COLUMN,
+) -> None:
+    """
+    生のCSVをパーティション分割したParquetデータセットに変換
+
+    全列を保存し、文字列の列（日付列を除く）は辞書エンコードする。
+    読み込み時にCSVの行順を復元するため、行番号の列を追加する。
+    スキーマは全行から1回だけ求め、全パーティションで共通にする（ある月で全て欠損の
+    列がnull型になり、読み込み時に型が合わなくなるのを防ぐ）。
+    パーティション列が欠損している行がある場合はValueErrorを送出する。
+
+    Args:
+        csv_path: CSVのパス
+        dataset_dir: 出力先ディレクトリ（既存の場合は置き換え）
+        partition_col: パーティション列
+    """
+    dataset_dir = Path(dataset_dir)
+    start = time.perf_counter()
+
+    df = load_raw_csv(csv_path, skip_columns=[])
+    for col in df.columns:
+        if df[col].dtype == "object" and col not in DATE_COLUMNS:
+            df[col] = df[col].astype("category")
+    df[ROW_ORDER_COLUMN] = np.arange(len(df), dtype=np.int64)
+
+    # groupbyは欠損のキーの行を除外するため、書き出す前に確認する
+    n_missing = int(df[partition_col].isna().sum())
+    if n_missing:
+        raise ValueError(
+            f"{Path(csv_path).name}: {partition_col}が欠損している行があります（{n_missing}行）"
+        )
+    schema = pa.Schema.from_pandas(df.drop(columns=partition_col), preserve_index=False)
+
+    # パーティションごとにファイルを書き出す（hive形式: target_ym=201901/）
+    if dataset_dir.exists():
+        shutil.rmtree(dataset_dir)
+    for value, part in df.groupby(partition_col, sort=True):
+        part_dir = dataset_dir / f"{partition_col}={value}"
+        part_dir.mkdir(parents=True)
+        table = pa.Table.from_pandas(
+            part.drop(columns=partition_col), schema=schema, preserve_index=False
+        )
+        pq.write_table(table, part_dir / "part-0.parquet")
+
+    logger.info(
+        f"{Path(csv_path).name} -> {dataset_dir}: {len(df)}行, "
+        f"{df[partition_col].nunique()}パーティション, "
+        f"{time.perf_counter() - start:.2f}秒"
+    )
+
+
+def load_parquet_dataset(
+    dataset_dir: Union[str, Path],
+    columns: Optional[List[str]] = None,
+    target_yms: Optional[List[int]] = None,
+    skip_columns: Optional[List[str]] = None,
+    partition_col: str = PARTITION_COLUMN,
+) -> pd.DataFrame:
+    """
+    Parquetデータセットから必要な列・期間だけを読み込み
+
+    期間はパーティションの絞り込み、列は列単位の読み込みで処理されるため、
+    不要な月や列のファイルは読まれない。行はCSVの順序に戻して返す。
+
+    Args:
+        dataset_dir: convert_csv_to_parquetの出力先
+        columns: 読み込む列（Noneの場合はskip_columns以外の全列）
+        target_yms: 読み込む期間（Noneの場合は全期間）
+        skip_columns: columns=Noneのときに読み込まない列（Noneの場合はSKIP_COLUMNS）
+        partition_col: パーティション列
+
+    Returns:
+        DataFrame
+    """
+    dataset_dir = Path(dataset_dir)
+    if skip_columns is None:
+        skip_columns = SKIP_COLUMNS
+
+    if columns is None:
+        schema_names = pq.ParquetDataset(dataset_dir).schema.names
+        skip = {*skip_columns, ROW_ORDER_COLUMN}
+        columns = [col for col in schema_names if col not in skip]
+    read_columns = [*columns, ROW_ORDER_COLUMN]
+
+    filters = None
+    if target_yms is not None:
+        filters = [(partition_col, "in", list(target_yms))]
+
+    start = time.perf_counter()
+    df = pd.read_parquet(dataset_dir, columns=read_columns, filters=filters)
+
+    # CSVの行順に戻す
+    df = df.sort_values(ROW_ORDER_COLUMN, kind="stable").reset_index(drop=True)
+    df = df.drop(columns=ROW_ORDER_COLUMN)
+    if partition_col in df.columns:
+        df[partition_col] = df[partition_col].astype(np.int32)
+
+    logger.info(
+        f"{dataset_dir.name}: shape={df.shape}, 読み込み "
+        f"{time.perf_counter() - start:.2f}秒, メモリ {_memory_mb(df):.1f}MB"
+    )
+
+    return df
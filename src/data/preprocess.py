@@ -2,46 +2,335 @@
 データ前処理モジュール
 """
 
-from typing import List, Tuple
+import json
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+from scipy import sparse
+
+from src.utils.unique import broadcast_unique, factorize_column, map_unique
+
+# スラッシュ区切りでone-hot展開する列
+SLASH_COLUMNS = [
+    "building_tag_id",
+    "unit_tag_id",
+    "reform_interior",
+    "reform_exterior",
+    "reform_wet_area",
+    "statuses",
+]
+
+# 前処理で削除するテキスト系の列
+TEXT_COLUMNS_TO_DROP = [
+    "building_name",
+    "building_name_ruby",
+    "homes_building_name",
+    "homes_building_name_ruby",
+    "unit_name",
+    "name_ruby",
+    "empty_contents",
+    "parking_memo",
+    "reform_place_other",
+    "reform_wet_area_other",
+    "reform_interior_other",
+    "reform_exterior_other",
+    "reform_etc",
+    "renovation_etc",
+    "money_sonota_str1",
+    "money_sonota_str2",
+    "money_sonota_str3",
+]
+
+# 年・月を抽出する日付列
+DATE_COLUMNS = [
+    "building_create_date",
+    "building_modify_date",
+    "reform_exterior_date",
+    "reform_common_area_date",
+    "reform_date",
+    "reform_wet_area_date",
+    "reform_interior_date",
+    "renovation_date",
+    "snapshot_create_date",
+    "new_date",
+    "snapshot_modify_date",
+    "timelimit_date",
+    "usable_date",
+]
+
+# 日付列で判定を試みるフォーマット（先頭から順に判定）
+DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d",
+    "%Y%m%d",
+    "%Y%m",
+]
+# フォーマットを採用するのに必要なサンプルの変換成功率
+DATE_FORMAT_MIN_MATCH_RATE = 0.95
+
+# 都道府県名（4文字の県を含むため辞書で照合）
+PREFECTURES = [
+    "北海道",
+    "青森県",
+    "岩手県",
+    "宮城県",
+    "秋田県",
+    "山形県",
+    "福島県",
+    "茨城県",
+    "栃木県",
+    "群馬県",
+    "埼玉県",
+    "千葉県",
+    "東京都",
+    "神奈川県",
+    "新潟県",
+    "富山県",
+    "石川県",
+    "福井県",
+    "山梨県",
+    "長野県",
+    "岐阜県",
+    "静岡県",
+    "愛知県",
+    "三重県",
+    "滋賀県",
+    "京都府",
+    "大阪府",
+    "兵庫県",
+    "奈良県",
+    "和歌山県",
+    "鳥取県",
+    "島根県",
+    "岡山県",
+    "広島県",
+    "山口県",
+    "徳島県",
+    "香川県",
+    "愛媛県",
+    "高知県",
+    "福岡県",
+    "佐賀県",
+    "長崎県",
+    "熊本県",
+    "大分県",
+    "宮崎県",
+    "鹿児島県",
+    "沖縄県",
+]
+
+# 名前に「市」「郡」を含み、単純な規則では分割できない市
+ADDRESS_SPECIAL_CITIES = [
+    "四日市市",
+    "廿日市市",
+    "野々市市",
+    "大和郡山市",
+    "蒲郡市",
+    "小郡市",
+]
+
+
+def concat_keep_categories(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    category型を保ったまま縦方向に結合
+
+    カテゴリが異なるcategory列をそのまま結合するとobject型になるため、
+    共通のcategory列はカテゴリを揃えてから結合する。
+
+    Args:
+        frames: 結合するDataFrameのリスト
+
+    Returns:
+        結合後のDataFrame（indexは振り直す）
+    """
+    cat_cols = [
+        col
+        for col in frames[0].columns
+        if all(
+            col in frame.columns and isinstance(frame[col].dtype, pd.CategoricalDtype)
+            for frame in frames
+        )
+    ]
+    if cat_cols and len(frames) > 1:
+        categories = {
+            col: union_categoricals([frame[col] for frame in frames]).categories
+            for col in cat_cols
+        }
+        frames = [
+            frame.assign(
+                **{
+                    col: frame[col].cat.set_categories(categories[col])
+                    for col in cat_cols
+                }
+            )
+            for frame in frames
+        ]
+    return pd.concat(frames, axis=0, ignore_index=True)
+
+
+def _tokenize_slash_column(series: pd.Series) -> Tuple[np.ndarray, List[List[str]]]:
+    """
+    スラッシュ区切りの列をユニーク値単位で一度だけ分割
+
+    Args:
+        series: 分割する列
+
+    Returns:
+        各行のユニーク値コード（欠損は-1）, ユニーク値ごとのタグリスト
+    """
+    codes, uniques = factorize_column(series)
+    tokens = [val.split("/") if isinstance(val, str) else [] for val in uniques]
+    return codes, tokens
+
+
+def _build_tag_matrix(
+    codes: np.ndarray, tokens: List[List[str]], vocabulary: List[str]
+) -> sparse.csr_matrix:
+    """
+    タグの出現をCSR形式の指示行列（行数 x 語彙数）に変換
+
+    Args:
+        codes: 各行のユニーク値コード（欠損は-1）
+        tokens: ユニーク値ごとのタグリスト
+        vocabulary: 列に対応するタグのリスト
+
+    Returns:
+        uint8のCSR行列
+    """
+    vocab_index = {value: i for i, value in enumerate(vocabulary)}
+
+    # ユニーク値ごとの指示行列
+    indptr = [0]
+    indices: List[int] = []
+    for values in tokens:
+        indices.extend(sorted({vocab_index[v] for v in values if v in vocab_index}))
+        indptr.append(len(indices))
+
+    unique_matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.uint8), indices, indptr),
+        shape=(len(tokens), len(vocabulary)),
+    )
+
+    # コードで行方向に展開（欠損・非文字列は空行）
+    return broadcast_unique(unique_matrix, codes)
+
+
+def _fit_column_vocabulary(tokens: List[List[str]]) -> List[str]:
+    """スラッシュを含む値に現れるタグを語彙とする"""
+    return sorted({v for values in tokens if len(values) > 1 for v in values})
+
+
+def fit_slash_vocabulary(df: pd.DataFrame, columns: List[str]) -> Dict[str, List[str]]:
+    """
+    スラッシュ区切り特徴量のタグ語彙を学習
+
+    Args:
+        df: DataFrame（通常は学習データのみ）
+        columns: 対象の列名のリスト
+
+    Returns:
+        列名 -> タグのリスト
+    """
+    vocabulary = {}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        _, tokens = _tokenize_slash_column(df[col])
+        vocabulary[col] = _fit_column_vocabulary(tokens)
+    return vocabulary
+
+
+def save_slash_vocabulary(
+    vocabulary: Dict[str, List[str]], path: Union[str, Path]
+) -> None:
+    """
+    タグ語彙をJSONで保存
 
+    Args:
+        vocabulary: fit_slash_vocabularyの戻り値
+        path: 保存先パス
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False, indent=2)
 
-def expand_slash_features(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+
+def load_slash_vocabulary(path: Union[str, Path]) -> Dict[str, List[str]]:
+    """
+    保存したタグ語彙を読み込み
+
+    Args:
+        path: 保存先パス
+
+    Returns:
+        列名 -> タグのリスト
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def expand_slash_features(
+    df: pd.DataFrame,
+    columns: List[str],
+    sparse_output: bool = False,
+    vocabulary: Optional[Dict[str, List[str]]] = None,
+) -> pd.DataFrame:
     """
     スラッシュ区切りの特徴量をone-hot展開
 
+    各列はユニーク値ごとに一度だけ分割し、CSR指示行列からuint8列を作成する。
+    vocabularyを渡した場合は語彙に含まれるタグのみを展開するため、
+    出力列は入力バッチに依存せず、行ごとの処理量はタグ数のみで決まる。
+
     Args:
         df: DataFrame
         columns: 展開する列名のリスト
+        sparse_output: Trueの場合、展開列をSparse[uint8]で返す
+        vocabulary: fit_slash_vocabularyで学習した語彙（Noneの場合はdfから学習）
 
     Returns:
         展開後のDataFrame
     """
-    # 新しい列を格納する辞書
-    new_columns = {}
+    matrices = []
+    new_column_names = []
 
     for col in columns:
         if col not in df.columns:
             continue
+        if vocabulary is not None and col not in vocabulary:
+            continue
 
-        # スラッシュで分割してone-hot化
-        unique_values = set()
-        for val in df[col].dropna():
-            if isinstance(val, str) and "/" in val:
-                unique_values.update(val.split("/"))
-
-        # 各値のone-hot特徴量を作成
-        for value in sorted(unique_values):
-            new_col = f"{col}_{value}"
-            new_columns[new_col] = df[col].apply(
-                lambda x: 1 if isinstance(x, str) and value in x.split("/") else 0
-            )
+        codes, tokens = _tokenize_slash_column(df[col])
+
+        if vocabulary is None:
+            col_vocabulary = _fit_column_vocabulary(tokens)
+        else:
+            col_vocabulary = vocabulary[col]
+        if not col_vocabulary:
+            continue
+
+        matrices.append(_build_tag_matrix(codes, tokens, col_vocabulary))
+        new_column_names.extend(f"{col}_{value}" for value in col_vocabulary)
 
     # 全ての新しい列を一度に結合（断片化を回避）
-    if new_columns:
-        new_df = pd.DataFrame(new_columns, index=df.index)
+    if matrices:
+        tag_matrix = sparse.hstack(matrices, format="csr")
+        if sparse_output:
+            new_df = pd.DataFrame.sparse.from_spmatrix(
+                tag_matrix, index=df.index, columns=new_column_names
+            )
+        else:
+            new_df = pd.DataFrame(
+                tag_matrix.toarray(), index=df.index, columns=new_column_names
+            )
         df_expanded = pd.concat([df, new_df], axis=1)
     else:
         df_expanded = df.copy()
@@ -49,51 +338,169 @@ def expand_slash_features(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
     return df_expanded
 
 
-def process_date_features(df: pd.DataFrame) -> pd.DataFrame:
+def get_sparse_columns(df: pd.DataFrame) -> List[str]:
+    """
+    SparseDtypeの列名を取得
+
+    Args:
+        df: DataFrame
+
+    Returns:
+        Sparse列名のリスト
+    """
+    return [col for col in df.columns if isinstance(df[col].dtype, pd.SparseDtype)]
+
+
+def densify_columns(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """
+    Sparse列を通常の列に戻す（parquet保存用）
+
+    Args:
+        df: DataFrame
+        columns: 変換する列名のリスト
+
+    Returns:
+        変換後のDataFrame
+    """
+    if not columns:
+        return df
+    dense_df = df[columns].sparse.to_dense()
+    return pd.concat([df.drop(columns=columns), dense_df], axis=1)[df.columns]
+
+
+def sparsify_columns(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """
+    0/1の展開列をSparse[uint8]に変換（parquet読み込み後の復元用）
+
+    Args:
+        df: DataFrame
+        columns: 変換する列名のリスト
+
+    Returns:
+        変換後のDataFrame
+    """
+    if not columns:
+        return df
+    sparse_df = pd.DataFrame.sparse.from_spmatrix(
+        sparse.csr_matrix(df[columns].to_numpy(dtype=np.uint8)),
+        index=df.index,
+        columns=columns,
+    )
+    return pd.concat([df.drop(columns=columns), sparse_df], axis=1)[df.columns]
+
+
+def _detect_date_format(series: pd.Series, sample_size: int = 1000) -> Optional[str]:
+    """
+    日付列のフォーマットを先頭のサンプルから一度だけ判定
+
+    Args:
+        series: 日付列
+        sample_size: 判定に使う非欠損値の数
+
+    Returns:
+        strptime形式のフォーマット、数値（yyyymm/yyyymmdd）の場合は"numeric"、
+        読み込み時に日時型になっている場合は"datetime"、判定できない場合はNone
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+
+    sample = series.dropna().head(sample_size)
+    if len(sample) == 0:
+        return None
+
+    if pd.api.types.is_numeric_dtype(sample):
+        values = sample.to_numpy(dtype=float)
+        in_yyyymm = (values >= 100001) & (values <= 999912)
+        in_yyyymmdd = (values >= 10000101) & (values <= 99991231)
+        return "numeric" if (in_yyyymm | in_yyyymmdd).all() else None
+
+    # 最も多く変換できたフォーマットを採用（混在している場合は推論に任せる）
+    sample = sample.astype(str)
+    best_format, best_rate = None, 0.0
+    for fmt in DATE_FORMATS:
+        rate = pd.to_datetime(sample, format=fmt, errors="coerce").notna().mean()
+        if rate > best_rate:
+            best_format, best_rate = fmt, rate
+    return best_format if best_rate >= DATE_FORMAT_MIN_MATCH_RATE else None
+
+
+def _parse_year_month(
+    series: pd.Series, date_format: Optional[str]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    日付列から年・月を抽出（欠損・不正値はNaN）
+
+    Args:
+        series: 日付列
+        date_format: _detect_date_formatの戻り値
+
+    Returns:
+        year, month（float配列）
+    """
+    if date_format == "numeric":
+        # yyyymmdd -> yyyymm に揃えてから四則演算で分割
+        values = series.to_numpy(dtype=float)
+        ym = np.where(values >= 10000101, values // 100, values)
+        year = ym // 100
+        month = ym % 100
+        invalid = (month < 1) | (month > 12)
+        year[invalid] = np.nan
+        month[invalid] = np.nan
+        return year, month
+
+    if date_format == "datetime":
+        date_series = series
+    elif date_format is None:
+        date_series = pd.to_datetime(series, errors="coerce")
+    else:
+        date_series = pd.to_datetime(series, format=date_format, errors="coerce")
+    return (
+        date_series.dt.year.to_numpy(dtype=float, na_value=np.nan),
+        date_series.dt.month.to_numpy(dtype=float, na_value=np.nan),
+    )
+
+
+def process_date_features(
+    df: pd.DataFrame, timings: Optional[Dict[str, Tuple[str, float]]] = None
+) -> pd.DataFrame:
     """
     日付特徴量の処理
 
+    フォーマットは列ごとに一度だけ判定し、明示的なフォーマットで変換する。
+    年・月はInt16、年月はInt32（いずれも欠損可）で出力する。
+
     Args:
         df: DataFrame
+        timings: 渡した場合、列名 -> (判定したフォーマット, 処理秒数) を格納
 
     Returns:
         処理後のDataFrame
     """
-    date_columns = [
-        "building_create_date",
-        "building_modify_date",
-        "reform_exterior_date",
-        "reform_common_area_date",
-        "reform_date",
-        "reform_wet_area_date",
-        "reform_interior_date",
-        "renovation_date",
-        "snapshot_create_date",
-        "new_date",
-        "snapshot_modify_date",
-        "timelimit_date",
-        "usable_date",
-    ]
-
     # 新しい列を格納する辞書
     new_columns = {}
     cols_to_drop = []
 
-    for col in date_columns:
+    for col in DATE_COLUMNS:
         if col not in df.columns:
             continue
 
-        # 日付をdatetimeに変換
-        date_series = pd.to_datetime(df[col], errors="coerce")
+        start = time.perf_counter()
+
+        # フォーマットを判定して年、月を抽出
+        date_format = _detect_date_format(df[col])
+        year, month = _parse_year_month(df[col], date_format)
 
         # 年、月、年月を抽出
-        new_columns[f"{col}_year"] = date_series.dt.year
-        new_columns[f"{col}_month"] = date_series.dt.month
-        new_columns[f"{col}_ym"] = date_series.dt.year * 100 + date_series.dt.month
+        new_columns[f"{col}_year"] = pd.array(year, dtype="Int16")
+        new_columns[f"{col}_month"] = pd.array(month, dtype="Int16")
+        new_columns[f"{col}_ym"] = pd.array(year * 100 + month, dtype="Int32")
 
         # 元の列を削除リストに追加
         cols_to_drop.append(col)
 
+        if timings is not None:
+            timings[col] = (date_format or "inferred", time.perf_counter() - start)
+
     # 全ての新しい列を一度に結合（断片化を回避）
     if new_columns:
         new_df = pd.DataFrame(new_columns, index=df.index)
@@ -106,6 +513,71 @@ def process_date_features(df: pd.DataFrame) -> pd.DataFrame:
     return df_processed
 
 
+def _build_address_pattern() -> re.Pattern:
+    """
+    住所を都道府県・市区町村・区に分割する正規表現を作成
+
+    Returns:
+        コンパイル済みの正規表現
+    """
+    prefecture = "|".join(PREFECTURES)
+    municipality = "|".join(
+        [
+            # 「郡」や「市」を名前に含む市は先に照合
+            *ADDRESS_SPECIAL_CITIES,
+            # 郡部の町村（例: 西多摩郡瑞穂町）。郡名に市区町村は含まない
+            # （市の後ろの「郡元町」などを郡と誤らないため）
+            "[^市区町村]{1,5}?郡.{1,6}?[町村]",
+            # 市（東京都の特別区の後ろの「市」は除外）
+            "[^区]+?市",
+            # 東京都の特別区
+            ".+?区",
+            ".+?[町村]",
+        ]
+    )
+    return re.compile(
+        f"^(?P<prefecture>{prefecture})?"
+        f"(?P<municipality>{municipality})"
+        # 区名は「町」「村」を含みうる（例: 名古屋市中村区）
+        r"(?P<ward>[^市区\d０-９]{1,4}区)?"
+    )
+
+
+ADDRESS_PATTERN = _build_address_pattern()
+
+
+def _parse_unique_addresses(addresses: pd.Series) -> pd.DataFrame:
+    """ユニークな住所を正規表現で一括分割"""
+    parts = addresses.astype(str).str.extract(ADDRESS_PATTERN)
+
+    prefecture = parts["prefecture"]
+    city = prefecture.fillna("") + parts["municipality"]
+    # 区は政令指定都市の場合のみ
+    has_ward = parts["ward"].notna() & parts["municipality"].str.endswith("市")
+    ward = (city + parts["ward"]).where(has_ward)
+
+    return pd.DataFrame({"prefecture": prefecture, "city": city, "ward": ward})
+
+
+def parse_addresses(addresses: pd.Series) -> pd.DataFrame:
+    """
+    住所を都道府県・市区町村・区に分割
+
+    住所はユニーク値ごとに一度だけ正規表現で分割し、コードで行方向に展開する。
+    市区町村と区は同名の別地域を区別するため、上位の地名を含めた値とする
+    （例: 神奈川県横浜市, 神奈川県横浜市中区）。
+
+    Args:
+        addresses: 住所の列
+
+    Returns:
+        prefecture, city, ward列（category型）を持つDataFrame
+    """
+    return map_unique(
+        addresses, _parse_unique_addresses, vectorized=True, as_category=True
+    )
+
+
 def process_address_features(df: pd.DataFrame) -> pd.DataFrame:
     """
     住所特徴量の処理
@@ -118,30 +590,7 @@ def process_address_features(df: pd.DataFrame) -> pd.DataFrame:
     """
     # 都道府県と市区町村を抽出
     if "full_address" in df.columns:
-        new_columns = {}
-        new_columns["prefecture"] = df["full_address"].str[:3]
-
-        # 市区町村の抽出（簡易版）
-        new_columns["city"] = df["full_address"].apply(
-            lambda x: (
-                x.split("市")[0] + "市"
-                if "市" in str(x)
-                else (
-                    x.split("区")[0] + "区"
-                    if "区" in str(x)
-                    else (
-                        x.split("町")[0] + "町"
-                        if "町" in str(x)
-                        else (
-                            x.split("村")[0] + "村" if "村" in str(x) else str(x)[:10]
-                        )
-                    )
-                )
-            )
-        )
-
-        # 新しい列を一度に追加
-        new_df = pd.DataFrame(new_columns, index=df.index)
+        new_df = parse_addresses(df["full_address"])
         df_processed = pd.concat([df, new_df], axis=1)
     else:
         df_processed = df.copy()
@@ -154,6 +603,8 @@ def preprocess_for_catboost(
     test: pd.DataFrame,
     target_col: str = "money_room",
     apply_log: bool = True,
+    sparse_tags: bool = False,
+    tag_vocabulary: Optional[Dict[str, List[str]]] = None,
 ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Series, List[str]]:
     """
     CatBoost用の前処理
@@ -163,6 +614,8 @@ def preprocess_for_catboost(
         test: テストデータ
         target_col: 目的変数のカラム名
         apply_log: 目的変数にlog変換を適用するか
+        sparse_tags: スラッシュ区切り特徴量の展開列をSparse[uint8]で保持するか
+        tag_vocabulary: スラッシュ区切り特徴量のタグ語彙（Noneの場合は学習データから学習）
 
     Returns:
         train_features, test_features, target, cat_features
@@ -190,43 +643,20 @@ def preprocess_for_catboost(
     ]
 
     # テキスト系の列（完全に削除せず、一部は処理）
-    text_cols_to_drop = [
-        "building_name",
-        "building_name_ruby",
-        "homes_building_name",
-        "homes_building_name_ruby",
-        "unit_name",
-        "name_ruby",
-        "empty_contents",
-        "parking_memo",
-        "reform_place_other",
-        "reform_wet_area_other",
-        "reform_interior_other",
-        "reform_exterior_other",
-        "reform_etc",
-        "renovation_etc",
-        "money_sonota_str1",
-        "money_sonota_str2",
-        "money_sonota_str3",
-    ]
-    drop_cols.extend(text_cols_to_drop)
+    drop_cols.extend(TEXT_COLUMNS_TO_DROP)
 
     # trainとtestを結合
     train_len = len(train)
-    combined = pd.concat([train, test], axis=0, ignore_index=True)
+    combined = concat_keep_categories([train, test])
     print(f"結合データ shape: {combined.shape}")
 
     # スラッシュ区切り特徴量の展開
     print("\n[1] スラッシュ区切り特徴量の展開...")
-    slash_cols = [
-        "building_tag_id",
-        "unit_tag_id",
-        "reform_interior",
-        "reform_exterior",
-        "reform_wet_area",
-        "statuses",
-    ]
-    combined = expand_slash_features(combined, slash_cols)
+    if tag_vocabulary is None:
+        tag_vocabulary = fit_slash_vocabulary(train, SLASH_COLUMNS)
+    combined = expand_slash_features(
+        combined, SLASH_COLUMNS, sparse_output=sparse_tags, vocabulary=tag_vocabulary
+    )
     print(f"展開後 shape: {combined.shape}")
 
     # 住所特徴量の処理
@@ -235,7 +665,12 @@ def preprocess_for_catboost(
 
     # 日付特徴量の処理
     print("\n[3] 日付特徴量の処理...")
-    combined = process_date_features(combined)
+    date_timings: Dict[str, Tuple[str, float]] = {}
+    combined = process_date_features(combined, timings=date_timings)
+    for col, (date_format, elapsed) in sorted(
+        date_timings.items(), key=lambda item: item[1][1], reverse=True
+    ):
+        print(f"  - {col}: {elapsed:.3f}秒 ({date_format})")
     print(f"日付処理後 shape: {combined.shape}")
 
     # 不要な列を削除
@@ -243,8 +678,10 @@ def preprocess_for_catboost(
         columns=[col for col in drop_cols if col in combined.columns], errors="ignore"
     )
 
-    # 完全に欠損している列を削除
-    null_ratio = combined.isnull().sum() / len(combined)
+    # 完全に欠損している列を削除（Sparse列は欠損を持たないため対象外）
+    sparse_cols = get_sparse_columns(combined)
+    dense_cols = combined.columns.difference(sparse_cols, sort=False)
+    null_ratio = combined[dense_cols].isnull().sum() / len(combined)
     cols_to_drop = null_ratio[null_ratio == 1.0].index.tolist()
     if cols_to_drop:
         print(f"\n完全に欠損している列を削除: {len(cols_to_drop)}列")
@@ -259,22 +696,35 @@ def preprocess_for_catboost(
     cat_features = []
 
     for col in train_processed.columns:
-        if train_processed[col].dtype == "object":
+        # 文字列化はユニーク値ごとに一度だけ行う
+        if (
+            isinstance(train_processed[col].dtype, pd.CategoricalDtype)
+            or train_processed[col].dtype == "object"
+        ):
             cat_features.append(col)
             # NaNを文字列に変換
-            train_processed[col] = train_processed[col].fillna("missing").astype(str)
-            test_processed[col] = test_processed[col].fillna("missing").astype(str)
+            train_processed[col] = map_unique(
+                train_processed[col], str, fill_value="missing"
+            )
+            test_processed[col] = map_unique(
+                test_processed[col], str, fill_value="missing"
+            )
         elif (
             train_processed[col].dtype in ["int64", "int32"]
             and train_processed[col].nunique() < 50
         ):
             # 整数型でユニーク数が少ない → カテゴリカルに
             cat_features.append(col)
-            train_processed[col] = train_processed[col].fillna(-999).astype(str)
-            test_processed[col] = test_processed[col].fillna(-999).astype(str)
+            train_processed[col] = map_unique(
+                train_processed[col], str, fill_value="-999"
+            )
+            test_processed[col] = map_unique(
+                test_processed[col], str, fill_value="-999"
+            )
 
     # 数値特徴量の欠損値を埋める
     numeric_cols = train_processed.select_dtypes(include=[np.number]).columns
+    numeric_cols = numeric_cols.difference(sparse_cols, sort=False)
     train_processed[numeric_cols] = train_processed[numeric_cols].fillna(-999)
     test_processed[numeric_cols] = test_processed[numeric_cols].fillna(-999)
 
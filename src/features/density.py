@@ -0,0 +1,247 @@
+"""
+半径内の物件数（密度）の計算
+
+緯度を一様な幅の帯（格子の行）に分け、点を（帯, 経度）の順にソートする。
+各点について半径にかかる帯ごとに、
+- 円に必ず含まれる経度の範囲: ソート済み配列の位置の差で件数を数える
+- 円の境界付近（含まれるか平面近似では決まらない範囲）: 点ごとに距離を比較する
+ため、距離を比較する点は境界付近のみになる。全組の比較（O(n²)）は行わず、
+計算量は点数にほぼ比例する（密度が一定の場合）。
+
+距離は単位球面上の弦の長さで比較する（大円距離と単調な関係のため結果は同じ）。
+経度の周期（日付変更線）は考慮しない。
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.features.distance import EARTH_RADIUS_KM, km_to_chord, to_unit_vectors
+
+# 緯度1度あたりの距離（km）
+KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180
+
+# 平面近似の誤差に対する余裕（半径に対する割合）。この範囲は点ごとに比較する
+MARGIN = 1e-3
+
+
+def _expand_runs(
+    starts: np.ndarray, lengths: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """位置の範囲 [start, start + length) を展開（範囲の番号, 位置）"""
+    run = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(int(lengths.sum())) - offsets[run] + starts[run]
+    return run, positions
+
+
+def _count_within(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    points: np.ndarray,
+    codes: Optional[np.ndarray],
+    n_categories: int,
+    radius_km: float,
+    strip_km: float,
+    batch_size: int,
+    max_pairs: int,
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """1つの半径について、各点から半径内にある点の数（自身を含む）"""
+    n = len(lat)
+    threshold = km_to_chord(radius_km) ** 2
+    margin = MARGIN + radius_km / EARTH_RADIUS_KM
+    r_in, r_out = radius_km * (1 - margin), radius_km * (1 + margin)
+
+    # （帯, 経度）のソートキー（帯の間は1度以上空ける）
+    strip_deg = strip_km / KM_PER_DEGREE
+    lat0, lon0 = lat.min(), lon.min()
+    span = lon.max() - lon0 + 1.0
+    strips = np.floor((lat - lat0) / strip_deg).astype(np.int64)
+    n_strips = int(strips.max()) + 1
+    keys = strips * span + (lon - lon0)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    sorted_points = points[order]
+    sorted_codes = codes[order] if codes is not None else None
+    # ソート済みの位置までのカテゴリ別の累積件数（範囲の件数を位置の差で求める）
+    cumulative = None
+    if codes is not None:
+        cumulative = np.zeros((n + 1, n_categories), dtype=np.int64)
+        np.cumsum(
+            sorted_codes[:, None] == np.arange(n_categories)[None, :],
+            axis=0,
+            out=cumulative[1:],
+        )
+
+    counts = np.zeros(n, dtype=np.int64)
+    category_counts = (
+        np.zeros((n, n_categories), dtype=np.int64) if codes is not None else None
+    )
+    max_offset = int(np.ceil(r_out / strip_km)) + 1
+
+    # ソート順に処理する（searchsortedの検索位置が近くなる）
+    for start in range(0, n, batch_size):
+        query = order[start : start + batch_size]
+        size = len(query)
+        q_lat, q_lon = lat[query], lon[query]
+        q_strip = strips[query]
+        # 経度1度あたりの距離（km）
+        km_per_lon = KM_PER_DEGREE * np.cos(np.radians(q_lat))
+
+        inner = np.zeros(size, dtype=np.int64)
+        inner_categories = (
+            np.zeros((size, n_categories), dtype=np.int64)
+            if cumulative is not None
+            else None
+        )
+        run_query, run_start, run_length = [], [], []
+
+        for offset in range(-max_offset, max_offset + 1):
+            strip = q_strip + offset
+            band_lo = lat0 + strip * strip_deg
+            band_hi = band_lo + strip_deg
+            # 帯までの最短・最長の南北距離（km）
+            dy_min = np.maximum(np.maximum(band_lo - q_lat, q_lat - band_hi), 0)
+            dy_max = np.maximum(q_lat - band_lo, band_hi - q_lat)
+            dy_min, dy_max = dy_min * KM_PER_DEGREE, dy_max * KM_PER_DEGREE
+            active = np.flatnonzero(
+                (strip >= 0) & (strip < n_strips) & (dy_min < r_out)
+            )
+            if len(active) == 0:
+                continue
+
+            # 円にかかる経度の範囲と、円に必ず含まれる経度の範囲（帯の中の経度）
+            x = q_lon[active] - lon0
+            scale = km_per_lon[active]
+            half_out = np.sqrt(r_out**2 - dy_min[active] ** 2) / scale
+            half_in = np.sqrt(np.maximum(r_in**2 - dy_max[active] ** 2, 0)) / scale
+            has_inner = dy_max[active] < r_in
+            base = strip[active] * span
+            pos_lo = np.searchsorted(sorted_keys, base + x - half_out, side="left")
+            pos_hi = np.searchsorted(sorted_keys, base + x + half_out, side="right")
+            pos_a = np.searchsorted(sorted_keys, base + x - half_in, side="left")
+            pos_b = np.searchsorted(sorted_keys, base + x + half_in, side="right")
+            pos_a = np.where(has_inner, pos_a, pos_hi)
+            pos_b = np.where(has_inner, pos_b, pos_hi)
+
+            inner[active] += pos_b - pos_a
+            if inner_categories is not None:
+                inner_categories[active] += cumulative[pos_b] - cumulative[pos_a]
+
+            # 境界付近の両端の範囲は点ごとに距離を比較する
+            for run_begin, run_end in ((pos_lo, pos_a), (pos_b, pos_hi)):
+                nonempty = run_end > run_begin
+                run_query.append(active[nonempty])
+                run_start.append(run_begin[nonempty])
+                run_length.append((run_end - run_begin)[nonempty])
+
+        run_query = np.concatenate(run_query)
+        run_start = np.concatenate(run_start)
+        run_length = np.concatenate(run_length)
+        boundary = np.zeros(size, dtype=np.int64)
+        boundary_categories = (
+            np.zeros(size * n_categories, dtype=np.int64)
+            if cumulative is not None
+            else None
+        )
+        # 比較する点の組がmax_pairsを超えないように範囲を分割
+        cumulative_pairs = np.cumsum(run_length)
+        splits = np.searchsorted(
+            cumulative_pairs,
+            np.arange(
+                max_pairs, cumulative_pairs[-1] if len(run_length) else 0, max_pairs
+            ),
+        )
+        for runs in np.split(np.arange(len(run_length)), splits):
+            run, positions = _expand_runs(run_start[runs], run_length[runs])
+            pair_query = run_query[runs][run]
+            chord_sq = (
+                (sorted_points[positions] - points[query[pair_query]]) ** 2
+            ).sum(axis=1)
+            within = chord_sq <= threshold
+            boundary += np.bincount(pair_query[within], minlength=size)
+            if boundary_categories is not None:
+                other_codes = sorted_codes[positions[within]]
+                known = other_codes >= 0
+                boundary_categories += np.bincount(
+                    pair_query[within][known] * n_categories + other_codes[known],
+                    minlength=size * n_categories,
+                )
+
+        counts[query] = inner + boundary
+        if category_counts is not None:
+            category_counts[query] = inner_categories + boundary_categories.reshape(
+                size, n_categories
+            )
+
+    return counts, category_counts
+
+
+def count_neighbors(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    radii_km: Sequence[float],
+    categories: Optional[np.ndarray] = None,
+    n_categories: int = 0,
+    strips_per_radius: int = 16,
+    batch_size: int = 65_536,
+    max_pairs: int = 4_000_000,
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    各点から半径内にある他の点の数（自身は含まない）
+
+    Args:
+        lat: 緯度
+        lon: 経度
+        radii_km: 半径（km）のリスト
+        categories: 各点のカテゴリのコード（0〜n_categories-1、欠損は-1）
+        n_categories: カテゴリ数
+        strips_per_radius: 半径あたりの緯度の帯の数（多いほど距離を比較する点が減る）
+        batch_size: 一度に処理する点数
+        max_pairs: 一度に距離を比較する点の組の数（メモリ使用量の上限）
+
+    Returns:
+        counts（(n, 半径数)）, カテゴリ別のcounts（(n, 半径数, カテゴリ数)、
+        categoriesがNoneの場合はNone）。緯度経度が欠損している行は-1
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    radii_km = list(radii_km)
+
+    counts = np.full((len(lat), len(radii_km)), -1, dtype=np.int64)
+    category_counts = None
+    if categories is not None:
+        category_counts = np.full(
+            (len(lat), len(radii_km), n_categories), -1, dtype=np.int64
+        )
+
+    valid_rows = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon))
+    if len(valid_rows) == 0:
+        return counts, category_counts
+
+    lat, lon = lat[valid_rows], lon[valid_rows]
+    points = to_unit_vectors(lat, lon)
+    codes = None
+    if categories is not None:
+        codes = np.asarray(categories, dtype=np.int64)[valid_rows]
+        has_code = np.flatnonzero(codes >= 0)
+
+    for j, radius in enumerate(radii_km):
+        within, category_within = _count_within(
+            lat,
+            lon,
+            points,
+            codes,
+            n_categories,
+            radius,
+            strip_km=radius / strips_per_radius,
+            batch_size=batch_size,
+            max_pairs=max_pairs,
+        )
+        # 自身を除く
+        counts[valid_rows, j] = within - 1
+        if category_within is not None:
+            category_within[has_code, codes[has_code]] -= 1
+            category_counts[valid_rows, j] = category_within
+
+    return counts, category_counts
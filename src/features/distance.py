@@ -0,0 +1,260 @@
+"""
+大円距離（haversine）による距離計算
+
+最近傍の検索は、緯度経度を単位球面上の3次元座標に変換したKD-treeで行う。
+球面上の直線距離（弦の長さ）は大円距離の単調増加関数のため近傍は大円距離と一致し、
+BallTree（metric="haversine"）より高速で、複数コアで並列に検索できる。
+参照地点が数千件あっても全件に対して高速に計算できる。距離の単位はkm。
+"""
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# 地球の平均半径（km）
+EARTH_RADIUS_KM = 6371.0088
+
+# 参照地点（名前, 緯度, 経度）
+PREFECTURE_CAPITALS = [
+    ("sapporo", 43.0642, 141.3469),
+    ("aomori", 40.8244, 140.7400),
+    ("morioka", 39.7036, 141.1527),
+    ("sendai", 38.2689, 140.8721),
+    ("akita", 39.7186, 140.1024),
+    ("yamagata", 38.2404, 140.3633),
+    ("fukushima", 37.7503, 140.4676),
+    ("mito", 36.3418, 140.4468),
+    ("utsunomiya", 36.5657, 139.8836),
+    ("maebashi", 36.3912, 139.0609),
+    ("saitama", 35.8570, 139.6489),
+    ("chiba", 35.6051, 140.1233),
+    ("shinjuku", 35.6895, 139.6917),
+    ("yokohama", 35.4478, 139.6425),
+    ("niigata", 37.9026, 139.0236),
+    ("toyama", 36.6953, 137.2113),
+    ("kanazawa", 36.5947, 136.6256),
+    ("fukui", 36.0652, 136.2216),
+    ("kofu", 35.6642, 138.5684),
+    ("nagano", 36.6513, 138.1810),
+    ("gifu", 35.3912, 136.7223),
+    ("shizuoka", 34.9769, 138.3831),
+    ("nagoya", 35.1802, 136.9066),
+    ("tsu", 34.7303, 136.5086),
+    ("otsu", 35.0045, 135.8686),
+    ("kyoto", 35.0214, 135.7556),
+    ("osaka", 34.6863, 135.5200),
+    ("kobe", 34.6913, 135.1830),
+    ("nara", 34.6851, 135.8329),
+    ("wakayama", 34.2260, 135.1675),
+    ("tottori", 35.5039, 134.2377),
+    ("matsue", 35.4723, 133.0505),
+    ("okayama", 34.6618, 133.9344),
+    ("hiroshima", 34.3966, 132.4596),
+    ("yamaguchi", 34.1859, 131.4714),
+    ("tokushima", 34.0657, 134.5593),
+    ("takamatsu", 34.3401, 134.0434),
+    ("matsuyama", 33.8416, 132.7657),
+    ("kochi", 33.5597, 133.5311),
+    ("fukuoka", 33.6064, 130.4181),
+    ("saga", 33.2494, 130.2988),
+    ("nagasaki", 32.7448, 129.8737),
+    ("kumamoto", 32.7898, 130.7417),
+    ("oita", 33.2382, 131.6126),
+    ("miyazaki", 31.9111, 131.4239),
+    ("kagoshima", 31.5602, 130.5581),
+    ("naha", 26.2124, 127.6809),
+]
+
+MAJOR_STATIONS = [
+    ("tokyo", 35.6812, 139.7671),
+    ("shinjuku", 35.6896, 139.7006),
+    ("shibuya", 35.6580, 139.7016),
+    ("ikebukuro", 35.7295, 139.7109),
+    ("shinagawa", 35.6285, 139.7387),
+    ("ueno", 35.7138, 139.7773),
+    ("yokohama", 35.4657, 139.6223),
+    ("omiya", 35.9064, 139.6239),
+    ("chiba", 35.6130, 140.1134),
+    ("osaka", 34.7025, 135.4959),
+    ("namba", 34.6654, 135.5005),
+    ("tennoji", 34.6465, 135.5133),
+    ("kyoto", 34.9858, 135.7588),
+    ("sannomiya", 34.6946, 135.1953),
+    ("nagoya", 35.1709, 136.8815),
+    ("hakata", 33.5897, 130.4207),
+    ("sapporo", 43.0687, 141.3508),
+    ("sendai", 38.2601, 140.8821),
+    ("hiroshima", 34.3978, 132.4753),
+]
+
+# create_distance_featuresで名前を指定して使える参照地点
+REFERENCE_SETS: Dict[str, List[Tuple[str, float, float]]] = {
+    "prefecture_capitals": PREFECTURE_CAPITALS,
+    "major_stations": MAJOR_STATIONS,
+}
+
+
+def reference_points(name: str) -> pd.DataFrame:
+    """
+    組み込みの参照地点
+
+    Args:
+        name: REFERENCE_SETSの名前
+
+    Returns:
+        name, lat, lon列のDataFrame
+    """
+    if name not in REFERENCE_SETS:
+        raise ValueError(f"未知の参照地点です: {name}（{', '.join(REFERENCE_SETS)} から選択）")
+    return pd.DataFrame(REFERENCE_SETS[name], columns=["name", "lat", "lon"])
+
+
+def haversine_distance(
+    lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    """
+    2点間の大円距離
+
+    Args:
+        lat1, lon1: 1点目の緯度・経度（度）
+        lat2, lon2: 2点目の緯度・経度（度、1点目とブロードキャスト可能な形）
+
+    Returns:
+        距離（km）
+    """
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def to_unit_vectors(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """緯度経度を単位球面上の (n, 3) の座標に変換"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord: np.ndarray) -> np.ndarray:
+    """単位球面上の弦の長さを大円距離（km）に変換"""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def km_to_chord(distance_km: float) -> float:
+    """大円距離（km）を単位球面上の弦の長さに変換"""
+    return 2 * np.sin(distance_km / (2 * EARTH_RADIUS_KM))
+
+
+def build_spherical_tree(lat: np.ndarray, lon: np.ndarray) -> cKDTree:
+    """
+    緯度経度の最近傍検索用のKD-tree（単位球面上の座標）を作成
+
+    Args:
+        lat: 緯度（欠損値を含まないこと）
+        lon: 経度（欠損値を含まないこと）
+
+    Returns:
+        cKDTree
+    """
+    points = to_unit_vectors(lat, lon)
+    if np.isnan(points).any():
+        raise ValueError("KD-treeの地点に欠損値があります")
+    return cKDTree(points)
+
+
+def query_nearest(
+    tree: cKDTree,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    k: int = 1,
+    chunk_size: int = 1_000_000,
+    workers: int = -1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    各地点から近いk地点の大円距離とインデックス
+
+    Args:
+        tree: build_spherical_treeで作成したKD-tree
+        lat: 緯度
+        lon: 経度
+        k: 近傍数（木の地点数を超える場合は地点数）
+        chunk_size: 一度に検索する行数（メモリ使用量の上限）
+        workers: 検索の並列数（-1は全コア）
+
+    Returns:
+        distances（km、(n, k)）, indices（(n, k)）。緯度経度が欠損している行は
+        距離が欠損、インデックスが-1
+    """
+    points = to_unit_vectors(lat, lon)
+    k = min(k, tree.n)
+    distances = np.full((len(points), k), np.nan)
+    indices = np.full((len(points), k), -1, dtype=np.int64)
+
+    valid_rows = np.flatnonzero(~np.isnan(points).any(axis=1))
+    for start in range(0, len(valid_rows), chunk_size):
+        rows = valid_rows[start : start + chunk_size]
+        chord, idx = tree.query(points[rows], k=[*range(1, k + 1)], workers=workers)
+        distances[rows], indices[rows] = chord_to_km(chord), idx
+
+    return distances, indices
+
+
+def count_within(
+    tree: cKDTree,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    radius_km: float,
+    chunk_size: int = 1_000_000,
+    workers: int = -1,
+) -> np.ndarray:
+    """
+    各地点から大円距離radius_km以内にある木の地点数
+
+    Args:
+        tree: build_spherical_treeで作成したKD-tree
+        lat: 緯度
+        lon: 経度
+        radius_km: 半径（km）
+        chunk_size: 一度に検索する行数（メモリ使用量の上限）
+        workers: 検索の並列数（-1は全コア）
+
+    Returns:
+        地点数（緯度経度が欠損している行は-1）
+    """
+    points = to_unit_vectors(lat, lon)
+    counts = np.full(len(points), -1, dtype=np.int64)
+
+    valid_rows = np.flatnonzero(~np.isnan(points).any(axis=1))
+    for start in range(0, len(valid_rows), chunk_size):
+        rows = valid_rows[start : start + chunk_size]
+        counts[rows] = tree.query_ball_point(
+            points[rows], km_to_chord(radius_km), return_length=True, workers=workers
+        )
+
+    return counts
+
+
+def nearest_reference_points(
+    lat: np.ndarray, lon: np.ndarray, points: pd.DataFrame, k: int = 1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    参照地点のうち近いk地点の距離とインデックス
+
+    Args:
+        lat: 緯度
+        lon: 経度
+        points: lat, lon列を持つ参照地点のDataFrame
+        k: 近傍数
+
+    Returns:
+        distances（km、(n, k)）, indices（pointsの行番号、(n, k)）
+    """
+    tree = build_spherical_tree(points["lat"], points["lon"])
+    return query_nearest(tree, lat, lon, k=k)
@@ -0,0 +1,187 @@
+"""
+地理クラスタモデルの保存・読み込みとクラスタの割り当て
+
+K-meansの標準化パラメータと重心だけを保持し、重心のKD-treeで
+新しい緯度経度に最近傍のクラスタを割り当てる（再学習は不要）。
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+from scipy.spatial import cKDTree
+from sklearn.preprocessing import StandardScaler
+
+# 保存形式のバージョン（形式を変更した場合に上げる）
+FORMAT_VERSION = 1
+MODEL_FILE = "model.npz"
+META_FILE = "meta.json"
+
+
+class GeoClusterModel:
+    """
+    標準化パラメータと重心からなる地理クラスタモデル
+
+    保存するとモデルの内容のハッシュをバージョンとしたディレクトリに書き出すため、
+    同じモデルは同じパスになり、異なるモデルが上書きされることはない。
+    """
+
+    def __init__(
+        self,
+        mean: np.ndarray,
+        scale: np.ndarray,
+        centroids: np.ndarray,
+        params: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Args:
+            mean: 標準化前の緯度・経度の平均
+            scale: 標準化前の緯度・経度の標準偏差
+            centroids: 標準化後の座標での重心 (n_clusters, 2)
+            params: 学習時のパラメータ（メタデータとして保存）
+        """
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.params = params or {}
+        self._tree: Optional[cKDTree] = None
+
+    @classmethod
+    def from_fitted(
+        cls,
+        scaler: StandardScaler,
+        kmeans: Any,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> "GeoClusterModel":
+        """
+        学習済みのStandardScalerとK-meansから作成
+
+        Args:
+            scaler: 緯度経度で学習したStandardScaler
+            kmeans: 標準化後の座標で学習したKMeans/MiniBatchKMeans
+            params: 学習時のパラメータ
+
+        Returns:
+            GeoClusterModel
+        """
+        return cls(scaler.mean_, scaler.scale_, kmeans.cluster_centers_, params)
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def version(self) -> str:
+        """モデルの内容（標準化パラメータと重心）のハッシュ"""
+        digest = hashlib.sha256()
+        for array in [self.mean, self.scale, self.centroids]:
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:12]
+
+    @property
+    def tree(self) -> cKDTree:
+        """重心のKD-tree（初回アクセス時に作成）"""
+        if self._tree is None:
+            self._tree = cKDTree(self.centroids)
+        return self._tree
+
+    def __getstate__(self) -> dict:
+        # KD-treeは読み込み後に作り直す
+        state = self.__dict__.copy()
+        state["_tree"] = None
+        return state
+
+    def assign(
+        self,
+        lat: Any,
+        lon: Any,
+        chunk_size: int = 1_000_000,
+        workers: int = -1,
+    ) -> np.ndarray:
+        """
+        緯度経度に最も近い重心のクラスタ番号を割り当て
+
+        Args:
+            lat: 緯度（配列またはSeries）
+            lon: 経度（配列またはSeries）
+            chunk_size: 1回に割り当てる行数
+            workers: KD-treeの検索に使うスレッド数（-1で全コア）
+
+        Returns:
+            クラスタ番号（緯度経度が欠損している行は-1）
+        """
+        coords = np.column_stack(
+            [np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)]
+        )
+        labels = np.full(len(coords), -1, dtype=np.int32)
+        valid = np.flatnonzero(~np.isnan(coords).any(axis=1))
+
+        for start in range(0, len(valid), chunk_size):
+            rows = valid[start : start + chunk_size]
+            scaled = (coords[rows] - self.mean) / self.scale
+            _, nearest = self.tree.query(scaled, k=1, workers=workers)
+            labels[rows] = nearest
+
+        return labels
+
+    def save(self, base_dir: Union[str, Path]) -> Path:
+        """
+        base_dir/<version>/ に保存
+
+        Args:
+            base_dir: 保存先の親ディレクトリ
+
+        Returns:
+            保存したディレクトリ
+        """
+        model_dir = Path(base_dir) / self.version
+        model_dir.mkdir(parents=True, exist_ok=True)
+
+        np.savez(
+            model_dir / MODEL_FILE,
+            mean=self.mean,
+            scale=self.scale,
+            centroids=self.centroids,
+        )
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "version": self.version,
+            "n_clusters": self.n_clusters,
+            "params": self.params,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(model_dir / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2, default=str)
+
+        return model_dir
+
+    @classmethod
+    def load(cls, model_dir: Union[str, Path]) -> "GeoClusterModel":
+        """
+        saveで保存したモデルを読み込み
+
+        Args:
+            model_dir: saveの戻り値のディレクトリ
+
+        Returns:
+            GeoClusterModel
+        """
+        model_dir = Path(model_dir)
+        with open(model_dir / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["format_version"] != FORMAT_VERSION:
+            raise ValueError(
+                f"対応していない保存形式です: format_version={meta['format_version']} "
+                f"（対応: {FORMAT_VERSION}）: {model_dir}"
+            )
+
+        arrays = np.load(model_dir / MODEL_FILE)
+        model = cls(
+            arrays["mean"], arrays["scale"], arrays["centroids"], meta["params"]
+        )
+        if model.version != meta["version"]:
+            raise ValueError(f"モデルの内容がバージョン {meta['version']} と一致しません")
+        return model
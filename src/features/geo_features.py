@@ -4,14 +4,34 @@
 参考:
 - https://qiita.com/mountaincat/items/53a71c3b75d6ec8a01c8
 - 不動産価格予測コンペのベストプラクティス
+
+各関数はtrain/testをまとめて処理する。学習データでfitした状態から任意の行数に
+適用する場合は src.features.geo_transformers の変換器を使う（各関数の中身も同じ）。
+各関数は既定では入力をコピーした新しいDataFrameを返す。inplace=True の場合は
+入力のDataFrameに新しい列の配列だけを追加して返す（多数の列を持つDataFrameを
+ステージごとに複製しないため、メモリ使用量のピークが下がる）。
 """
 
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+
+from src.features.density import count_neighbors
+from src.features.geo_cluster import GeoClusterModel
+from src.features.geo_transformers import (
+    DEFAULT_TARGET_ENCODING_COLS,
+    KMEANS_ENGINES,
+    MAJOR_CITIES,
+    ClusterAggregationTransformer,
+    DerivedFeatureTransformer,
+    DistanceTransformer,
+    GeoClusterTransformer,
+    TargetEncodingTransformer,
+)
+from src.features.target_stats import TargetStatsStore
+from src.utils.frame import append_columns
+from src.utils.unique import factorize_column
 
 
 def create_kmeans_clusters(
@@ -21,10 +41,19 @@ def create_kmeans_clusters(
     lon_col: str = "lon",
     n_clusters: int = 50,
     random_state: int = 42,
-) -> Tuple[pd.DataFrame, pd.DataFrame, KMeans]:
+    engine: str = "kmeans",
+    batch_size: int = 4096,
+    chunk_size: int = 1_000_000,
+    inplace: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame, GeoClusterModel]:
     """
     緯度経度でK-meansクラスタリング
 
+    engine="minibatch" の場合はMiniBatchKMeansで学習する。テストデータ
+    （minibatchの場合は学習データも）は、重心のKD-treeでチャンクごとに割り当てる。
+    各engineはrandom_stateを固定すれば再実行しても同じラベルになる
+    （kmeansとminibatchのラベルは一致しない）。
+
     Args:
         train: 学習データ
         test: テストデータ
@@ -32,123 +61,80 @@ def create_kmeans_clusters(
         lon_col: 経度のカラム名
         n_clusters: クラスタ数
         random_state: 乱数シード
+        engine: "kmeans"（全件・n_init=10）または "minibatch"
+        batch_size: MiniBatchKMeansのミニバッチサイズ
+        chunk_size: クラスタを割り当てる際のチャンクサイズ
+        inplace: Trueの場合、元の列をコピーせずtrain/testに直接列を追加する
 
     Returns:
-        train, test, kmeans_model
+        train, test, 標準化パラメータと重心を保持したGeoClusterModel
     """
-    print(f"\n[K-means Clustering] n_clusters={n_clusters}")
-
-    # 緯度経度の結合
-    train_copy = train.copy()
-    test_copy = test.copy()
-
-    # 欠損値を除外してクラスタリング
-    train_valid = train_copy[[lat_col, lon_col]].dropna()
-
-    # 標準化
-    scaler = StandardScaler()
-    lat_lon_scaled = scaler.fit_transform(train_valid)
-
-    # K-meansクラスタリング
-    kmeans = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10)
-    train_valid_clusters = kmeans.fit_predict(lat_lon_scaled)
-
-    # 学習データにクラスタを割り当て
-    train_copy["geo_cluster"] = -1
-    train_copy.loc[train_valid.index, "geo_cluster"] = train_valid_clusters
-
-    # テストデータにクラスタを割り当て
-    test_valid = test_copy[[lat_col, lon_col]].dropna()
-    if len(test_valid) > 0:
-        test_lat_lon_scaled = scaler.transform(test_valid)
-        test_valid_clusters = kmeans.predict(test_lat_lon_scaled)
-        test_copy["geo_cluster"] = -1
-        test_copy.loc[test_valid.index, "geo_cluster"] = test_valid_clusters
-    else:
-        test_copy["geo_cluster"] = -1
+    if engine not in KMEANS_ENGINES:
+        raise ValueError(f"engineは {KMEANS_ENGINES} のいずれかです: {engine}")
+
+    print(f"\n[K-means Clustering] n_clusters={n_clusters}, engine={engine}")
+
+    transformer = GeoClusterTransformer(
+        lat_col=lat_col,
+        lon_col=lon_col,
+        n_clusters=n_clusters,
+        random_state=random_state,
+        engine=engine,
+        batch_size=batch_size,
+        chunk_size=chunk_size,
+        copy=not inplace,
+    ).fit(train)
+    train_copy = transformer.transform(train)
+    test_copy = transformer.transform(test)
 
     print(f"Clusters created: {train_copy['geo_cluster'].nunique()} unique clusters")
 
-    return train_copy, test_copy, kmeans
+    return train_copy, test_copy, transformer.model_
 
 
 def create_cluster_aggregation_features(
     train: pd.DataFrame,
     test: pd.DataFrame,
-    target_col: str = "money_room",
+    target_col: Optional[str] = "money_room",
     cluster_col: str = "geo_cluster",
     agg_cols: List[str] = None,
+    prefix: Optional[str] = None,
+    inplace: bool = False,
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     クラスターごとの集約特徴量を作成
 
+    cluster_colにはgeo_clusterのほか、add_spatial_cellsで追加した
+    geohash・地域メッシュの列も指定できる。
+
+    全ての統計量を1回のgroupbyで計算し、クラスタのコードで行方向に展開する
+    （mergeを使わないため、行順とindexを保ったまま余分なコピーを作らない）。
+
     Args:
         train: 学習データ
         test: テストデータ
-        target_col: 目的変数のカラム名
+        target_col: 目的変数のカラム名（Noneの場合は目的変数の統計量を作らない）
         cluster_col: クラスタのカラム名
         agg_cols: 集約する数値カラムのリスト
+        prefix: 特徴量名の接頭辞（Noneの場合、geo_clusterは"cluster"、それ以外はcluster_col）
+        inplace: Trueの場合、元の列をコピーせずtrain/testに直接列を追加する
 
     Returns:
         train, test
     """
-    print("\n[Cluster Aggregation Features]")
-
-    if agg_cols is None:
-        agg_cols = ["house_area", "year_built", "walk_distance1", "money_kyoueki"]
-
-    # 有効なカラムのみを使用
-    agg_cols = [col for col in agg_cols if col in train.columns]
-
-    train_copy = train.copy()
-    test_copy = test.copy()
-
-    # クラスターごとの目的変数の統計量
-    if target_col in train.columns:
-        cluster_target_stats = (
-            train_copy.groupby(cluster_col)[target_col]
-            .agg(
-                [
-                    ("cluster_target_mean", "mean"),
-                    ("cluster_target_median", "median"),
-                    ("cluster_target_std", "std"),
-                    ("cluster_target_min", "min"),
-                    ("cluster_target_max", "max"),
-                ]
-            )
-            .reset_index()
-        )
+    print(f"\n[Cluster Aggregation Features] {cluster_col}")
 
-        train_copy = train_copy.merge(cluster_target_stats, on=cluster_col, how="left")
-        test_copy = test_copy.merge(cluster_target_stats, on=cluster_col, how="left")
+    target = train[target_col] if target_col in train.columns else None
+    transformer = ClusterAggregationTransformer(
+        cluster_col=cluster_col, agg_cols=agg_cols, prefix=prefix, copy=not inplace
+    ).fit(train, target)
+    train_copy = transformer.transform(train)
+    test_copy = transformer.transform(test)
 
+    if target is not None:
         print("  - Target aggregation: 5 features")
-
-    # クラスターごとの物件数
-    cluster_counts = (
-        train_copy.groupby(cluster_col).size().reset_index(name="cluster_count")
-    )
-    train_copy = train_copy.merge(cluster_counts, on=cluster_col, how="left")
-    test_copy = test_copy.merge(cluster_counts, on=cluster_col, how="left")
     print("  - Cluster count: 1 feature")
-
-    # その他の数値特徴量の集約
-    for col in agg_cols:
-        cluster_agg = (
-            train_copy.groupby(cluster_col)[col]
-            .agg(
-                [
-                    (f"cluster_{col}_mean", "mean"),
-                    (f"cluster_{col}_median", "median"),
-                ]
-            )
-            .reset_index()
-        )
-
-        train_copy = train_copy.merge(cluster_agg, on=cluster_col, how="left")
-        test_copy = test_copy.merge(cluster_agg, on=cluster_col, how="left")
-
-    print(f"  - Other aggregations: {len(agg_cols) * 2} features")
+    print(f"  - Other aggregations: {len(transformer.agg_cols_) * 2} features")
 
     return train_copy, test_copy
 
@@ -159,16 +145,23 @@ def create_target_encoding_features(
     target_col: str = "money_room",
     categorical_cols: List[str] = None,
     smoothing: float = 10.0,
+    store: Optional[TargetStatsStore] = None,
+    inplace: bool = False,
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Target Encoding（カテゴリごとの目的変数の平均など）
 
+    categorical_colsにはadd_spatial_cellsで追加したgeohash・地域メッシュの列も指定できる。
+    storeを渡すと、学習データを集計せずにその十分統計量から計算する。
+
     Args:
         train: 学習データ
         test: テストデータ
         target_col: 目的変数のカラム名
         categorical_cols: Target Encodingするカテゴリカルカラム
         smoothing: 平滑化パラメータ
+        store: 集計済みの統計量（Noneの場合はtrainから集計）
+        inplace: Trueの場合、元の列をコピーせずtrain/testに直接列を追加する
 
     Returns:
         train, test
@@ -176,54 +169,23 @@ def create_target_encoding_features(
     print("\n[Target Encoding Features]")
 
     if categorical_cols is None:
-        categorical_cols = ["city", "prefecture", "eki_name1"]
+        categorical_cols = DEFAULT_TARGET_ENCODING_COLS
 
     # 有効なカラムのみを使用
     categorical_cols = [col for col in categorical_cols if col in train.columns]
 
-    if target_col not in train.columns:
-        print("  - Target column not found, skipping")
-        return train, test
-
-    train_copy = train.copy()
-    test_copy = test.copy()
-
-    global_mean = train_copy[target_col].mean()
+    if store is None:
+        if target_col not in train.columns:
+            print("  - Target column not found, skipping")
+            return train, test
+        store = TargetStatsStore().update(train, train[target_col], categorical_cols)
 
-    for col in categorical_cols:
-        # カテゴリごとの統計量
-        cat_stats = (
-            train_copy.groupby(col)[target_col].agg(["mean", "count"]).reset_index()
-        )
-        cat_stats.columns = [col, f"{col}_target_mean", f"{col}_count"]
-
-        # スムージング
-        cat_stats[f"{col}_target_encoded"] = (
-            cat_stats[f"{col}_target_mean"] * cat_stats[f"{col}_count"]
-            + global_mean * smoothing
-        ) / (cat_stats[f"{col}_count"] + smoothing)
-
-        # マージ
-        train_copy = train_copy.merge(
-            cat_stats[[col, f"{col}_target_encoded", f"{col}_count"]],
-            on=col,
-            how="left",
-        )
-        test_copy = test_copy.merge(
-            cat_stats[[col, f"{col}_target_encoded", f"{col}_count"]],
-            on=col,
-            how="left",
-        )
-
-        # 欠損値を全体平均で埋める
-        train_copy[f"{col}_target_encoded"] = train_copy[
-            f"{col}_target_encoded"
-        ].fillna(global_mean)
-        test_copy[f"{col}_target_encoded"] = test_copy[f"{col}_target_encoded"].fillna(
-            global_mean
-        )
-        train_copy[f"{col}_count"] = train_copy[f"{col}_count"].fillna(0)
-        test_copy[f"{col}_count"] = test_copy[f"{col}_count"].fillna(0)
+    # 未知のキーは件数0、平滑化した値は全体平均になる
+    transformer = TargetEncodingTransformer.from_store(
+        store, categorical_cols, smoothing, copy=not inplace
+    )
+    train_copy = transformer.transform(train)
+    test_copy = transformer.transform(test)
 
     print(f"  - Target encoding: {len(categorical_cols) * 2} features")
 
@@ -231,93 +193,145 @@ def create_target_encoding_features(
 
 
 def create_distance_features(
-    df: pd.DataFrame, lat_col: str = "lat", lon_col: str = "lon"
+    df: pd.DataFrame,
+    lat_col: str = "lat",
+    lon_col: str = "lon",
+    reference_sets: Sequence[str] = (),
+    k: int = 1,
+    inplace: bool = False,
 ) -> pd.DataFrame:
     """
     距離関連の特徴量を作成
 
+    距離は大円距離（km）。reference_setsを指定すると、参照地点のうち近いk地点の
+    距離とインデックス（{name}_nearest{i}_km, {name}_nearest{i}_id）を追加する。
+
     Args:
         df: DataFrame
         lat_col: 緯度のカラム名
         lon_col: 経度のカラム名
+        reference_sets: 参照地点の名前（"prefecture_capitals", "major_stations"）
+        k: 参照地点の近傍数
+        inplace: Trueの場合、元の列をコピーせずdfに直接列を追加する
 
     Returns:
         DataFrame
     """
     print("\n[Distance Features]")
 
-    # 主要都市の緯度経度（例）
-    major_cities = {
-        "tokyo": (35.6762, 139.6503),
-        "osaka": (34.6937, 135.5023),
-        "nagoya": (35.1815, 136.9066),
-    }
-
-    # 各主要都市までの距離を一度に計算
-    new_columns = {}
-    for city_name, (city_lat, city_lon) in major_cities.items():
-        new_columns[f"distance_to_{city_name}"] = np.sqrt(
-            (df[lat_col] - city_lat) ** 2 + (df[lon_col] - city_lon) ** 2
-        )
-
-    # 新しい列を一度に結合
-    new_df = pd.DataFrame(new_columns, index=df.index)
-    df_copy = pd.concat([df, new_df], axis=1)
+    transformer = DistanceTransformer(
+        lat_col=lat_col,
+        lon_col=lon_col,
+        reference_sets=reference_sets,
+        k=k,
+        copy=not inplace,
+    ).fit()
+    df_copy = transformer.transform(df)
 
-    print(f"  - Distance to major cities: {len(major_cities)} features")
+    print(f"  - Distance to major cities: {len(MAJOR_CITIES)} features")
+    if reference_sets:
+        print(f"  - Nearest reference points: {len(reference_sets) * k * 2} features")
 
     return df_copy
 
 
-def create_derived_features(df: pd.DataFrame) -> pd.DataFrame:
+def create_density_features(
+    train: pd.DataFrame,
+    test: pd.DataFrame,
+    lat_col: str = "lat",
+    lon_col: str = "lon",
+    radii_km: Sequence[float] = (0.25, 0.5, 1.0),
+    category_cols: Sequence[str] = ("building_type",),
+    inplace: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    半径内の物件数（密度）の特徴量を作成
+
+    train/testを合わせた全物件のうち、各物件から半径内にある物件数
+    （density_{半径}m）と、category_colsの値ごとの物件数
+    （density_{半径}m_{列}_{値}）を追加する。自身は数えない。
+
+    Args:
+        train: 学習データ
+        test: テストデータ
+        lat_col: 緯度のカラム名
+        lon_col: 経度のカラム名
+        radii_km: 半径（km）のリスト
+        category_cols: 値ごとに物件数を数えるカラムのリスト
+        inplace: Trueの場合、元の列をコピーせずtrain/testに直接列を追加する
+
+    Returns:
+        train, test
+    """
+    print("\n[Density Features]")
+
+    lat = np.concatenate(
+        [
+            df[lat_col].to_numpy(dtype=np.float64, na_value=np.nan)
+            for df in [train, test]
+        ]
+    )
+    lon = np.concatenate(
+        [
+            df[lon_col].to_numpy(dtype=np.float64, na_value=np.nan)
+            for df in [train, test]
+        ]
+    )
+    names = [f"density_{radius * 1000:g}m" for radius in radii_km]
+
+    # 全物件の件数はカテゴリ別の件数と同時に数える
+    counts = None
+    category_columns = {}
+    for col in category_cols:
+        codes, uniques = factorize_column(pd.concat([train[col], test[col]]))
+        counts, category_counts = count_neighbors(
+            lat, lon, radii_km, categories=codes, n_categories=len(uniques)
+        )
+        for j, name in enumerate(names):
+            for code, value in enumerate(uniques):
+                category_columns[f"{name}_{col}_{value}"] = category_counts[:, j, code]
+    if counts is None:
+        counts, _ = count_neighbors(lat, lon, radii_km)
+    new_columns = {name: counts[:, j] for j, name in enumerate(names)}
+    new_columns.update(category_columns)
+
+    n_train = len(train)
+    train_copy = append_columns(
+        train,
+        {name: values[:n_train] for name, values in new_columns.items()},
+        inplace=inplace,
+    )
+    test_copy = append_columns(
+        test,
+        {name: values[n_train:] for name, values in new_columns.items()},
+        inplace=inplace,
+    )
+
+    print(f"  - Listings within radius: {len(names)} features")
+    if category_columns:
+        print(
+            f"  - Listings within radius by category: {len(category_columns)} features"
+        )
+
+    return train_copy, test_copy
+
+
+def create_derived_features(df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
     """
     派生特徴量の作成
 
     Args:
         df: DataFrame
+        inplace: Trueの場合、元の列をコピーせずdfに直接列を追加する
 
     Returns:
         DataFrame
     """
     print("\n[Derived Features]")
 
-    new_columns = {}
-
-    # 築年数の計算
-    if "year_built" in df.columns:
-        building_age = 2023 - df["year_built"]
-        new_columns["building_age"] = building_age.clip(lower=0)
-
-    # 単価（価格/面積）- データリークのため削除
-    # if "money_room" in df.columns and "house_area" in df.columns:
-    #     new_columns["price_per_area"] = df["money_room"] / (df["house_area"] + 1)
-
-    # 共益費の割合 - データリークのため削除
-    # if "money_kyoueki" in df.columns and "money_room" in df.columns:
-    #     new_columns["kyoueki_ratio"] = df["money_kyoueki"] / (df["money_room"] + 1)
-
-    # 時系列特徴量
-    if "target_ym" in df.columns:
-        target_ym_int = df["target_ym"].astype(int)
-        new_columns["target_year"] = target_ym_int // 100
-        new_columns["target_month"] = target_ym_int % 100
-        new_columns["is_january"] = (new_columns["target_month"] == 1).astype(int)
-        new_columns["is_july"] = (new_columns["target_month"] == 7).astype(int)
-
-    # 駅距離の対数変換（外れ値に頑健）
-    if "walk_distance1" in df.columns:
-        # 負の値や欠損値を0に変換してからlog1p
-        walk_dist = df["walk_distance1"].fillna(0).clip(lower=0)
-        new_columns["log_walk_distance1"] = np.log1p(walk_dist)
-
-    # 新しい列を一度に結合
-    feature_count = len(new_columns)
-    if new_columns:
-        new_df = pd.DataFrame(new_columns, index=df.index)
-        df_copy = pd.concat([df, new_df], axis=1)
-    else:
-        df_copy = df.copy()
-
-    print(f"  - Derived features: {feature_count} features")
+    n_columns = df.shape[1]
+    df_copy = DerivedFeatureTransformer(copy=not inplace).transform(df)
+
+    print(f"  - Derived features: {df_copy.shape[1] - n_columns} features")
 
     return df_copy
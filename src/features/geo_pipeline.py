@@ -0,0 +1,719 @@
+"""
+前処理・地理空間特徴量のパイプライン定義
+
+各処理をノードとして宣言し、src.utils.pipeline.Pipeline で実行する。
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from src.data import kokudo as kokudo_module
+from src.data import load as load_module
+from src.data import preprocess as preprocess_module
+from src.data.kokudo import load_layers
+from src.data.load import load_parquet_dataset, load_raw_csv
+from src.data.preprocess import (
+    SLASH_COLUMNS,
+    fit_slash_vocabulary,
+    preprocess_for_catboost,
+)
+from src.features import density as density_module
+from src.features import distance as distance_module
+from src.features import geo_cluster as geo_cluster_module
+from src.features import geo_transformers as geo_transformers_module
+from src.features import knn_features as knn_features_module
+from src.features import polygon_index as polygon_index_module
+from src.features import spatial_index as spatial_index_module
+from src.features import target_stats as target_stats_module
+from src.features.geo_features import (
+    create_cluster_aggregation_features,
+    create_density_features,
+    create_derived_features,
+    create_distance_features,
+    create_kmeans_clusters,
+    create_target_encoding_features,
+)
+from src.features.knn_features import OOFKNNPriceEncoder, OOFTemporalKNNEncoder
+from src.features.spatial_index import add_spatial_cells, spatial_cell_columns
+from src.features.spatial_join import spatial_join_features
+from src.features.target_stats import KeySpec, OOFTargetEncoder, TargetStatsStore
+from src.models.train_catboost import make_fold_ids
+from src.utils import frame as frame_module
+from src.utils import unique as unique_module
+from src.utils.cache import file_fingerprint
+from src.utils.pipeline import Node
+
+# パイプラインの最終成果物
+GEO_PIPELINE_TARGETS = [
+    "train_features",
+    "test_features",
+    "train_target",
+    "cat_features",
+    "tag_vocabulary",
+    "geo_cluster_model",
+    "fold_ids",
+    "target_encoder",
+    "knn_encoder",
+    "temporal_knn_encoder",
+]
+
+
+def load_data(path: str) -> pd.DataFrame:
+    """
+    Parquetデータセット（ディレクトリ）またはCSVを読み込み
+
+    Args:
+        path: データセットのディレクトリまたはCSVのパス
+
+    Returns:
+        DataFrame
+    """
+    path = Path(path)
+    if path.is_dir():
+        return load_parquet_dataset(path)
+    return load_raw_csv(path)
+
+
+def run_preprocess(
+    train: pd.DataFrame,
+    test: pd.DataFrame,
+    tag_vocabulary: Dict[str, List[str]],
+    **params: Any,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Series, List[str]]:
+    """preprocess_for_catboost をタグ語彙を入力として呼び出す"""
+    return preprocess_for_catboost(train, test, tag_vocabulary=tag_vocabulary, **params)
+
+
+def attach_target(
+    train: pd.DataFrame,
+    target: pd.Series,
+    target_col: str = "money_room",
+    inplace: bool = False,
+) -> pd.DataFrame:
+    """
+    目的変数を一時的に結合（クラスター集約・Target Encoding用）
+
+    Args:
+        train: 学習データ
+        target: 目的変数
+        target_col: 目的変数のカラム名
+        inplace: Trueの場合、trainをコピーせずに目的変数の列を追加する
+
+    Returns:
+        目的変数を結合したDataFrame
+    """
+    train_with_target = train if inplace else train.copy()
+    train_with_target[target_col] = target
+    return train_with_target
+
+
+def run_target_encoding(
+    train: pd.DataFrame,
+    test: pd.DataFrame,
+    store: Optional[TargetStatsStore] = None,
+    **params: Any,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    create_target_encoding_features を保存済みの統計量（任意）を入力として呼び出す
+
+    storeを渡す場合も、学習データにない列はstoreを渡さない場合と同様に除外し、
+    未知のキーは件数0・全体の平均になる。学習データにあるがstoreにない列はエラーとする。
+
+    Args:
+        train: 学習データ
+        test: テストデータ
+        store: update_target_stats.py で保存した統計量（Noneの場合はtrainから集計）
+        **params: create_target_encoding_features のパラメータ
+
+    Returns:
+        train, test
+    """
+    if store is not None:
+        missing = [
+            col
+            for col in params.get("categorical_cols") or []
+            if col in train.columns and col not in store.stats
+        ]
+        if missing:
+            raise ValueError(f"保存済みの統計量にない列があります: {missing}")
+    return create_target_encoding_features(train, test, store=store, **params)
+
+
+def make_target_folds(
+    target: pd.Series, n_splits: int = 5, random_state: int = 42
+) -> np.ndarray:
+    """目的変数の行数でmake_fold_idsを呼び出す"""
+    return make_fold_ids(len(target), n_splits=n_splits, random_state=random_state)
+
+
+def fit_target_encoder(
+    train: pd.DataFrame,
+    target: pd.Series,
+    fold_ids: np.ndarray,
+    key_cols: List[KeySpec],
+    smoothing: float = 10.0,
+    hierarchies: Optional[List[List[str]]] = None,
+    count_cols: Optional[List[KeySpec]] = None,
+) -> OOFTargetEncoder:
+    """
+    OOFTargetEncoderを学習
+
+    Args:
+        train: キー列を含む学習データ
+        target: 目的変数
+        fold_ids: 各行の検証fold番号
+        key_cols: 統計量を計算するキー列（列名のリストは組み合わせキー）
+        smoothing: 平滑化パラメータ
+        hierarchies: 上位から順に並べた階層の列名のリスト
+        count_cols: 件数を出力するキー列（Noneの場合はkey_colsの全て）
+
+    Returns:
+        学習済みのOOFTargetEncoder
+    """
+    encoder = OOFTargetEncoder(
+        key_cols, smoothing=smoothing, hierarchies=hierarchies, count_cols=count_cols
+    )
+    return encoder.fit(train, target, fold_ids)
+
+
+def fit_knn_encoder(
+    train: pd.DataFrame,
+    target: pd.Series,
+    fold_ids: np.ndarray,
+    k: int = 10,
+    eps_km: float = 0.05,
+) -> OOFKNNPriceEncoder:
+    """
+    OOFKNNPriceEncoderを学習
+
+    Args:
+        train: 緯度経度を含む学習データ
+        target: 目的変数
+        fold_ids: 各行の検証fold番号
+        k: 近傍数（0の場合は特徴量を作らない）
+        eps_km: 距離の重みの 1 / (距離 + eps_km) に足す値
+
+    Returns:
+        学習済みのOOFKNNPriceEncoder
+    """
+    return OOFKNNPriceEncoder(k=k, eps_km=eps_km).fit(train, target, fold_ids)
+
+
+def fit_temporal_knn_encoder(
+    train: pd.DataFrame,
+    target: pd.Series,
+    fold_ids: np.ndarray,
+    k: int = 10,
+    eps_km: float = 0.05,
+    max_lag_months: Optional[int] = None,
+) -> OOFTemporalKNNEncoder:
+    """
+    OOFTemporalKNNEncoderを学習
+
+    Args:
+        train: 緯度経度とtarget_ymを含む学習データ
+        target: 目的変数
+        fold_ids: 各行の検証fold番号
+        k: 近傍数（0の場合は特徴量を作らない）
+        eps_km: 距離の重みの 1 / (距離 + eps_km) に足す値
+        max_lag_months: 何か月前の時点までを対象にするか（Noneの場合は全期間）
+
+    Returns:
+        学習済みのOOFTemporalKNNEncoder
+    """
+    encoder = OOFTemporalKNNEncoder(k=k, eps_km=eps_km, max_lag_months=max_lag_months)
+    return encoder.fit(train, target, fold_ids)
+
+
+def run_cluster_aggregation(
+    train: pd.DataFrame,
+    test: pd.DataFrame,
+    cluster_cols: List[str],
+    target_col: Optional[str] = "money_room",
+    agg_cols: List[str] = None,
+    inplace: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    複数のクラスタ・格子セルの列ごとに create_cluster_aggregation_features を実行
+
+    Args:
+        train: 学習データ
+        test: テストデータ
+        cluster_cols: 集約のキーにする列（geo_cluster, mesh3 など）
+        target_col: 目的変数のカラム名（Noneの場合は目的変数の統計量を作らない）
+        agg_cols: 集約する数値カラムのリスト
+        inplace: Trueの場合、元の列をコピーせずtrain/testに直接列を追加する
+
+    Returns:
+        train, test
+    """
+    for cluster_col in cluster_cols:
+        train, test = create_cluster_aggregation_features(
+            train,
+            test,
+            target_col=target_col,
+            cluster_col=cluster_col,
+            agg_cols=agg_cols,
+            inplace=inplace,
+        )
+    return train, test
+
+
+def finalize_features(
+    train_with_target: pd.DataFrame,
+    test: pd.DataFrame,
+    cat_features: List[str],
+    target_col: str = "money_room",
+    key_cols: List[str] = None,
+    inplace: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Series, List[str]]:
+    """
+    目的変数を分離し、geo_clusterと格子セルの列をカテゴリカル特徴量にする
+
+    Args:
+        train_with_target: 目的変数を含む学習データ
+        test: テストデータ
+        cat_features: 前処理で求めたカテゴリカル特徴量
+        target_col: 目的変数のカラム名
+        key_cols: カテゴリカルとして扱う列（Noneの場合はgeo_clusterのみ）
+        inplace: Trueの場合、コピーせずにtrain_with_targetから目的変数の列を取り出し、
+            train_with_target・testのキーの列を置き換える
+
+    Returns:
+        train_features, test_features, target, cat_features
+    """
+    if inplace:
+        train_features, test_features = train_with_target, test
+        target = train_features.pop(target_col)
+    else:
+        target = train_with_target[target_col]
+        train_features = train_with_target.drop(columns=[target_col])
+        test_features = test.copy()
+    cat_features = list(cat_features)
+
+    if key_cols is None:
+        key_cols = ["geo_cluster"]
+
+    # geo_clusterや格子セルのIDはカテゴリカルとして扱う
+    for col in key_cols:
+        if col not in train_features.columns:
+            continue
+        train_features[col] = train_features[col].astype(str)
+        test_features[col] = test_features[col].astype(str)
+        if col not in cat_features:
+            cat_features.append(col)
+
+    return train_features, test_features, target, cat_features
+
+
+def _layer_files(path: Union[str, Path]) -> Path:
+    """レイヤーの指紋を取るパス（シェープファイルは.dbfなどを含むディレクトリ）"""
+    path = Path(path)
+    return path.parent if path.suffix.lower() == ".shp" else path
+
+
+def build_geo_pipeline(
+    train_path: Union[str, Path],
+    test_path: Union[str, Path],
+    preprocess_params: Dict[str, Any],
+    geo_params: Dict[str, Any],
+) -> List[Node]:
+    """
+    読み込みから地理空間特徴量までのノードを作成
+
+    oof_target_stats=True の場合、目的変数の統計量（クラスター集約の目的変数・
+    Target Encoding）は特徴量に含めず、CVのfoldごとに target_encoder で計算する。
+    それ以外の場合、target_stats_pathを指定するとTarget Encodingは学習データを集計せず、
+    update_target_stats.py で保存した統計量から計算する（保存した統計量は全学習データを
+    含みfoldごとに差し引けないため、oof_target_stats=True との併用はエラーとする）。
+    組み合わせキー（target_encoding_combinations）と階層（target_encoding_hierarchies）は
+    target_encoder でのみ計算する。近傍物件の価格（knn_k > 0）と過去の時点の
+    近傍物件の価格（temporal_knn_k > 0）も同様に knn_encoder・temporal_knn_encoder で
+    のみ計算する。
+    kokudo_layersを指定すると、国土数値情報のレイヤーとの空間結合の特徴量を追加する。
+    density_radii_kmを指定すると、train/testの全物件の半径内の物件数を追加する。
+    inplace_features=True の場合、目的変数の結合から特徴量の確定までの各ノードは
+    入力のDataFrameをコピーせずに新しい列だけを追加する（中間の成果物は同じ
+    DataFrameを指すため、各ノードの実行後に中間の成果物を参照しないこと）。
+
+    読み込みと格子セル・距離・派生特徴量は計算が軽いためキャッシュせず、
+    それ以外のノードは個別にキャッシュする。train/testの格子セル・距離・派生特徴量は
+    互いに依存しないため並列に実行される。
+
+    Args:
+        train_path: 学習データ（Parquetデータセットまたはcsv）
+        test_path: テストデータ（Parquetデータセットまたはcsv）
+        preprocess_params: preprocess_for_catboost のパラメータ
+        geo_params: n_clusters, random_state, kmeans_engine, geohash_precisions,
+            mesh_levels, cluster_cols, agg_cols, target_encoding_cols, smoothing,
+            oof_target_stats, n_splits, fold_random_state,
+            target_encoding_combinations, target_encoding_hierarchies,
+            reference_sets, reference_k, kokudo_layers, knn_k, knn_eps_km,
+            temporal_knn_k, temporal_knn_max_lag_months, density_radii_km,
+            density_category_cols, inplace_features, target_stats_path
+
+    Returns:
+        ノードのリスト
+    """
+    target_col = preprocess_params["target_col"]
+    oof = geo_params.get("oof_target_stats", False)
+    inplace = geo_params.get("inplace_features", False)
+    cluster_cols = geo_params.get("cluster_cols", ["geo_cluster"])
+    if oof and geo_params.get("target_stats_path") is not None:
+        raise ValueError("target_stats_path は oof_target_stats=False の場合のみ使用できます")
+    cell_params = {
+        "geohash_precisions": geo_params.get("geohash_precisions", []),
+        "mesh_levels": geo_params.get("mesh_levels", []),
+    }
+
+    nodes = [
+        Node(
+            "load_train",
+            load_data,
+            inputs=[],
+            outputs=["train_raw"],
+            params={"path": str(train_path)},
+            fingerprint=file_fingerprint(train_path),
+            code=[load_module],
+            cache=False,
+        ),
+        Node(
+            "load_test",
+            load_data,
+            inputs=[],
+            outputs=["test_raw"],
+            params={"path": str(test_path)},
+            fingerprint=file_fingerprint(test_path),
+            code=[load_module],
+            cache=False,
+        ),
+        Node(
+            "fit_tag_vocabulary",
+            fit_slash_vocabulary,
+            inputs=["train_raw"],
+            outputs=["tag_vocabulary"],
+            params={"columns": SLASH_COLUMNS},
+            code=[preprocess_module, unique_module],
+        ),
+        Node(
+            "preprocess",
+            run_preprocess,
+            inputs=["train_raw", "test_raw", "tag_vocabulary"],
+            outputs=["train_preprocessed", "test_preprocessed", "target", "base_cat"],
+            params=preprocess_params,
+            code=[run_preprocess, preprocess_module, unique_module],
+        ),
+        Node(
+            "attach_target",
+            attach_target,
+            inputs=["train_preprocessed", "target"],
+            outputs=["train_with_target"],
+            params={"target_col": target_col, "inplace": inplace},
+            code=[attach_target],
+            cache=False,
+        ),
+        Node(
+            "kmeans",
+            create_kmeans_clusters,
+            inputs=["train_with_target", "test_preprocessed"],
+            outputs=["train_kmeans", "test_kmeans", "geo_cluster_model"],
+            params={
+                "lat_col": "lat",
+                "lon_col": "lon",
+                "n_clusters": geo_params["n_clusters"],
+                "random_state": geo_params["random_state"],
+                "engine": geo_params.get("kmeans_engine", "kmeans"),
+                "inplace": inplace,
+            },
+            code=[
+                create_kmeans_clusters,
+                geo_transformers_module,
+                geo_cluster_module,
+                frame_module,
+            ],
+        ),
+    ]
+
+    # 格子セル（train/testは並列に実行）
+    for split in ["train", "test"]:
+        nodes.append(
+            Node(
+                f"spatial_cells_{split}",
+                add_spatial_cells,
+                inputs=[f"{split}_kmeans"],
+                outputs=[f"{split}_cells"],
+                params={
+                    "lat_col": "lat",
+                    "lon_col": "lon",
+                    **cell_params,
+                    "inplace": inplace,
+                },
+                code=[spatial_index_module, frame_module],
+                cache=False,
+            ),
+        )
+
+    # OOFの場合、目的変数の統計量はCVのfoldごとにtarget_encoderで計算する
+    nodes.append(
+        Node(
+            "cluster_aggregation",
+            run_cluster_aggregation,
+            inputs=["train_cells", "test_cells"],
+            outputs=["train_cluster_agg", "test_cluster_agg"],
+            params={
+                "cluster_cols": cluster_cols,
+                "target_col": None if oof else target_col,
+                "agg_cols": geo_params["agg_cols"],
+                "inplace": inplace,
+            },
+            code=[
+                run_cluster_aggregation,
+                create_cluster_aggregation_features,
+                geo_transformers_module,
+                frame_module,
+                unique_module,
+            ],
+        )
+    )
+    encoded = "cluster_agg"
+    if not oof:
+        target_stats_path = geo_params.get("target_stats_path")
+        store_inputs = []
+        if target_stats_path is not None:
+            nodes.append(
+                Node(
+                    "load_target_stats",
+                    TargetStatsStore.load,
+                    inputs=[],
+                    outputs=["target_stats"],
+                    params={"path": str(target_stats_path)},
+                    fingerprint=file_fingerprint(target_stats_path),
+                    code=[target_stats_module],
+                    cache=False,
+                )
+            )
+            store_inputs = ["target_stats"]
+        nodes.append(
+            Node(
+                "target_encoding",
+                run_target_encoding,
+                inputs=["train_cluster_agg", "test_cluster_agg", *store_inputs],
+                outputs=["train_target_encoded", "test_target_encoded"],
+                params={
+                    "target_col": target_col,
+                    "categorical_cols": geo_params["target_encoding_cols"],
+                    "smoothing": geo_params["smoothing"],
+                    "inplace": inplace,
+                },
+                code=[
+                    run_target_encoding,
+                    create_target_encoding_features,
+                    geo_transformers_module,
+                    target_stats_module,
+                    frame_module,
+                    unique_module,
+                ],
+            )
+        )
+        encoded = "target_encoded"
+
+    for split in ["train", "test"]:
+        nodes += [
+            Node(
+                f"distance_{split}",
+                create_distance_features,
+                inputs=[f"{split}_{encoded}"],
+                outputs=[f"{split}_distance"],
+                params={
+                    "lat_col": "lat",
+                    "lon_col": "lon",
+                    "reference_sets": geo_params.get("reference_sets", []),
+                    "k": geo_params.get("reference_k", 1),
+                    "inplace": inplace,
+                },
+                code=[
+                    create_distance_features,
+                    geo_transformers_module,
+                    distance_module,
+                    frame_module,
+                ],
+                cache=False,
+            ),
+            Node(
+                f"derived_{split}",
+                create_derived_features,
+                inputs=[f"{split}_distance"],
+                outputs=[f"{split}_derived"],
+                params={"inplace": inplace},
+                code=[create_derived_features, geo_transformers_module, frame_module],
+                cache=False,
+            ),
+        ]
+
+    # 国土数値情報のレイヤー（読み込みとKD-treeの作成結果をキャッシュする）
+    kokudo_layers = geo_params.get("kokudo_layers", {})
+    joined = "derived"
+    if kokudo_layers:
+        nodes.append(
+            Node(
+                "kokudo_layers",
+                load_layers,
+                inputs=[],
+                outputs=["kokudo_layers"],
+                params={"specs": kokudo_layers},
+                fingerprint={
+                    name: file_fingerprint(_layer_files(spec["path"]))
+                    for name, spec in kokudo_layers.items()
+                },
+                code=[kokudo_module, distance_module, polygon_index_module],
+            )
+        )
+        for split in ["train", "test"]:
+            nodes.append(
+                Node(
+                    f"spatial_join_{split}",
+                    spatial_join_features,
+                    inputs=[f"{split}_derived", "kokudo_layers"],
+                    outputs=[f"{split}_joined"],
+                    params={
+                        "specs": kokudo_layers,
+                        "lat_col": "lat",
+                        "lon_col": "lon",
+                        "inplace": inplace,
+                    },
+                    code=[
+                        spatial_join_features,
+                        kokudo_module,
+                        distance_module,
+                        polygon_index_module,
+                        frame_module,
+                        unique_module,
+                    ],
+                )
+            )
+        joined = "joined"
+
+    # 半径内の物件数（train/testを合わせて数える）
+    density_radii = geo_params.get("density_radii_km", [])
+    if density_radii:
+        nodes.append(
+            Node(
+                "density",
+                create_density_features,
+                inputs=[f"train_{joined}", f"test_{joined}"],
+                outputs=["train_density", "test_density"],
+                params={
+                    "lat_col": "lat",
+                    "lon_col": "lon",
+                    "radii_km": density_radii,
+                    "category_cols": geo_params.get(
+                        "density_category_cols", ["building_type"]
+                    ),
+                    "inplace": inplace,
+                },
+                code=[
+                    create_density_features,
+                    density_module,
+                    distance_module,
+                    frame_module,
+                    unique_module,
+                ],
+            )
+        )
+        joined = "density"
+
+    nodes.append(
+        Node(
+            "finalize",
+            finalize_features,
+            inputs=[f"train_{joined}", f"test_{joined}", "base_cat"],
+            outputs=["train_features", "test_features", "train_target", "cat_features"],
+            params={
+                "target_col": target_col,
+                "key_cols": [
+                    "geo_cluster",
+                    *spatial_cell_columns(**cell_params),
+                    *[
+                        f"{name}_{attribute}"
+                        for name, spec in kokudo_layers.items()
+                        for attribute in spec.get("categorical", [])
+                    ],
+                ],
+                "inplace": inplace,
+            },
+            code=[finalize_features],
+        )
+    )
+
+    nodes += [
+        Node(
+            "fold_ids",
+            make_target_folds,
+            inputs=["train_target"],
+            outputs=["fold_ids"],
+            params={
+                "n_splits": geo_params.get("n_splits", 5),
+                "random_state": geo_params.get("fold_random_state", 42),
+            },
+            code=[make_target_folds, make_fold_ids],
+        ),
+        Node(
+            "target_encoder",
+            fit_target_encoder,
+            inputs=["train_features", "train_target", "fold_ids"],
+            outputs=["target_encoder"],
+            params={
+                "key_cols": (
+                    [
+                        *cluster_cols,
+                        *geo_params["target_encoding_cols"],
+                        *geo_params.get("target_encoding_combinations", []),
+                    ]
+                    if oof
+                    else []
+                ),
+                "smoothing": geo_params["smoothing"],
+                "hierarchies": (
+                    geo_params.get("target_encoding_hierarchies", []) if oof else []
+                ),
+                # クラスタの件数（{prefix}_count）はcluster_aggregationが出力する
+                "count_cols": [
+                    key
+                    for key in [
+                        *geo_params["target_encoding_cols"],
+                        *geo_params.get("target_encoding_combinations", []),
+                    ]
+                    if key not in cluster_cols
+                ],
+            },
+            code=[fit_target_encoder, target_stats_module, unique_module],
+        ),
+        Node(
+            "knn_encoder",
+            fit_knn_encoder,
+            inputs=["train_features", "train_target", "fold_ids"],
+            outputs=["knn_encoder"],
+            params={
+                "k": geo_params.get("knn_k", 0) if oof else 0,
+                "eps_km": geo_params.get("knn_eps_km", 0.05),
+            },
+            code=[fit_knn_encoder, knn_features_module, distance_module],
+        ),
+        Node(
+            "temporal_knn_encoder",
+            fit_temporal_knn_encoder,
+            inputs=["train_features", "train_target", "fold_ids"],
+            outputs=["temporal_knn_encoder"],
+            params={
+                "k": geo_params.get("temporal_knn_k", 0) if oof else 0,
+                "eps_km": geo_params.get("knn_eps_km", 0.05),
+                "max_lag_months": geo_params.get("temporal_knn_max_lag_months"),
+            },
+            code=[fit_temporal_knn_encoder, knn_features_module, distance_module],
+        ),
+    ]
+
+    return nodes
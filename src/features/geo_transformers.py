@@ -0,0 +1,498 @@
+"""
+地理空間特徴量のfit/transform形式の変換器
+
+geo_features の各関数（K-meansクラスタ・クラスター集約・Target Encoding・
+距離・派生特徴量）と同じ特徴量を、学習データでfitした状態から任意の行数
+（1行でも）に対して計算する。状態は重心・キーごとの統計量などの小さな配列だけで
+学習データ自体は保持しないため、pickleで保存して推論時に読み込める。
+
+scikit-learnの TransformerMixin を継承しているため sklearn.pipeline.Pipeline で
+連結できる。transform は入力に特徴量の列を追加したDataFrameを返す
+（copy=False の場合は入力に直接列を追加して返す）。
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+from src.features.distance import (
+    haversine_distance,
+    nearest_reference_points,
+    reference_points,
+)
+from src.features.geo_cluster import GeoClusterModel
+from src.features.target_stats import TargetStatsStore
+from src.utils.frame import append_columns
+from src.utils.unique import broadcast_unique, factorize_column
+
+# GeoClusterTransformerで選択できる学習方法
+KMEANS_ENGINES = ("kmeans", "minibatch")
+
+# 主要都市の緯度経度（DistanceTransformerの距離の基準）
+MAJOR_CITIES = {
+    "tokyo": (35.6762, 139.6503),
+    "osaka": (34.6937, 135.5023),
+    "nagoya": (35.1815, 136.9066),
+}
+
+# ClusterAggregationTransformerで目的変数を集約する際の一時的な列名
+TARGET_COLUMN = "__target__"
+
+DEFAULT_AGG_COLS = ["house_area", "year_built", "walk_distance1", "money_kyoueki"]
+DEFAULT_TARGET_ENCODING_COLS = ["city", "prefecture", "eki_name1"]
+
+
+class GeoClusterTransformer(BaseEstimator, TransformerMixin):
+    """
+    緯度経度のK-meansクラスタ（geo_cluster列）
+
+    状態は標準化パラメータと重心（GeoClusterModel）のみ。
+    engine="minibatch" の場合はMiniBatchKMeansで学習する。
+    各engineはrandom_stateを固定すれば再実行しても同じラベルになる
+    （kmeansとminibatchのラベルは一致しない）。
+    """
+
+    def __init__(
+        self,
+        lat_col: str = "lat",
+        lon_col: str = "lon",
+        n_clusters: int = 50,
+        random_state: int = 42,
+        engine: str = "kmeans",
+        batch_size: int = 4096,
+        chunk_size: int = 1_000_000,
+        copy: bool = True,
+    ):
+        """
+        Args:
+            lat_col: 緯度のカラム名
+            lon_col: 経度のカラム名
+            n_clusters: クラスタ数
+            random_state: 乱数シード
+            engine: "kmeans"（全件・n_init=10）または "minibatch"
+            batch_size: MiniBatchKMeansのミニバッチサイズ
+            chunk_size: クラスタを割り当てる際のチャンクサイズ
+            copy: Falseの場合、transformで入力のDataFrameに直接列を追加する
+        """
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.n_clusters = n_clusters
+        self.random_state = random_state
+        self.engine = engine
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.copy = copy
+
+    def fit(self, X: pd.DataFrame, y=None) -> "GeoClusterTransformer":
+        """
+        緯度経度（欠損を除く）を標準化してK-meansを学習
+
+        Args:
+            X: 緯度経度を含む学習データ
+            y: 使用しない
+
+        Returns:
+            self
+        """
+        if self.engine not in KMEANS_ENGINES:
+            raise ValueError(f"engineは {KMEANS_ENGINES} のいずれかです: {self.engine}")
+
+        valid = X[[self.lat_col, self.lon_col]].dropna()
+        scaler = StandardScaler()
+        scaled = scaler.fit_transform(valid)
+
+        if self.engine == "kmeans":
+            kmeans = KMeans(
+                n_clusters=self.n_clusters, random_state=self.random_state, n_init=10
+            )
+        else:
+            kmeans = MiniBatchKMeans(
+                n_clusters=self.n_clusters,
+                random_state=self.random_state,
+                batch_size=self.batch_size,
+                n_init=3,
+                compute_labels=False,
+            )
+        kmeans.fit(scaled)
+
+        self.model_ = GeoClusterModel.from_fitted(
+            scaler,
+            kmeans,
+            params={
+                "lat_col": self.lat_col,
+                "lon_col": self.lon_col,
+                "n_clusters": self.n_clusters,
+                "random_state": self.random_state,
+                "engine": self.engine,
+            },
+        )
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        """
+        最も近い重心のクラスタ番号を追加（緯度経度が欠損している行は-1）
+
+        Args:
+            X: 緯度経度を含むDataFrame
+
+        Returns:
+            geo_cluster列を追加したDataFrame
+        """
+        labels = self.model_.assign(
+            X[self.lat_col], X[self.lon_col], chunk_size=self.chunk_size
+        )
+        return append_columns(X, {"geo_cluster": labels}, inplace=not self.copy)
+
+
+class ClusterAggregationTransformer(BaseEstimator, TransformerMixin):
+    """
+    クラスターごとの集約特徴量
+
+    状態はクラスタのキーと、キーごとの統計量の表のみ。transformでは行のキーを
+    表の位置に変換して展開する（mergeを使わないため、行順とindexを保つ）。
+    学習データにないキー・欠損は全特徴量が欠損になる。
+    """
+
+    def __init__(
+        self,
+        cluster_col: str = "geo_cluster",
+        agg_cols: Optional[List[str]] = None,
+        prefix: Optional[str] = None,
+        copy: bool = True,
+    ):
+        """
+        Args:
+            cluster_col: クラスタのカラム名（geohash・地域メッシュの列も指定できる）
+            agg_cols: 集約する数値カラムのリスト（Noneの場合はDEFAULT_AGG_COLS）
+            prefix: 特徴量名の接頭辞（Noneの場合、geo_clusterは"cluster"、それ以外はcluster_col）
+            copy: Falseの場合、transformで入力のDataFrameに直接列を追加する
+        """
+        self.cluster_col = cluster_col
+        self.agg_cols = agg_cols
+        self.prefix = prefix
+        self.copy = copy
+
+    def fit(
+        self, X: pd.DataFrame, y: Optional[pd.Series] = None
+    ) -> "ClusterAggregationTransformer":
+        """
+        キーごとの統計量を全て1回のgroupbyで計算
+
+        Args:
+            X: クラスタと集約する列を含む学習データ
+            y: 目的変数（Noneの場合は目的変数の統計量を作らない）
+
+        Returns:
+            self
+        """
+        prefix = self.prefix
+        if prefix is None:
+            prefix = (
+                "cluster" if self.cluster_col == "geo_cluster" else self.cluster_col
+            )
+        agg_cols = DEFAULT_AGG_COLS if self.agg_cols is None else self.agg_cols
+        # 有効なカラムのみを使用
+        self.agg_cols_ = [col for col in agg_cols if col in X.columns]
+
+        # (特徴量名, 集約する列, 統計量) を出力する順に並べる（列がNoneの場合は物件数）
+        features = []
+        if y is not None:
+            features += [
+                (f"{prefix}_target_{func}", TARGET_COLUMN, func)
+                for func in ["mean", "median", "std", "min", "max"]
+            ]
+        features.append((f"{prefix}_count", None, "size"))
+        for col in self.agg_cols_:
+            features += [
+                (f"{prefix}_{col}_{func}", col, func) for func in ["mean", "median"]
+            ]
+
+        # クラスタをコードに変換（欠損は-1）
+        codes, uniques = factorize_column(X[self.cluster_col])
+        valid = codes >= 0
+        data = X[self.agg_cols_]
+        if y is not None:
+            data = data.assign(**{TARGET_COLUMN: np.asarray(y)})
+
+        # 全ての列・統計量を1回のgroupbyで計算
+        agg_funcs = {}
+        for _, col, func in features:
+            if col is not None and func not in agg_funcs.setdefault(col, []):
+                agg_funcs[col].append(func)
+        grouped = data.loc[valid, list(agg_funcs)].groupby(codes[valid])
+        cluster_index = np.arange(len(uniques))
+        stats = grouped.agg(agg_funcs).reindex(cluster_index) if agg_funcs else None
+        counts = grouped.size().reindex(cluster_index, fill_value=0)
+
+        # 推論時にキーを表の位置に変換するため、Indexとして保持する
+        self.keys_ = pd.Index(uniques)
+        self.stats_ = pd.DataFrame(
+            {
+                name: counts if col is None else stats[(col, func)]
+                for name, col, func in features
+            }
+        )
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        """
+        キーごとの統計量を行方向に展開して追加
+
+        Args:
+            X: クラスタの列を含むDataFrame
+
+        Returns:
+            集約特徴量を追加したDataFrame
+        """
+        codes = self.keys_.get_indexer(X[self.cluster_col])
+        return append_columns(
+            X,
+            {
+                name: broadcast_unique(values, codes)
+                for name, values in self.stats_.items()
+            },
+            inplace=not self.copy,
+        )
+
+
+class TargetEncodingTransformer(BaseEstimator, TransformerMixin):
+    """
+    平滑化したTarget Encoding（{col}_target_encoded, {col}_count）
+
+    状態はキーごとの十分統計量（TargetStatsStore）のみ。
+    未知のキーは件数0、平滑化した値は全体平均になる。
+    """
+
+    def __init__(
+        self,
+        categorical_cols: Optional[List[str]] = None,
+        smoothing: float = 10.0,
+        copy: bool = True,
+    ):
+        """
+        Args:
+            categorical_cols: Target Encodingするカテゴリカルカラム
+                （Noneの場合はDEFAULT_TARGET_ENCODING_COLS）
+            smoothing: 平滑化パラメータ
+            copy: Falseの場合、transformで入力のDataFrameに直接列を追加する
+        """
+        self.categorical_cols = categorical_cols
+        self.smoothing = smoothing
+        self.copy = copy
+
+    @classmethod
+    def from_store(
+        cls,
+        store: TargetStatsStore,
+        categorical_cols: List[str],
+        smoothing: float = 10.0,
+        copy: bool = True,
+    ) -> "TargetEncodingTransformer":
+        """
+        集計済みの統計量から作成（fitは不要）
+
+        Args:
+            store: categorical_colsの統計量を含むTargetStatsStore
+            categorical_cols: Target Encodingするカテゴリカルカラム
+            smoothing: 平滑化パラメータ
+            copy: Falseの場合、transformで入力のDataFrameに直接列を追加する
+
+        Returns:
+            TargetEncodingTransformer
+        """
+        transformer = cls(categorical_cols, smoothing, copy=copy)
+        transformer.categorical_cols_ = list(categorical_cols)
+        transformer.store_ = store
+        return transformer
+
+    def fit(self, X: pd.DataFrame, y: pd.Series) -> "TargetEncodingTransformer":
+        """
+        キーごとの件数・和・二乗和を集計
+
+        Args:
+            X: カテゴリカルカラムを含む学習データ
+            y: 目的変数
+
+        Returns:
+            self
+        """
+        categorical_cols = (
+            DEFAULT_TARGET_ENCODING_COLS
+            if self.categorical_cols is None
+            else self.categorical_cols
+        )
+        # 有効なカラムのみを使用
+        self.categorical_cols_ = [col for col in categorical_cols if col in X.columns]
+        self.store_ = TargetStatsStore().update(X, y, self.categorical_cols_)
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        """
+        Target Encodingと件数を追加
+
+        Args:
+            X: カテゴリカルカラムを含むDataFrame
+
+        Returns:
+            Target Encodingの列を追加したDataFrame
+        """
+        new_columns = {}
+        for col in self.categorical_cols_:
+            encoded = self.store_.encode(X, col, self.smoothing)
+            new_columns[f"{col}_target_encoded"] = encoded["encoded"].to_numpy()
+            new_columns[f"{col}_count"] = encoded["count"].to_numpy()
+        return append_columns(X, new_columns, inplace=not self.copy)
+
+
+class DistanceTransformer(BaseEstimator, TransformerMixin):
+    """
+    距離関連の特徴量（主要都市までの大円距離と、近い参照地点の距離・インデックス）
+
+    状態は参照地点の表のみ（学習データには依存しない）。
+    """
+
+    def __init__(
+        self,
+        lat_col: str = "lat",
+        lon_col: str = "lon",
+        reference_sets: Sequence[str] = (),
+        k: int = 1,
+        copy: bool = True,
+    ):
+        """
+        Args:
+            lat_col: 緯度のカラム名
+            lon_col: 経度のカラム名
+            reference_sets: 参照地点の名前（"prefecture_capitals", "major_stations"）
+            k: 参照地点の近傍数
+            copy: Falseの場合、transformで入力のDataFrameに直接列を追加する
+        """
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.reference_sets = reference_sets
+        self.k = k
+        self.copy = copy
+
+    def fit(self, X: Optional[pd.DataFrame] = None, y=None) -> "DistanceTransformer":
+        """
+        参照地点の表を読み込み
+
+        Args:
+            X: 使用しない
+            y: 使用しない
+
+        Returns:
+            self
+        """
+        self.reference_points_ = {
+            name: reference_points(name) for name in self.reference_sets
+        }
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        """
+        距離の特徴量を追加
+
+        距離は大円距離（km）。参照地点ごとに近いk地点の距離とインデックス
+        （{name}_nearest{i}_km, {name}_nearest{i}_id）を追加する。
+
+        Args:
+            X: 緯度経度を含むDataFrame
+
+        Returns:
+            距離の列を追加したDataFrame
+        """
+        lat = X[self.lat_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        lon = X[self.lon_col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        # 各主要都市までの距離を一度に計算
+        new_columns = {}
+        for city_name, (city_lat, city_lon) in MAJOR_CITIES.items():
+            new_columns[f"distance_to_{city_name}"] = haversine_distance(
+                lat, lon, city_lat, city_lon
+            )
+
+        for name, points in self.reference_points_.items():
+            distances, indices = nearest_reference_points(lat, lon, points, k=self.k)
+            for i in range(distances.shape[1]):
+                new_columns[f"{name}_nearest{i + 1}_km"] = distances[:, i]
+                new_columns[f"{name}_nearest{i + 1}_id"] = indices[:, i]
+
+        return append_columns(X, new_columns, inplace=not self.copy)
+
+
+class DerivedFeatureTransformer(BaseEstimator, TransformerMixin):
+    """
+    派生特徴量（築年数・取得時点の年月・駅距離の対数）
+
+    状態を持たない（基準年のみ）。
+    """
+
+    def __init__(self, reference_year: int = 2023, copy: bool = True):
+        """
+        Args:
+            reference_year: 築年数を計算する基準年
+            copy: Falseの場合、transformで入力のDataFrameに直接列を追加する
+        """
+        self.reference_year = reference_year
+        self.copy = copy
+
+    def fit(
+        self, X: Optional[pd.DataFrame] = None, y=None
+    ) -> "DerivedFeatureTransformer":
+        """
+        何もしない（sklearnのインターフェースのため）
+
+        Args:
+            X: 使用しない
+            y: 使用しない
+
+        Returns:
+            self
+        """
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        """
+        派生特徴量を追加（元の列がない特徴量は作らない）
+
+        Args:
+            X: DataFrame
+
+        Returns:
+            派生特徴量を追加したDataFrame
+        """
+        new_columns = {}
+
+        # 築年数の計算
+        if "year_built" in X.columns:
+            building_age = self.reference_year - X["year_built"]
+            new_columns["building_age"] = building_age.clip(lower=0)
+
+        # 単価（価格/面積）- データリークのため削除
+        # if "money_room" in X.columns and "house_area" in X.columns:
+        #     new_columns["price_per_area"] = X["money_room"] / (X["house_area"] + 1)
+
+        # 共益費の割合 - データリークのため削除
+        # if "money_kyoueki" in X.columns and "money_room" in X.columns:
+        #     new_columns["kyoueki_ratio"] = X["money_kyoueki"] / (X["money_room"] + 1)
+
+        # 時系列特徴量
+        if "target_ym" in X.columns:
+            target_ym_int = X["target_ym"].astype(int)
+            new_columns["target_year"] = target_ym_int // 100
+            new_columns["target_month"] = target_ym_int % 100
+            new_columns["is_january"] = (new_columns["target_month"] == 1).astype(int)
+            new_columns["is_july"] = (new_columns["target_month"] == 7).astype(int)
+
+        # 駅距離の対数変換（外れ値に頑健）
+        if "walk_distance1" in X.columns:
+            # 負の値や欠損値を0に変換してからlog1p
+            walk_dist = X["walk_distance1"].fillna(0).clip(lower=0)
+            new_columns["log_walk_distance1"] = np.log1p(walk_dist)
+
+        return append_columns(X, new_columns, inplace=not self.copy)
@@ -0,0 +1,463 @@
+"""
+近傍物件の価格の特徴量（k近傍、Out-of-Fold）
+
+学習データの物件の緯度経度で最近傍検索用の木を作り、各物件から近いk件の
+目的変数（対数価格）の平均・中央値・距離で重み付けした平均を求める。
+K-meansのクラスタより細かい、周辺の成約事例に相当する特徴量になる。
+
+CVの検証データの目的変数を含まないよう、OOFTargetEncoderと同じ規則で
+foldを除いた学習データから近傍を探す（自身の行も常に除かれる）。
+検索は行をchunk_size行ずつに分け、KD-treeの検索を全コアで並列に行う。
+
+OOFTemporalKNNEncoderは、各物件の時点（target_ym）より前の時点の物件のみから
+近傍を探す。木は（時点, fold）ごとに作るため、検索は対象の木だけを見る。
+"""
+
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from src.features.distance import build_spherical_tree, query_nearest
+from src.utils.cache import FeatureCache
+
+# 近傍の統計量の名前（接頭辞を除く）
+STAT_NAMES = ["price_mean", "price_median", "price_wmean", "distance_mean"]
+
+
+def _price_stats(
+    prefix: str, distances: np.ndarray, prices: np.ndarray, eps_km: float
+) -> Dict[str, np.ndarray]:
+    """近傍の距離（km）と価格（(n, k)）から統計量を計算"""
+    weights = 1.0 / (distances + eps_km)
+    return {
+        f"{prefix}_price_mean": prices.mean(axis=1),
+        f"{prefix}_price_median": np.median(prices, axis=1),
+        f"{prefix}_price_wmean": (weights * prices).sum(axis=1) / weights.sum(axis=1),
+        f"{prefix}_distance_mean": distances.mean(axis=1),
+    }
+
+
+def _months(values: pd.Series) -> np.ndarray:
+    """target_ym（YYYYMM）を月の通し番号に変換"""
+    ym = values.astype(int).to_numpy()
+    return ym // 100 * 12 + ym % 100
+
+
+class OOFKNNPriceEncoder:
+    """
+    CVのfoldごとに近傍物件の価格の特徴量を計算するエンコーダ
+
+    CVのfold f で学習するモデルには、
+    - 検証データ（fold f）の行: fold f 以外の学習データの近傍
+    - 学習データ（fold g ≠ f）の行: fold f, g 以外の学習データの近傍
+    を特徴量として与える。テストデータには fold f 以外の学習データの近傍を与える。
+
+    特徴量: knn{k}_price_mean, knn{k}_price_median, knn{k}_price_wmean
+    （距離の逆数で重み付けした平均）, knn{k}_distance_mean（km）
+    """
+
+    def __init__(
+        self,
+        k: int = 10,
+        eps_km: float = 0.05,
+        chunk_size: int = 200_000,
+        workers: int = -1,
+    ):
+        """
+        Args:
+            k: 近傍数（0の場合は特徴量を作らない）
+            eps_km: 距離の重みの 1 / (距離 + eps_km) に足す値（同じ建物の物件用）
+            chunk_size: 一度に検索する行数
+            workers: 検索の並列数（-1は全コア）
+        """
+        self.k = k
+        self.eps_km = eps_km
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self._trees: Dict[FrozenSet[int], Tuple[Optional[cKDTree], np.ndarray]] = {}
+
+    def __getstate__(self) -> dict:
+        """pickle時は木を含めない（必要になった時点で作り直す）"""
+        state = self.__dict__.copy()
+        state["_trees"] = {}
+        return state
+
+    def fit(
+        self,
+        train: pd.DataFrame,
+        target: pd.Series,
+        fold_ids: np.ndarray,
+        lat_col: str = "lat",
+        lon_col: str = "lon",
+    ) -> "OOFKNNPriceEncoder":
+        """
+        学習データの緯度経度と目的変数を保持
+
+        Args:
+            train: 緯度経度を含む学習データ
+            target: 目的変数（対数価格）
+            fold_ids: 各行の検証fold番号（make_fold_idsの戻り値）
+            lat_col: 緯度のカラム名
+            lon_col: 経度のカラム名
+
+        Returns:
+            self
+        """
+        self.index = train.index
+        self.fold_ids = np.asarray(fold_ids, dtype=np.int64)
+        self.lat = train[lat_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.lon = train[lon_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.y = target.to_numpy(dtype=np.float64)
+        self._trees = {}
+        return self
+
+    @property
+    def prefix(self) -> str:
+        """特徴量名の接頭辞"""
+        return f"knn{self.k}"
+
+    def _tree(self, excluded: FrozenSet[int]) -> Tuple[Optional[cKDTree], np.ndarray]:
+        """excludedのfoldを除いた学習データの木と、木の点に対応する行番号"""
+        if excluded not in self._trees:
+            rows = np.flatnonzero(
+                ~np.isin(self.fold_ids, list(excluded))
+                & ~np.isnan(self.lat)
+                & ~np.isnan(self.lon)
+            )
+            tree = (
+                build_spherical_tree(self.lat[rows], self.lon[rows])
+                if len(rows)
+                else None
+            )
+            self._trees[excluded] = (tree, rows)
+        return self._trees[excluded]
+
+    def _neighbor_stats(
+        self, excluded: FrozenSet[int], lat: np.ndarray, lon: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """excludedのfoldを除いた学習データの近傍の統計量"""
+        p = self.prefix
+        result = {f"{p}_{name}": np.full(len(lat), np.nan) for name in STAT_NAMES}
+
+        tree, tree_rows = self._tree(excluded)
+        if tree is None:
+            return result
+
+        for start in range(0, len(lat), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            distances, indices = query_nearest(
+                tree, lat[chunk], lon[chunk], k=self.k, workers=self.workers
+            )
+            # 緯度経度が欠損している行は欠損のまま
+            valid = indices[:, 0] >= 0
+            distances, indices = distances[valid], indices[valid]
+            stats = _price_stats(p, distances, self.y[tree_rows[indices]], self.eps_km)
+
+            rows = np.arange(start, start + len(valid))[valid]
+            for name, values in stats.items():
+                result[name][rows] = values
+
+        return result
+
+    def fold_features(
+        self,
+        fold: int,
+        cache: Optional[FeatureCache] = None,
+        cache_key: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """
+        CVのfold foldで学習するモデル用の学習データの特徴量
+
+        Args:
+            fold: CVのfold番号（検証fold）
+            cache: foldごとの結果を保存するキャッシュ
+            cache_key: キャッシュキー（fitの入力とパラメータから作成したもの）
+
+        Returns:
+            学習データと同じindexのDataFrame
+        """
+        if self.k == 0:
+            return pd.DataFrame(index=self.index)
+        if cache is not None:
+            cached = cache.get("oof_knn_price", f"{cache_key}_fold{fold}")
+            if cached is not None:
+                return cached["features"]
+
+        features = None
+        # 行の自身のfoldごとに、除くfoldの組み合わせが同じ行をまとめて検索する
+        for row_fold in np.unique(self.fold_ids):
+            rows = np.flatnonzero(self.fold_ids == row_fold)
+            stats = self._neighbor_stats(
+                frozenset({fold, int(row_fold)}), self.lat[rows], self.lon[rows]
+            )
+            if features is None:
+                features = {name: np.full(len(self.y), np.nan) for name in stats}
+            for name, values in stats.items():
+                features[name][rows] = values
+
+        result = pd.DataFrame(features, index=self.index)
+        if cache is not None:
+            cache.put("oof_knn_price", f"{cache_key}_fold{fold}", {"features": result})
+        return result
+
+    def test_features(
+        self,
+        test: pd.DataFrame,
+        fold: int,
+        lat_col: str = "lat",
+        lon_col: str = "lon",
+    ) -> pd.DataFrame:
+        """
+        CVのfold foldで学習したモデル用のテストデータの特徴量
+
+        Args:
+            test: 緯度経度を含むテストデータ
+            fold: CVのfold番号（検証fold）
+            lat_col: 緯度のカラム名
+            lon_col: 経度のカラム名
+
+        Returns:
+            テストデータと同じindexのDataFrame
+        """
+        if self.k == 0:
+            return pd.DataFrame(index=test.index)
+
+        stats = self._neighbor_stats(
+            frozenset({fold}),
+            test[lat_col].to_numpy(dtype=np.float64, na_value=np.nan),
+            test[lon_col].to_numpy(dtype=np.float64, na_value=np.nan),
+        )
+        return pd.DataFrame(stats, index=test.index)
+
+
+class OOFTemporalKNNEncoder:
+    """
+    過去の時点の近傍物件の価格の特徴量を計算するエンコーダ（Out-of-Fold）
+
+    各物件について、自身のtarget_ymより前の時点の学習データから近いk件の
+    価格を集計する。木は（時点, fold）ごとに作り、検索では対象の時点・foldの
+    木からk件ずつ取り出して近い順にk件を選ぶ。foldの除き方は
+    OOFKNNPriceEncoderと同じ。最初の時点の物件は過去の物件がないため欠損。
+
+    特徴量: tknn{k}_price_mean, tknn{k}_price_median, tknn{k}_price_wmean,
+    tknn{k}_distance_mean（km）, tknn{k}_months_ago_mean（近傍の時点までの月数）
+    """
+
+    def __init__(
+        self,
+        k: int = 10,
+        eps_km: float = 0.05,
+        max_lag_months: Optional[int] = None,
+        chunk_size: int = 200_000,
+        workers: int = -1,
+    ):
+        """
+        Args:
+            k: 近傍数（0の場合は特徴量を作らない）
+            eps_km: 距離の重みの 1 / (距離 + eps_km) に足す値
+            max_lag_months: 何か月前の時点までを対象にするか（Noneの場合は全期間）
+            chunk_size: 一度に検索する行数
+            workers: 検索の並列数（-1は全コア）
+        """
+        self.k = k
+        self.eps_km = eps_km
+        self.max_lag_months = max_lag_months
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self._trees: Dict[Tuple[int, int], Tuple[Optional[cKDTree], np.ndarray]] = {}
+
+    def __getstate__(self) -> dict:
+        """pickle時は木を含めない（必要になった時点で作り直す）"""
+        state = self.__dict__.copy()
+        state["_trees"] = {}
+        return state
+
+    def fit(
+        self,
+        train: pd.DataFrame,
+        target: pd.Series,
+        fold_ids: np.ndarray,
+        lat_col: str = "lat",
+        lon_col: str = "lon",
+        time_col: str = "target_ym",
+    ) -> "OOFTemporalKNNEncoder":
+        """
+        学習データの緯度経度・時点と目的変数を保持
+
+        Args:
+            train: 緯度経度と時点を含む学習データ
+            target: 目的変数（対数価格）
+            fold_ids: 各行の検証fold番号（make_fold_idsの戻り値）
+            lat_col: 緯度のカラム名
+            lon_col: 経度のカラム名
+            time_col: 時点（YYYYMM）のカラム名
+
+        Returns:
+            self
+        """
+        self.index = train.index
+        self.fold_ids = np.asarray(fold_ids, dtype=np.int64)
+        self.folds = np.unique(self.fold_ids)
+        self.lat = train[lat_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.lon = train[lon_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.months = _months(train[time_col])
+        self.periods = np.unique(self.months)
+        self.y = target.to_numpy(dtype=np.float64)
+        self.time_col = time_col
+        self._trees = {}
+        return self
+
+    @property
+    def prefix(self) -> str:
+        """特徴量名の接頭辞"""
+        return f"tknn{self.k}"
+
+    def _tree(self, period: int, fold: int) -> Tuple[Optional[cKDTree], np.ndarray]:
+        """時点period・fold foldの学習データの木と、木の点に対応する行番号"""
+        if (period, fold) not in self._trees:
+            rows = np.flatnonzero(
+                (self.months == period)
+                & (self.fold_ids == fold)
+                & ~np.isnan(self.lat)
+                & ~np.isnan(self.lon)
+            )
+            tree = (
+                build_spherical_tree(self.lat[rows], self.lon[rows])
+                if len(rows)
+                else None
+            )
+            self._trees[(period, fold)] = (tree, rows)
+        return self._trees[(period, fold)]
+
+    def _source_trees(
+        self, period: int, folds: FrozenSet[int]
+    ) -> List[Tuple[cKDTree, np.ndarray]]:
+        """時点periodの物件の近傍を探す木（より前の時点・対象のfold）"""
+        periods = self.periods[self.periods < period]
+        if self.max_lag_months is not None:
+            periods = periods[periods >= period - self.max_lag_months]
+        trees = [self._tree(int(p), int(f)) for p in periods for f in sorted(folds)]
+        return [(tree, rows) for tree, rows in trees if tree is not None]
+
+    def _neighbor_stats(
+        self,
+        folds: FrozenSet[int],
+        months: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+    ) -> Dict[str, np.ndarray]:
+        """foldsの学習データのうち、各行より前の時点の近傍の統計量"""
+        p = self.prefix
+        names = [*STAT_NAMES, "months_ago_mean"]
+        result = {f"{p}_{name}": np.full(len(lat), np.nan) for name in names}
+
+        has_coords = ~np.isnan(lat) & ~np.isnan(lon)
+        for period in np.unique(months):
+            trees = self._source_trees(int(period), folds)
+            if not trees:
+                continue
+            period_rows = np.flatnonzero((months == period) & has_coords)
+            for start in range(0, len(period_rows), self.chunk_size):
+                rows = period_rows[start : start + self.chunk_size]
+                # 木ごとの近傍k件を横に並べ、全体で近いk件を選ぶ
+                distances, neighbors = [], []
+                for tree, tree_rows in trees:
+                    d, i = query_nearest(
+                        tree, lat[rows], lon[rows], k=self.k, workers=self.workers
+                    )
+                    distances.append(d)
+                    neighbors.append(tree_rows[i])
+                distances = np.hstack(distances)
+                neighbors = np.hstack(neighbors)
+                k = min(self.k, distances.shape[1])
+                nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                distances = np.take_along_axis(distances, nearest, axis=1)
+                neighbors = np.take_along_axis(neighbors, nearest, axis=1)
+
+                stats = _price_stats(p, distances, self.y[neighbors], self.eps_km)
+                stats[f"{p}_months_ago_mean"] = (period - self.months[neighbors]).mean(
+                    axis=1
+                )
+                for name, values in stats.items():
+                    result[name][rows] = values
+
+        return result
+
+    def fold_features(
+        self,
+        fold: int,
+        cache: Optional[FeatureCache] = None,
+        cache_key: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """
+        CVのfold foldで学習するモデル用の学習データの特徴量
+
+        Args:
+            fold: CVのfold番号（検証fold）
+            cache: foldごとの結果を保存するキャッシュ
+            cache_key: キャッシュキー（fitの入力とパラメータから作成したもの）
+
+        Returns:
+            学習データと同じindexのDataFrame
+        """
+        if self.k == 0:
+            return pd.DataFrame(index=self.index)
+        if cache is not None:
+            cached = cache.get("oof_temporal_knn_price", f"{cache_key}_fold{fold}")
+            if cached is not None:
+                return cached["features"]
+
+        features = None
+        for row_fold in self.folds:
+            rows = np.flatnonzero(self.fold_ids == row_fold)
+            stats = self._neighbor_stats(
+                frozenset(self.folds.tolist()) - {fold, int(row_fold)},
+                self.months[rows],
+                self.lat[rows],
+                self.lon[rows],
+            )
+            if features is None:
+                features = {name: np.full(len(self.y), np.nan) for name in stats}
+            for name, values in stats.items():
+                features[name][rows] = values
+
+        result = pd.DataFrame(features, index=self.index)
+        if cache is not None:
+            cache.put(
+                "oof_temporal_knn_price",
+                f"{cache_key}_fold{fold}",
+                {"features": result},
+            )
+        return result
+
+    def test_features(
+        self,
+        test: pd.DataFrame,
+        fold: int,
+        lat_col: str = "lat",
+        lon_col: str = "lon",
+    ) -> pd.DataFrame:
+        """
+        CVのfold foldで学習したモデル用のテストデータの特徴量
+
+        Args:
+            test: 緯度経度と時点を含むテストデータ
+            fold: CVのfold番号（検証fold）
+            lat_col: 緯度のカラム名
+            lon_col: 経度のカラム名
+
+        Returns:
+            テストデータと同じindexのDataFrame
+        """
+        if self.k == 0:
+            return pd.DataFrame(index=test.index)
+
+        stats = self._neighbor_stats(
+            frozenset(self.folds.tolist()) - {fold},
+            _months(test[self.time_col]),
+            test[lat_col].to_numpy(dtype=np.float64, na_value=np.nan),
+            test[lon_col].to_numpy(dtype=np.float64, na_value=np.nan),
+        )
+        return pd.DataFrame(stats, index=test.index)
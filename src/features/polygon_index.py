@@ -0,0 +1,413 @@
+"""
+格子インデックスによるポリゴンの内外判定（point in polygon）
+
+ポリゴンのレイヤー（行政区域・用途地域など）を一様な格子に分割し、
+セルごとに「完全に内側のポリゴン」と「境界が通るポリゴン（セル内の辺と
+セル中心の内外）」を前もって求めておく。点の判定は、セルの参照と、
+セル中心から点までの線分とセル内の辺との交差数の偶奇だけで済むため、
+ポリゴンの頂点数によらず配列演算で高速に処理できる。
+
+インデックスはnpzに保存でき、ProcessPoolExecutorで複数コアに分割して判定する。
+"""
+
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# ポリゴンに含まれない点のID
+OUTSIDE = -1
+
+# save/loadで保存する配列
+INDEX_ARRAYS = (
+    "origin",
+    "shape",
+    "cell_size",
+    "full_offsets",
+    "full_features",
+    "boundary_offsets",
+    "boundary_features",
+    "boundary_center_inside",
+    "edge_offsets",
+    "edges",
+    "fingerprint",
+)
+
+
+def _expand_csr(offsets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    CSR形式の行rowsの要素を展開
+
+    Returns:
+        各要素の rows 内の位置, 各要素の位置（offsetsで参照する配列の添字）
+    """
+    starts = offsets[rows]
+    counts = offsets[rows + 1] - starts
+    row_positions = np.repeat(np.arange(len(rows)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    positions = np.arange(counts.sum()) - first + np.repeat(starts, counts)
+    return row_positions, positions
+
+
+def _group_csr(keys: np.ndarray, n_keys: int) -> Tuple[np.ndarray, np.ndarray]:
+    """キーでソートした順序とCSRのオフセット"""
+    order = np.argsort(keys, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=n_keys))])
+    return order, offsets
+
+
+def geometry_fingerprint(
+    coords: np.ndarray, ring_offsets: np.ndarray, part_offsets: np.ndarray
+) -> str:
+    """
+    ポリゴンの頂点とオフセットのハッシュ（保存したインデックスとレイヤーの照合用）
+
+    Args:
+        coords: 全リングの頂点 (lon, lat)（Layer.coords）
+        ring_offsets: リングごとの頂点の開始位置（Layer.ring_offsets）
+        part_offsets: 地物ごとのリングの開始位置（Layer.part_offsets）
+
+    Returns:
+        SHA-256の16進文字列
+    """
+    digest = hashlib.sha256()
+    for values, dtype in [
+        (coords, np.float64),
+        (ring_offsets, np.int64),
+        (part_offsets, np.int64),
+    ]:
+        digest.update(np.ascontiguousarray(values, dtype=dtype).tobytes())
+    return digest.hexdigest()
+
+
+def _cross(ox, oy, ax, ay, bx, by) -> np.ndarray:
+    """外積 (a - o) × (b - o)"""
+    return (ax - ox) * (by - oy) - (ay - oy) * (bx - ox)
+
+
+class PolygonIndex:
+    """
+    ポリゴンのレイヤーの格子インデックス
+
+    ポリゴンが重なる場合、点はいずれか1つのポリゴンに割り当てる。
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        """
+        Args:
+            arrays: INDEX_ARRAYSの配列（build または load で作成する）
+        """
+        for name in INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(
+        cls,
+        coords: np.ndarray,
+        ring_offsets: np.ndarray,
+        part_offsets: np.ndarray,
+        cell_size: float = 0.01,
+    ) -> "PolygonIndex":
+        """
+        ポリゴンのリングから格子インデックスを作成
+
+        Args:
+            coords: 全リングの頂点 (lon, lat)（Layer.coords）
+            ring_offsets: リングごとの頂点の開始位置（Layer.ring_offsets）
+            part_offsets: 地物ごとのリングの開始位置（Layer.part_offsets）
+            cell_size: セルの大きさ（度）
+
+        Returns:
+            PolygonIndex
+        """
+        n_features = len(part_offsets) - 1
+        ring_feature = np.repeat(np.arange(n_features), np.diff(part_offsets))
+
+        # 辺: リング内の連続する頂点（閉じていないリングは始点に戻る辺を加える）
+        starts = []
+        ends = []
+        for r in range(len(ring_offsets) - 1):
+            ring = np.arange(ring_offsets[r], ring_offsets[r + 1])
+            starts.append(ring)
+            ends.append(np.roll(ring, -1))
+        starts = np.concatenate(starts)
+        ends = np.concatenate(ends)
+        edges = np.column_stack([coords[starts], coords[ends]])
+        edge_feature = ring_feature[
+            np.repeat(np.arange(len(ring_offsets) - 1), np.diff(ring_offsets))
+        ]
+
+        origin = coords.min(axis=0)
+        shape = (np.floor((coords.max(axis=0) - origin) / cell_size) + 1).astype(
+            np.int64
+        )
+        nx, ny = shape
+
+        def cell_range(lower: np.ndarray, upper: np.ndarray, axis: int):
+            low = np.floor((lower - origin[axis]) / cell_size).astype(np.int64)
+            high = np.floor((upper - origin[axis]) / cell_size).astype(np.int64)
+            return np.clip(low, 0, shape[axis] - 1), np.clip(high, 0, shape[axis] - 1)
+
+        # 辺が通るセル（辺の外接矩形のセル）
+        x_low, x_high = cell_range(
+            np.minimum(edges[:, 0], edges[:, 2]),
+            np.maximum(edges[:, 0], edges[:, 2]),
+            0,
+        )
+        y_low, y_high = cell_range(
+            np.minimum(edges[:, 1], edges[:, 3]),
+            np.maximum(edges[:, 1], edges[:, 3]),
+            1,
+        )
+        widths = x_high - x_low + 1
+        counts = widths * (y_high - y_low + 1)
+        edge_ids = np.repeat(np.arange(len(edges)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        edge_cells = (y_low[edge_ids] + local // widths[edge_ids]) * nx + (
+            x_low[edge_ids] + local % widths[edge_ids]
+        )
+
+        # 境界のセル×ポリゴン（と、そのセル内の辺）
+        boundary_keys = edge_cells * n_features + edge_feature[edge_ids]
+        boundary_unique, boundary_of_edge = np.unique(
+            boundary_keys, return_inverse=True
+        )
+        boundary_cells = boundary_unique // n_features
+        boundary_features = boundary_unique % n_features
+
+        # セル中心の内外（ポリゴンごとに、セルの行の中心を通る水平線との交点で判定）
+        full_keys = []
+        center_inside = np.zeros(len(boundary_unique), dtype=bool)
+        edge_order, feature_edge_offsets = _group_csr(edge_feature, n_features)
+        for f in range(n_features):
+            f_edges = edges[
+                edge_order[feature_edge_offsets[f] : feature_edge_offsets[f + 1]]
+            ]
+            (col_low, col_high), (row_low, row_high) = (
+                cell_range(f_edges[:, [0, 2]].min(), f_edges[:, [0, 2]].max(), 0),
+                cell_range(f_edges[:, [1, 3]].min(), f_edges[:, [1, 3]].max(), 1),
+            )
+            cols = np.arange(col_low, col_high + 1)
+            center_x = origin[0] + (cols + 0.5) * cell_size
+            x1, y1, x2, y2 = f_edges.T
+            for row in range(row_low, row_high + 1):
+                center_y = origin[1] + (row + 0.5) * cell_size
+                crossing = (y1 > center_y) != (y2 > center_y)
+                cross_x = np.sort(
+                    x1[crossing]
+                    + (center_y - y1[crossing])
+                    * (x2[crossing] - x1[crossing])
+                    / (y2[crossing] - y1[crossing])
+                )
+                # 右側の交点の数が奇数なら内側
+                n_right = len(cross_x) - np.searchsorted(
+                    cross_x, center_x, side="right"
+                )
+                inside_cells = row * nx + cols[n_right % 2 == 1]
+                full_keys.append(inside_cells * n_features + f)
+
+        full_keys = np.concatenate(full_keys) if full_keys else np.empty(0, np.int64)
+        is_boundary = np.isin(full_keys, boundary_unique)
+        center_inside[np.searchsorted(boundary_unique, full_keys[is_boundary])] = True
+        full_keys = full_keys[~is_boundary]
+
+        n_cells = int(nx * ny)
+        full_order, full_offsets = _group_csr(full_keys // n_features, n_cells)
+        _, boundary_offsets = _group_csr(boundary_cells, n_cells)
+        boundary_edge_order, edge_offsets = _group_csr(
+            boundary_of_edge, len(boundary_unique)
+        )
+
+        return cls(
+            {
+                "origin": origin,
+                "shape": shape,
+                "cell_size": np.float64(cell_size),
+                "full_offsets": full_offsets,
+                "full_features": (full_keys % n_features)[full_order],
+                "boundary_offsets": boundary_offsets,
+                "boundary_features": boundary_features,
+                "boundary_center_inside": center_inside,
+                "edge_offsets": edge_offsets,
+                "edges": edges[edge_ids[boundary_edge_order]],
+                "fingerprint": np.array(
+                    geometry_fingerprint(coords, ring_offsets, part_offsets)
+                ),
+            }
+        )
+
+    def matches(
+        self,
+        coords: np.ndarray,
+        ring_offsets: np.ndarray,
+        part_offsets: np.ndarray,
+        cell_size: float,
+    ) -> bool:
+        """
+        同じポリゴン・セルの大きさから作成したインデックスか
+
+        Args:
+            coords: 全リングの頂点 (lon, lat)（Layer.coords）
+            ring_offsets: リングごとの頂点の開始位置（Layer.ring_offsets）
+            part_offsets: 地物ごとのリングの開始位置（Layer.part_offsets）
+            cell_size: セルの大きさ（度）
+
+        Returns:
+            一致する場合True
+        """
+        return bool(self.cell_size == cell_size) and str(
+            self.fingerprint
+        ) == geometry_fingerprint(coords, ring_offsets, part_offsets)
+
+    def _cells(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """点のセル番号（格子の外・欠損値は-1）"""
+        cx = np.floor((lon - self.origin[0]) / self.cell_size)
+        cy = np.floor((lat - self.origin[1]) / self.cell_size)
+        valid = (cx >= 0) & (cx < self.shape[0]) & (cy >= 0) & (cy < self.shape[1])
+        cells = np.where(valid, cy, 0) * self.shape[0] + np.where(valid, cx, 0)
+        return np.where(valid, cells, -1).astype(np.int64)
+
+    def query(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """
+        各点を含むポリゴンの番号
+
+        Args:
+            lat: 緯度
+            lon: 経度
+
+        Returns:
+            ポリゴンの番号（地物の順序、どのポリゴンにも含まれない点は-1）
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        result = np.full(len(lat), OUTSIDE, dtype=np.int64)
+        points = np.flatnonzero(self._cells(lon, lat) >= 0)
+        cells = self._cells(lon[points], lat[points])
+
+        # 完全に内側のセル
+        has_full = np.diff(self.full_offsets)[cells] > 0
+        result[points[has_full]] = self.full_features[
+            self.full_offsets[cells[has_full]]
+        ]
+
+        # 境界のセル: セル中心から点までの線分と辺の交差数の偶奇で中心の内外を反転
+        pair_points, entries = _expand_csr(self.boundary_offsets, cells)
+        pair_ids, edge_positions = _expand_csr(self.edge_offsets, entries)
+        px = lon[points[pair_points]][pair_ids]
+        py = lat[points[pair_points]][pair_ids]
+        pair_cells = cells[pair_points][pair_ids]
+        cx = self.origin[0] + (pair_cells % self.shape[0] + 0.5) * self.cell_size
+        cy = self.origin[1] + (pair_cells // self.shape[0] + 0.5) * self.cell_size
+        ax, ay, bx, by = self.edges[edge_positions].T
+        crossed = (_cross(ax, ay, bx, by, px, py) > 0) != (
+            _cross(ax, ay, bx, by, cx, cy) > 0
+        )
+        crossed &= (_cross(px, py, cx, cy, ax, ay) > 0) != (
+            _cross(px, py, cx, cy, bx, by) > 0
+        )
+
+        parity = np.bincount(pair_ids[crossed], minlength=len(entries)) % 2 == 1
+        inside = parity != self.boundary_center_inside[entries]
+        result[points[pair_points[inside]]] = self.boundary_features[entries[inside]]
+        return result
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        npzで保存（セルの大きさと、作成元のポリゴンのハッシュを含む）
+
+        Args:
+            path: 保存先のパス
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, **{name: getattr(self, name) for name in INDEX_ARRAYS})
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "PolygonIndex":
+        """
+        saveで保存したインデックスを読み込み
+
+        Args:
+            path: 保存したパス
+
+        Returns:
+            PolygonIndex
+        """
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in INDEX_ARRAYS if name in data.files}
+        # ハッシュを含まない古いファイルはどのレイヤーとも一致しない
+        arrays.setdefault("fingerprint", np.array(""))
+        return cls(arrays)
+
+
+# ワーカープロセスごとに1回だけ受け取るインデックス
+_worker_index: Optional[PolygonIndex] = None
+
+
+def _init_worker(index: PolygonIndex) -> None:
+    global _worker_index
+    _worker_index = index
+
+
+def _query_worker(points: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    return _worker_index.query(*points)
+
+
+def assign_polygons(
+    index: PolygonIndex,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    batch_size: int = 200_000,
+    n_jobs: int = -1,
+) -> np.ndarray:
+    """
+    各点を含むポリゴンの番号をバッチごとに複数プロセスで判定
+
+    Args:
+        index: PolygonIndex
+        lat: 緯度
+        lon: 経度
+        batch_size: 1回の判定の行数
+        n_jobs: プロセス数（-1は全コア、1の場合は現在のプロセスで判定）。
+            2以上の場合はspawnで起動したプロセスが __main__ を読み込み直すため、
+            スクリプトから呼ぶ場合は本体を if __name__ == "__main__": の中に置く
+
+    Returns:
+        ポリゴンの番号（どのポリゴンにも含まれない点は-1）
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    batches = [
+        (lat[start : start + batch_size], lon[start : start + batch_size])
+        for start in range(0, len(lat), batch_size)
+    ]
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    n_jobs = max(1, min(n_jobs, len(batches)))
+
+    start = time.perf_counter()
+    if n_jobs == 1:
+        results = [index.query(*batch) for batch in batches]
+    else:
+        # パイプラインのスレッドから呼ばれても安全なようにspawnで起動する
+        with ProcessPoolExecutor(
+            n_jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(index,),
+        ) as executor:
+            results = list(executor.map(_query_worker, batches))
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        f"point in polygon: {len(lat):,}行, {n_jobs}プロセス, "
+        f"{len(lat) / max(elapsed, 1e-9):,.0f}行/秒"
+    )
+    return np.concatenate(results) if results else np.empty(0, dtype=np.int64)
@@ -0,0 +1,181 @@
+"""
+空間インデックス（geohash・地域メッシュ）による格子セルの割り当て
+
+K-meansと異なり学習が不要で、同じ緯度経度には常に同じセルIDが割り当てられる。
+すべての計算は配列演算で行う。
+"""
+
+from typing import List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.utils.frame import append_columns
+
+GEOHASH_BASE32 = np.frombuffer(b"0123456789bcdefghjkmnpqrstuvwxyz", dtype=np.uint8)
+# geohashの最大精度（5bit × 12文字 = 60bitがint64に収まる）
+GEOHASH_MAX_PRECISION = 12
+# 緯度経度が欠損している行のセルID
+MISSING_GEOHASH = "missing"
+MISSING_MESH = -1
+
+
+def _quantize(values: np.ndarray, lower: float, upper: float, bits: int) -> np.ndarray:
+    """[lower, upper) を 2**bits 等分したときの区間番号"""
+    cells = np.floor((values - lower) / (upper - lower) * (1 << bits))
+    return np.clip(cells, 0, (1 << bits) - 1).astype(np.int64)
+
+
+def _spread_bits(values: np.ndarray, bits: int) -> np.ndarray:
+    """各bitの間に0を挟む（bit iを2iの位置に移す）"""
+    spread = np.zeros_like(values)
+    for i in range(bits):
+        spread |= ((values >> i) & 1) << (2 * i)
+    return spread
+
+
+def geohash_encode(lat: np.ndarray, lon: np.ndarray, precision: int = 6) -> np.ndarray:
+    """
+    緯度経度をgeohashに変換
+
+    Args:
+        lat: 緯度
+        lon: 経度
+        precision: 文字数（1〜12）
+
+    Returns:
+        geohashの配列（object型、欠損値は"missing"）
+    """
+    if not 1 <= precision <= GEOHASH_MAX_PRECISION:
+        raise ValueError(f"precisionは1〜{GEOHASH_MAX_PRECISION}です: {precision}")
+
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+
+    # 経度が偶数bit、緯度が奇数bit（上位から経度・緯度の順に交互）
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    lon_cells = _quantize(np.where(valid, lon, 0.0), -180.0, 180.0, lon_bits)
+    lat_cells = _quantize(np.where(valid, lat, 0.0), -90.0, 90.0, lat_bits)
+    if total_bits % 2 == 0:
+        interleaved = (_spread_bits(lon_cells, lon_bits) << 1) | _spread_bits(
+            lat_cells, lat_bits
+        )
+    else:
+        interleaved = _spread_bits(lon_cells, lon_bits) | (
+            _spread_bits(lat_cells, lat_bits) << 1
+        )
+
+    # 5bitずつ上位から文字に変換
+    shifts = 5 * np.arange(precision - 1, -1, -1)
+    chars = GEOHASH_BASE32[(interleaved[:, None] >> shifts) & 31]
+    hashes = np.ascontiguousarray(chars).view(f"S{precision}").ravel().astype(str)
+
+    result = hashes.astype(object)
+    result[~valid] = MISSING_GEOHASH
+    return result
+
+
+def jis_mesh_code(lat: np.ndarray, lon: np.ndarray, level: int = 3) -> np.ndarray:
+    """
+    緯度経度をJIS地域メッシュコード（JIS X 0410）に変換
+
+    1次メッシュ: 緯度40分×経度1度（4桁）
+    2次メッシュ: 緯度5分×経度7.5分（6桁）
+    3次メッシュ: 緯度30秒×経度45秒（8桁）
+
+    Args:
+        lat: 緯度
+        lon: 経度
+        level: メッシュの次数（1〜3）
+
+    Returns:
+        メッシュコード（int64、欠損値は-1）
+    """
+    if level not in (1, 2, 3):
+        raise ValueError(f"levelは1〜3です: {level}")
+
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+
+    # 3次メッシュの大きさ（緯度30秒=1/120度、経度45秒=1/80度）を単位とした番号
+    # 浮動小数点の誤差で境界上の点が1つ下のセルに入らないよう微小値を足す
+    lat_units = np.floor(np.where(valid, lat, 0.0) * 120 + 1e-9).astype(np.int64)
+    lon_units = np.floor((np.where(valid, lon, 100.0) - 100) * 80 + 1e-9).astype(
+        np.int64
+    )
+
+    code = (lat_units // 80) * 100 + lon_units // 80
+    if level >= 2:
+        code = code * 100 + (lat_units % 80) // 10 * 10 + (lon_units % 80) // 10
+    if level >= 3:
+        code = code * 100 + (lat_units % 10) * 10 + lon_units % 10
+
+    return np.where(valid, code, MISSING_MESH)
+
+
+def spatial_cell_columns(
+    geohash_precisions: Sequence[int] = (), mesh_levels: Sequence[int] = ()
+) -> List[str]:
+    """
+    add_spatial_cellsが追加する列名
+
+    Args:
+        geohash_precisions: geohashの精度
+        mesh_levels: 地域メッシュの次数
+
+    Returns:
+        列名のリスト
+    """
+    return [f"geohash{p}" for p in geohash_precisions] + [
+        f"mesh{level}" for level in mesh_levels
+    ]
+
+
+def add_spatial_cells(
+    df: pd.DataFrame,
+    lat_col: str = "lat",
+    lon_col: str = "lon",
+    geohash_precisions: Sequence[int] = (5, 6),
+    mesh_levels: Sequence[int] = (1, 2, 3),
+    inplace: bool = False,
+) -> pd.DataFrame:
+    """
+    複数の解像度の格子セルIDを追加
+
+    追加した列は create_cluster_aggregation_features の cluster_col や
+    create_target_encoding_features の categorical_cols にそのまま指定できる。
+
+    Args:
+        df: DataFrame
+        lat_col: 緯度のカラム名
+        lon_col: 経度のカラム名
+        geohash_precisions: geohashの精度（列名: geohash{精度}）
+        mesh_levels: 地域メッシュの次数（列名: mesh{次数}）
+        inplace: Trueの場合、元の列をコピーせずdfに直接列を追加する
+
+    Returns:
+        DataFrame
+    """
+    print("\n[Spatial Cells]")
+
+    lat = df[lat_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    lon = df[lon_col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    new_columns = {}
+    for precision in geohash_precisions:
+        new_columns[f"geohash{precision}"] = geohash_encode(lat, lon, precision)
+    for level in mesh_levels:
+        new_columns[f"mesh{level}"] = jis_mesh_code(lat, lon, level)
+
+    if not new_columns:
+        return df if inplace else df.copy()
+
+    df_copy = append_columns(df, new_columns, inplace=inplace)
+
+    print(f"  - Spatial cells: {len(new_columns)} features")
+
+    return df_copy
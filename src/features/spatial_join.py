@@ -0,0 +1,110 @@
+"""
+国土数値情報のレイヤーと物件の空間結合
+
+行をbatch_size行ずつ処理するため、学習・テストデータの全件でも
+使用メモリは出力の特徴量と1バッチ分の検索結果に収まる。
+"""
+
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+from src.data.kokudo import POLYGON, Layer
+from src.features.distance import count_within, query_nearest
+from src.features.polygon_index import assign_polygons
+from src.utils.frame import append_columns
+from src.utils.unique import broadcast_unique
+
+
+def _radius_label(radius_km: float) -> str:
+    """半径の列名（0.5 -> 0.5km）"""
+    return f"{radius_km:g}km"
+
+
+def spatial_join_features(
+    df: pd.DataFrame,
+    layers: Dict[str, Layer],
+    specs: Dict[str, Dict[str, Any]],
+    lat_col: str = "lat",
+    lon_col: str = "lon",
+    batch_size: int = 200_000,
+    inplace: bool = False,
+) -> pd.DataFrame:
+    """
+    国土数値情報のレイヤーの特徴量を追加
+
+    点のレイヤー（駅・学校・病院・地価公示など）ごとに以下を追加する。
+    - {name}_nearest_km: 最寄りの地物までの大円距離
+    - {name}_count_{r}km: 半径r km以内の地物数（radii_km）
+    - {name}_{attribute}: 最寄りの地物の属性（attributes、地価など）
+
+    ポリゴンのレイヤー（行政区域・用途地域など）は、点を含むポリゴンの属性
+    {name}_{attribute} を追加する（どのポリゴンにも含まれない場合は欠損）。
+    内外判定は既定では現在のプロセスで行う（n_jobsを2以上にするとspawnで起動した
+    プロセスで並列に行うため、呼び出し元のスクリプトには __main__ のガードが必要）。
+
+    Args:
+        df: DataFrame
+        layers: レイヤー名 -> Layer（load_layersの戻り値）
+        specs: レイヤー名 -> {"radii_km": 半径のリスト, "attributes": 属性のリスト,
+            "n_jobs": ポリゴンの内外判定のプロセス数（既定は1）}
+        lat_col: 緯度のカラム名
+        lon_col: 経度のカラム名
+        batch_size: 一度に処理する行数
+        inplace: Trueの場合、元の列をコピーせずdfに直接列を追加する
+
+    Returns:
+        DataFrame
+    """
+    print("\n[Spatial Join Features]")
+
+    lat = df[lat_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    lon = df[lon_col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    new_columns = {}
+    for name, spec in specs.items():
+        layer = layers[name]
+        if layer.kind == POLYGON:
+            polygon_ids = assign_polygons(
+                layer.index,
+                lat,
+                lon,
+                batch_size=batch_size,
+                n_jobs=spec.get("n_jobs", 1),
+            )
+            for attribute in spec.get("attributes", []):
+                new_columns[f"{name}_{attribute}"] = broadcast_unique(
+                    layer.attributes[attribute], polygon_ids
+                )
+            continue
+
+        radii = list(spec.get("radii_km", []))
+        nearest_km = np.empty(len(df))
+        nearest_idx = np.empty(len(df), dtype=np.int64)
+        counts = {radius: np.empty(len(df)) for radius in radii}
+
+        for start in range(0, len(df), batch_size):
+            batch = slice(start, start + batch_size)
+            distances, indices = query_nearest(layer.tree, lat[batch], lon[batch], k=1)
+            nearest_km[batch], nearest_idx[batch] = distances[:, 0], indices[:, 0]
+            for radius in radii:
+                count = count_within(layer.tree, lat[batch], lon[batch], radius)
+                counts[radius][batch] = np.where(count < 0, np.nan, count)
+
+        new_columns[f"{name}_nearest_km"] = nearest_km
+        for radius in radii:
+            new_columns[f"{name}_count_{_radius_label(radius)}"] = counts[radius]
+        for attribute in spec.get("attributes", []):
+            new_columns[f"{name}_{attribute}"] = broadcast_unique(
+                layer.attributes[attribute], nearest_idx
+            )
+
+    if not new_columns:
+        return df if inplace else df.copy()
+
+    df_copy = append_columns(df, new_columns, inplace=inplace)
+
+    print(f"  - Spatial join: {len(new_columns)} features")
+
+    return df_copy
@@ -0,0 +1,506 @@
+"""
+CVの分割を考慮した目的変数の統計量（Out-of-Fold）
+
+全学習データで計算したクラスタ・カテゴリごとの目的変数の平均は、CVの検証データの
+目的変数を含むためCVスコアが楽観的になる。ここではfold×キーごとの十分統計量
+（件数・和・二乗和）を1回で集計し、CVのfoldごとに該当foldを差し引いて
+統計量を求める。
+
+TargetStatsStoreは同じ十分統計量をキー単位で保持し、月ごとに追加・統合できる。
+"""
+
+import json
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.utils.cache import FeatureCache
+from src.utils.unique import broadcast_unique, factorize_column, lookup_codes
+
+# TargetStatsStoreの保存時に全行の統計量を表す列名
+TOTAL_COLUMN = "__total__"
+
+
+# キー: 列名、または組み合わせる列名のリスト（例: ["city", "building_type"]）
+KeySpec = Union[str, Sequence[str]]
+
+
+def _feature_prefix(col: str) -> str:
+    """特徴量名の接頭辞（create_cluster_aggregation_featuresと同じ規則）"""
+    return "cluster" if col == "geo_cluster" else col
+
+
+def _key_path(key: KeySpec) -> Tuple[str, ...]:
+    """キーを列名のタプルに変換"""
+    return (key,) if isinstance(key, str) else tuple(key)
+
+
+def _key_prefix(path: Tuple[str, ...]) -> str:
+    """組み合わせキーの特徴量名の接頭辞（例: city_x_building_type）"""
+    return "_x_".join(_feature_prefix(col) for col in path)
+
+
+def _combine_codes(
+    parent_codes: np.ndarray, codes: np.ndarray, n_codes: int
+) -> np.ndarray:
+    """2つのコードを1つの整数にまとめる（どちらかが欠損（-1）なら-1）"""
+    combined = parent_codes.astype(np.int64) * n_codes + codes
+    return np.where((parent_codes < 0) | (codes < 0), -1, combined)
+
+
+class OOFTargetEncoder:
+    """
+    CVのfoldごとに目的変数の統計量を計算するエンコーダ
+
+    CVのfold f で学習するモデルには、
+    - 検証データ（fold f）の行: fold f 以外の学習データの統計量
+    - 学習データ（fold g ≠ f）の行: fold f, g 以外の学習データの統計量
+    を特徴量として与える（学習データの行も自身の目的変数を含まない）。
+    テストデータには fold f 以外の学習データの統計量を与える。
+
+    特徴量（キーごと）: {prefix}_target_mean, {prefix}_target_std,
+    {prefix}_target_encoded（平滑化した平均）、{prefix}_count（統計量の計算に
+    使った件数、count_colsのキーのみ。未知・欠損のキーは0）。
+    TargetEncodingTransformerの中央値・最小値・最大値は十分統計量から求まらないため
+    出力しない。
+
+    hierarchies（例: prefecture → city → eki_name1 → geo_cluster）を指定すると、
+    各階層を上位の階層を含めた組み合わせキーとし、上位の階層の平滑化した平均を
+    事前分布として平滑化する。件数の少ない・未知のキーは上位の階層の値に近づく。
+    特徴量（階層ごと）: {prefix}_hier_target_encoded
+
+    各列は一度だけfactorizeし、組み合わせキー・階層は整数コードの合成で求める。
+    """
+
+    def __init__(
+        self,
+        key_cols: List[KeySpec],
+        smoothing: float = 10.0,
+        hierarchies: Optional[List[List[str]]] = None,
+        count_cols: Optional[List[KeySpec]] = None,
+    ):
+        """
+        Args:
+            key_cols: 統計量を計算するキー列（geo_cluster, city など）。
+                列名のリストを渡すと組み合わせキーになる
+            smoothing: 平滑化パラメータ
+            hierarchies: 上位から順に並べた階層の列名のリスト
+            count_cols: 件数を出力するキー列（key_colsの一部、Noneの場合は全て）
+        """
+        self.key_cols = list(key_cols)
+        self.smoothing = smoothing
+        self.hierarchies = [list(levels) for levels in hierarchies or []]
+        self.count_cols = self.key_cols if count_cols is None else list(count_cols)
+
+    def _paths(self) -> List[Tuple[str, ...]]:
+        """統計量を計算するキー（列名のタプル、階層は上位の列を含む）"""
+        paths = [_key_path(key) for key in self.key_cols]
+        for levels in self.hierarchies:
+            paths += [tuple(levels[: i + 1]) for i in range(len(levels))]
+        return list(dict.fromkeys(paths))
+
+    def _fit_codes(self, train: pd.DataFrame, path: Tuple[str, ...]) -> np.ndarray:
+        """学習データのキーのコード（上位のキーのコードを再利用）"""
+        if path in self.codes:
+            return self.codes[path]
+
+        if len(path) == 1:
+            codes, self.uniques[path[0]] = factorize_column(train[path[0]])
+        else:
+            combined = _combine_codes(
+                self._fit_codes(train, path[:-1]),
+                self._fit_codes(train, path[-1:]),
+                len(self.uniques[path[-1]]),
+            )
+            codes = np.full(len(combined), -1, dtype=np.int64)
+            valid = combined >= 0
+            codes[valid], self.path_uniques[path] = pd.factorize(combined[valid])
+
+        self.codes[path] = codes
+        return codes
+
+    def _lookup_codes(
+        self,
+        test: pd.DataFrame,
+        path: Tuple[str, ...],
+        memo: Dict[Tuple[str, ...], np.ndarray],
+    ) -> np.ndarray:
+        """テストデータのキーを学習データのコードに変換（未知・欠損は-1）"""
+        if path not in memo:
+            if len(path) == 1:
+                memo[path] = lookup_codes(self.uniques[path[0]], test[path[0]])
+            else:
+                combined = _combine_codes(
+                    self._lookup_codes(test, path[:-1], memo),
+                    self._lookup_codes(test, path[-1:], memo),
+                    len(self.uniques[path[-1]]),
+                )
+                memo[path] = pd.Index(self.path_uniques[path]).get_indexer(combined)
+        return memo[path]
+
+    def fit(
+        self, train: pd.DataFrame, target: pd.Series, fold_ids: np.ndarray
+    ) -> "OOFTargetEncoder":
+        """
+        fold×キーごとの十分統計量を集計
+
+        Args:
+            train: キー列を含む学習データ
+            target: 目的変数
+            fold_ids: 各行の検証fold番号（make_fold_idsの戻り値）
+
+        Returns:
+            self
+        """
+        self.index = train.index
+        self.fold_ids = np.asarray(fold_ids, dtype=np.int64)
+        self.n_folds = int(self.fold_ids.max()) + 1
+        y = target.to_numpy(dtype=np.float64)
+
+        self.codes: Dict[Tuple[str, ...], np.ndarray] = {}
+        self.uniques: Dict[str, pd.Series] = {}
+        self.path_uniques: Dict[Tuple[str, ...], np.ndarray] = {}
+        self.stats: Dict[Tuple[str, ...], np.ndarray] = {}
+        for path in self._paths():
+            codes = self._fit_codes(train, path)
+            # キー列が全て欠損の場合も1キー分の領域を確保する（全行が事前分布になる）
+            n_keys = max(int(codes.max()) + 1, 1)
+            valid = codes >= 0
+            flat = self.fold_ids[valid] * n_keys + codes[valid]
+            size = self.n_folds * n_keys
+            # [件数, 和, 二乗和] × fold × キー
+            self.stats[path] = np.stack(
+                [
+                    np.bincount(flat, minlength=size),
+                    np.bincount(flat, weights=y[valid], minlength=size),
+                    np.bincount(flat, weights=y[valid] ** 2, minlength=size),
+                ]
+            ).reshape(3, self.n_folds, n_keys)
+
+        # 平滑化の事前分布（foldごとの件数・和）
+        self.fold_totals = np.stack(
+            [
+                np.bincount(self.fold_ids, minlength=self.n_folds),
+                np.bincount(self.fold_ids, weights=y, minlength=self.n_folds),
+            ]
+        )
+        return self
+
+    def _encode(
+        self, stats: np.ndarray, prior: np.ndarray, prefix: str
+    ) -> Dict[str, np.ndarray]:
+        """十分統計量 [件数, 和, 二乗和] から特徴量を計算"""
+        count, total, total_sq = stats
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, total / count, np.nan)
+            var = (total_sq - total * mean) / (count - 1)
+            std = np.where(count > 1, np.sqrt(np.clip(var, 0, None)), np.nan)
+        encoded = (np.nan_to_num(total) + prior * self.smoothing) / (
+            count + self.smoothing
+        )
+        return {
+            f"{prefix}_target_mean": mean,
+            f"{prefix}_target_std": std,
+            f"{prefix}_target_encoded": encoded,
+        }
+
+    def _features(
+        self, row_stats: Callable[[Tuple[str, ...]], np.ndarray], prior: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """キー・階層ごとの特徴量（row_statsはキーから行ごとの十分統計量を返す）"""
+        features = {}
+        count_paths = {_key_path(key) for key in self.count_cols}
+        for key in self.key_cols:
+            path = _key_path(key)
+            stats = row_stats(path)
+            features.update(self._encode(stats, prior, _key_prefix(path)))
+            if path in count_paths:
+                features[f"{_key_prefix(path)}_count"] = stats[0]
+
+        for levels in self.hierarchies:
+            # 上位の階層の平滑化した平均を事前分布にする
+            level_prior = prior
+            for i, col in enumerate(levels):
+                prefix = f"{_feature_prefix(col)}_hier"
+                encoded = self._encode(
+                    row_stats(tuple(levels[: i + 1])), level_prior, prefix
+                )[f"{prefix}_target_encoded"]
+                features[f"{prefix}_target_encoded"] = encoded
+                level_prior = encoded
+        return features
+
+    def fold_features(
+        self,
+        fold: int,
+        cache: Optional[FeatureCache] = None,
+        cache_key: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """
+        CVのfold foldで学習するモデル用の学習データの特徴量
+
+        Args:
+            fold: CVのfold番号（検証fold）
+            cache: foldごとの結果を保存するキャッシュ
+            cache_key: キャッシュキー（fitの入力とパラメータから作成したもの）
+
+        Returns:
+            学習データと同じindexのDataFrame
+        """
+        if cache is not None:
+            cached = cache.get("oof_target_stats", f"{cache_key}_fold{fold}")
+            if cached is not None:
+                return cached["features"]
+
+        is_valid = self.fold_ids == fold
+        # 各行で差し引くfold: 検証データは fold のみ、学習データは fold と自身のfold
+        other_fold = np.where(is_valid, fold, self.fold_ids)
+
+        totals = self.fold_totals.sum(axis=1)
+        prior_stats = (
+            totals[:, None]
+            - self.fold_totals[:, [fold]]
+            - np.where(is_valid, 0, self.fold_totals[:, other_fold])
+        )
+        # 差し引いた結果が空になる場合（2分割など）は全体の平均を使う
+        prior = np.where(
+            prior_stats[0] > 0,
+            prior_stats[1] / np.maximum(prior_stats[0], 1),
+            totals[1] / totals[0],
+        )
+
+        def row_stats(path: Tuple[str, ...]) -> np.ndarray:
+            codes = self.codes[path]
+            stats = self.stats[path]
+            rows = np.clip(codes, 0, None)
+            result = (
+                stats.sum(axis=1)[:, rows]
+                - stats[:, fold, rows]
+                - np.where(is_valid, 0, stats[:, other_fold, rows])
+            )
+            result[:, codes < 0] = 0
+            return result
+
+        result = pd.DataFrame(self._features(row_stats, prior), index=self.index)
+        if cache is not None:
+            cache.put(
+                "oof_target_stats", f"{cache_key}_fold{fold}", {"features": result}
+            )
+        return result
+
+    def test_features(self, test: pd.DataFrame, fold: int) -> pd.DataFrame:
+        """
+        CVのfold foldで学習したモデル用のテストデータの特徴量
+
+        Args:
+            test: キー列を含むテストデータ
+            fold: CVのfold番号（検証fold）
+
+        Returns:
+            テストデータと同じindexのDataFrame
+        """
+        totals = self.fold_totals.sum(axis=1) - self.fold_totals[:, fold]
+        prior = np.full(len(test), totals[1] / totals[0])
+        memo: Dict[Tuple[str, ...], np.ndarray] = {}
+
+        def row_stats(path: Tuple[str, ...]) -> np.ndarray:
+            codes = self._lookup_codes(test, path, memo)
+            key_stats = self.stats[path].sum(axis=1) - self.stats[path][:, fold]
+            result = key_stats[:, np.clip(codes, 0, None)]
+            result[:, codes < 0] = 0
+            return result
+
+        return pd.DataFrame(self._features(row_stats, prior), index=test.index)
+
+
+class TargetStatsStore:
+    """
+    カテゴリごとの目的変数の十分統計量（件数・和・二乗和）を保持するストア
+
+    月ごとのデータで update し、パーティションごとに作ったストアは merge で統合できる。
+    履歴を再集計せずに、任意の smoothing で平滑化した Target Encoding を計算できる。
+    保存形式はParquet（列名・キー・件数・和・二乗和の縦持ち）。
+    """
+
+    def __init__(self):
+        # 列名 -> キー（文字列）をindexとした [count, sum, sum_sq] のDataFrame
+        self.stats: Dict[str, pd.DataFrame] = {}
+        # 全行の [count, sum, sum_sq]（キーの欠損を含む、平滑化の事前分布に使う）
+        self.totals = np.zeros(3)
+        # 取り込んだバッチのID（同じバッチの二重取り込みを防ぐ）
+        self.batches: List[str] = []
+
+    def update(
+        self,
+        df: pd.DataFrame,
+        target: pd.Series,
+        key_cols: List[str],
+        batch_id: Optional[str] = None,
+    ) -> "TargetStatsStore":
+        """
+        バッチの統計量を加算
+
+        Args:
+            df: キー列を含むDataFrame
+            target: 目的変数
+            key_cols: 統計量を計算するキー列
+            batch_id: バッチのID（"202301"など）。取り込み済みの場合はValueError
+
+        Returns:
+            self
+        """
+        if batch_id is not None:
+            if batch_id in self.batches:
+                raise ValueError(f"バッチ {batch_id} は取り込み済みです")
+            self.batches.append(batch_id)
+
+        y = target.to_numpy(dtype=np.float64)
+        self.totals = self.totals + [len(y), y.sum(), (y**2).sum()]
+
+        for col in key_cols:
+            codes, uniques = factorize_column(df[col])
+            valid = codes >= 0
+            n_keys = len(uniques)
+            batch = pd.DataFrame(
+                {
+                    "count": np.bincount(codes[valid], minlength=n_keys),
+                    "sum": np.bincount(codes[valid], y[valid], minlength=n_keys),
+                    "sum_sq": np.bincount(
+                        codes[valid], y[valid] ** 2, minlength=n_keys
+                    ),
+                },
+                index=pd.Index(uniques.astype(str), name="key"),
+            )
+            self._add(col, batch)
+
+        return self
+
+    def _add(self, col: str, batch: pd.DataFrame) -> None:
+        """列の統計量にbatchを加算"""
+        if col in self.stats:
+            batch = self.stats[col].add(batch, fill_value=0)
+        self.stats[col] = batch.astype({"count": np.int64})
+
+    def merge(self, other: "TargetStatsStore") -> "TargetStatsStore":
+        """
+        別のストアの統計量を加算（パーティションごとのストアの統合）
+
+        Args:
+            other: 統合するストア
+
+        Returns:
+            self
+        """
+        duplicated = set(self.batches) & set(other.batches)
+        if duplicated:
+            raise ValueError(f"バッチ {sorted(duplicated)} が両方のストアに含まれています")
+
+        for col, stats in other.stats.items():
+            self._add(col, stats)
+        self.totals = self.totals + other.totals
+        self.batches = self.batches + other.batches
+        return self
+
+    @property
+    def global_mean(self) -> float:
+        """全行の目的変数の平均"""
+        return self.totals[1] / self.totals[0]
+
+    def encode(
+        self, df: pd.DataFrame, col: str, smoothing: float = 10.0
+    ) -> pd.DataFrame:
+        """
+        平滑化したTarget Encoding
+
+        Args:
+            df: キー列を含むDataFrame
+            col: キー列
+            smoothing: 平滑化パラメータ
+
+        Returns:
+            mean, std, count, encoded列のDataFrame（dfと同じindex、
+            未知のキーはcount=0・encodedは全体の平均）
+        """
+        stats = self.stats[col]
+        codes, uniques = factorize_column(df[col])
+        positions = stats.index.get_indexer(uniques.astype(str))
+        rows = broadcast_unique(positions, codes, fill_value=-1)
+
+        # 末尾に件数0の行を追加し、未知のキーはその行を参照する
+        values = np.vstack([stats.to_numpy(dtype=np.float64), np.zeros((1, 3))])
+        count, total, total_sq = values[np.where(rows < 0, len(stats), rows)].T
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, total / count, np.nan)
+            var = (total_sq - total * mean) / (count - 1)
+            std = np.where(count > 1, np.sqrt(np.clip(var, 0, None)), np.nan)
+            encoded = (total + self.global_mean * smoothing) / (count + smoothing)
+        # smoothing=0で未知のキーの場合も全体の平均とする
+        encoded = np.where(count > 0, encoded, self.global_mean)
+
+        return pd.DataFrame(
+            {"mean": mean, "std": std, "count": count, "encoded": encoded},
+            index=df.index,
+        )
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Parquetで保存
+
+        Args:
+            path: 保存先のパス
+        """
+        frames = [
+            stats.reset_index().assign(column=col) for col, stats in self.stats.items()
+        ]
+        frames.append(
+            pd.DataFrame(
+                {
+                    "column": [TOTAL_COLUMN],
+                    "key": [""],
+                    "count": [int(self.totals[0])],
+                    "sum": [self.totals[1]],
+                    "sum_sq": [self.totals[2]],
+                }
+            )
+        )
+        table = pa.Table.from_pandas(
+            pd.concat(frames, ignore_index=True)[
+                ["column", "key", "count", "sum", "sum_sq"]
+            ].astype({"column": "category"}),
+            preserve_index=False,
+        )
+        metadata = {
+            **(table.schema.metadata or {}),
+            b"batches": json.dumps(self.batches).encode(),
+        }
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table.replace_schema_metadata(metadata), path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "TargetStatsStore":
+        """
+        saveで保存したストアを読み込み
+
+        Args:
+            path: 保存したパス
+
+        Returns:
+            TargetStatsStore
+        """
+        table = pq.read_table(path)
+        df = table.to_pandas()
+        df["column"] = df["column"].astype(str)
+
+        store = cls()
+        store.batches = json.loads(table.schema.metadata[b"batches"])
+        is_total = df["column"] == TOTAL_COLUMN
+        store.totals = df.loc[is_total, ["count", "sum", "sum_sq"]].to_numpy(
+            dtype=np.float64
+        )[0]
+        for col, stats in df[~is_total].groupby("column", sort=False):
+            store.stats[col] = stats.set_index("key")[["count", "sum", "sum_sq"]]
+        return store
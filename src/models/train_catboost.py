@@ -2,7 +2,7 @@
 CatBoostモデルの学習
 """
 
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -30,6 +30,44 @@ def calculate_mape(y_true: np.ndarray, y_pred: np.ndarray) -> float:
     return mape
 
 
+def make_fold_ids(n_rows: int, n_splits: int = 5, random_state: int = 42) -> np.ndarray:
+    """
+    各行の検証fold番号（train_catboost_cvのKFoldと同じ分割）
+
+    Args:
+        n_rows: 行数
+        n_splits: CV分割数
+        random_state: 乱数シード
+
+    Returns:
+        fold番号の配列
+    """
+    fold_ids = np.empty(n_rows, dtype=np.int64)
+    kf = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    for fold, (_, valid_idx) in enumerate(kf.split(np.empty((n_rows, 1)))):
+        fold_ids[valid_idx] = fold
+    return fold_ids
+
+
+def concat_fold_features(
+    *funcs: Callable[[int], pd.DataFrame]
+) -> Callable[[int], pd.DataFrame]:
+    """
+    複数のfold_features関数の結果を列方向に結合する関数を作成
+
+    Args:
+        funcs: fold番号を受け取り、Xと同じindexのDataFrameを返す関数
+
+    Returns:
+        fold番号を受け取り、全関数の結果を結合したDataFrameを返す関数
+    """
+
+    def fold_features(fold: int) -> pd.DataFrame:
+        return pd.concat([func(fold) for func in funcs], axis=1)
+
+    return fold_features
+
+
 def train_catboost_cv(
     X: pd.DataFrame,
     y: pd.Series,
@@ -37,17 +75,22 @@ def train_catboost_cv(
     n_splits: int = 5,
     params: Optional[dict] = None,
     verbose: int = 100,
+    fold_ids: Optional[np.ndarray] = None,
+    fold_features: Optional[Callable[[int], pd.DataFrame]] = None,
 ) -> Tuple[List[CatBoostRegressor], List[float]]:
     """
     Cross ValidationでCatBoostを学習
 
     Args:
-        X: 特徴量
+        X: 特徴量（Sparse列はそのままPoolに渡される）
         y: 目的変数（log変換済み）
         cat_features: カテゴリカル特徴量のリスト
         n_splits: CV分割数
         params: モデルパラメータ
         verbose: 学習ログの表示間隔
+        fold_ids: 各行の検証fold番号（Noneの場合はKFoldで分割）
+        fold_features: fold番号を受け取り、そのfoldでのみ使う特徴量
+            （Xと同じindexのDataFrame）を返す関数。OOFTargetEncoder.fold_featuresなど
 
     Returns:
         models, cv_scores
@@ -71,16 +114,27 @@ def train_catboost_cv(
     print(f"CV分割数: {n_splits}")
     print()
 
-    kf = KFold(n_splits=n_splits, shuffle=True, random_state=42)
+    if fold_ids is None:
+        kf = KFold(n_splits=n_splits, shuffle=True, random_state=42)
+        splits = list(kf.split(X))
+    else:
+        splits = [
+            (np.flatnonzero(fold_ids != fold), np.flatnonzero(fold_ids == fold))
+            for fold in range(n_splits)
+        ]
     models = []
     cv_scores = []
 
-    for fold, (train_idx, valid_idx) in enumerate(kf.split(X), 1):
+    for fold, (train_idx, valid_idx) in enumerate(splits, 1):
         print(f"\n{'='*60}")
         print(f"Fold {fold}/{n_splits}")
         print(f"{'='*60}")
 
-        X_train, X_valid = X.iloc[train_idx], X.iloc[valid_idx]
+        X_fold = X
+        if fold_features is not None:
+            X_fold = pd.concat([X, fold_features(fold - 1)], axis=1)
+
+        X_train, X_valid = X_fold.iloc[train_idx], X_fold.iloc[valid_idx]
         y_train, y_valid = y.iloc[train_idx], y.iloc[valid_idx]
 
         # Pool作成
@@ -91,8 +145,8 @@ def train_catboost_cv(
         model = CatBoostRegressor(**params)
         model.fit(pool_train, eval_set=pool_valid)
 
-        # 予測（log空間）
-        y_pred_log = model.predict(X_valid)
+        # 予測（log空間）。Sparse列を含む場合も再変換しないようPoolを再利用
+        y_pred_log = model.predict(pool_valid)
 
         # MAPEを計算（元のスケールで）
         mape = calculate_mape(y_valid.values, y_pred_log)
@@ -159,6 +213,7 @@ def predict_with_models(
     X: pd.DataFrame,
     cat_features: List[str],
     apply_expm1: bool = True,
+    fold_features: Optional[Callable[[int], pd.DataFrame]] = None,
 ) -> np.ndarray:
     """
     複数モデルで予測して平均
@@ -168,14 +223,19 @@ def predict_with_models(
         X: 特徴量
         cat_features: カテゴリカル特徴量のリスト
         apply_expm1: log1pを元に戻すか
+        fold_features: モデルの番号（fold）を受け取り、そのモデルでのみ使う特徴量
+            （Xと同じindexのDataFrame）を返す関数。OOFTargetEncoder.test_featuresなど
 
     Returns:
         予測値
     """
-    pool = Pool(X, cat_features=cat_features)
+    pool = None if fold_features is not None else Pool(X, cat_features=cat_features)
     predictions = []
 
-    for model in models:
+    for fold, model in enumerate(models):
+        if fold_features is not None:
+            X_fold = pd.concat([X, fold_features(fold)], axis=1)
+            pool = Pool(X_fold, cat_features=cat_features)
         pred = model.predict(pool)
         predictions.append(pred)
 
@@ -0,0 +1,244 @@
+"""特徴量キャッシュ"""
+
+import hashlib
+import inspect
+import json
+import pickle
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+
+from src.data.preprocess import densify_columns, get_sparse_columns, sparsify_columns
+
+INDEX_FILE = "index.json"
+
+
+def file_fingerprint(path: Union[str, Path]) -> List[List[Any]]:
+    """
+    入力ファイルの指紋（相対パス・サイズ・更新時刻）
+
+    ディレクトリの場合は配下の全ファイルを対象とする。
+    内容のハッシュは大きなCSVでは遅いため、サイズと更新時刻で代用する。
+
+    Args:
+        path: ファイルまたはディレクトリのパス
+
+    Returns:
+        [相対パス, サイズ, 更新時刻(ns)] のリスト
+    """
+    path = Path(path)
+    files = (
+        sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    )
+    fingerprint = []
+    for file in files:
+        stat = file.stat()
+        name = file.relative_to(path).as_posix() if path.is_dir() else file.name
+        fingerprint.append([name, stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+
+def make_cache_key(
+    inputs: Optional[Dict[str, Any]] = None,
+    params: Optional[Dict[str, Any]] = None,
+    code: Optional[List[Any]] = None,
+) -> str:
+    """
+    入力・パラメータ・ソースコードからキャッシュキーを作成
+
+    Args:
+        inputs: 入力の指紋（file_fingerprintの戻り値や上流ステージのキー）
+        params: 関数のパラメータ
+        code: ソースをキーに含めるモジュールまたは関数
+
+    Returns:
+        sha256のハッシュ値
+    """
+    payload = {
+        "inputs": inputs or {},
+        "params": params or {},
+        "code": [inspect.getsource(obj) for obj in code or []],
+    }
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class FeatureCache:
+    """
+    ステージごとの特徴量キャッシュ
+
+    エントリは cache_dir/<stage>/<key>/ に保存する。DataFrame/Seriesはparquet、
+    それ以外はpickleで保存し、合計サイズがmax_bytesを超えた場合は
+    最後に参照された時刻が古いエントリから削除する。
+    ヒット・ミス数はステージごとに index.json に記録する。
+    index.json の更新はロックで保護するため、複数スレッドから同時に使用できる。
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_bytes: Optional[int] = None):
+        """
+        Args:
+            cache_dir: キャッシュディレクトリ
+            max_bytes: キャッシュ全体の上限サイズ（Noneの場合は無制限）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+
+    def _load_index(self) -> dict:
+        index_path = self.cache_dir / INDEX_FILE
+        if not index_path.exists():
+            return {"entries": {}, "stats": {}}
+        with open(index_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_index(self, index: dict) -> None:
+        with open(self.cache_dir / INDEX_FILE, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def _count(index: dict, stage: str, result: str) -> None:
+        stats = index["stats"].setdefault(stage, {"hits": 0, "misses": 0})
+        stats[result] += 1
+
+    def _entry_dir(self, stage: str, key: str) -> Path:
+        return self.cache_dir / stage / key
+
+    def get(
+        self, stage: str, key: str, names: Optional[List[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        キャッシュを読み込み
+
+        Args:
+            stage: ステージ名
+            key: make_cache_keyで作成したキー
+            names: 読み込む値の名前（Noneの場合は全て）
+
+        Returns:
+            保存した値の辞書（存在しない場合はNone）
+        """
+        with self._lock:
+            index = self._load_index()
+            entry_id = f"{stage}/{key}"
+            entry = index["entries"].get(entry_id)
+            entry_dir = self._entry_dir(stage, key)
+
+            if entry is None or not entry_dir.exists():
+                self._count(index, stage, "misses")
+                self._save_index(index)
+                return None
+
+            values = {}
+            for name, meta in entry["values"].items():
+                if names is not None and name not in names:
+                    continue
+                if meta["format"] == "parquet":
+                    value = pd.read_parquet(entry_dir / f"{name}.parquet")
+                    value = sparsify_columns(value, meta["sparse_columns"])
+                    if meta["series"]:
+                        value = value.iloc[:, 0].rename(meta["series_name"])
+                else:
+                    with open(entry_dir / f"{name}.pkl", "rb") as f:
+                        value = pickle.load(f)
+                values[name] = value
+
+            entry["last_access"] = time.time()
+            self._count(index, stage, "hits")
+            self._save_index(index)
+            return values
+
+    def put(self, stage: str, key: str, values: Dict[str, Any]) -> None:
+        """
+        キャッシュに保存
+
+        Args:
+            stage: ステージ名
+            key: make_cache_keyで作成したキー
+            values: 名前 -> 値（DataFrame/Seriesはparquet、その他はpickle）
+        """
+        entry_dir = self._entry_dir(stage, key)
+        if entry_dir.exists():
+            shutil.rmtree(entry_dir)
+        entry_dir.mkdir(parents=True)
+
+        metas = {}
+        for name, value in values.items():
+            if isinstance(value, (pd.DataFrame, pd.Series)):
+                is_series = isinstance(value, pd.Series)
+                frame = value.to_frame(name="value") if is_series else value
+                # parquetはSparse列を扱えないため保存時のみ通常の列に戻す
+                sparse_columns = get_sparse_columns(frame)
+                densify_columns(frame, sparse_columns).to_parquet(
+                    entry_dir / f"{name}.parquet", index=False
+                )
+                metas[name] = {
+                    "format": "parquet",
+                    "series": is_series,
+                    "series_name": value.name if is_series else None,
+                    "sparse_columns": sparse_columns,
+                }
+            else:
+                with open(entry_dir / f"{name}.pkl", "wb") as f:
+                    pickle.dump(value, f)
+                metas[name] = {"format": "pickle"}
+
+        with self._lock:
+            index = self._load_index()
+            now = time.time()
+            index["entries"][f"{stage}/{key}"] = {
+                "stage": stage,
+                "size": sum(p.stat().st_size for p in entry_dir.iterdir()),
+                "created": now,
+                "last_access": now,
+                "values": metas,
+            }
+            self._evict(index, keep=f"{stage}/{key}")
+            self._save_index(index)
+
+    def _evict(self, index: dict, keep: str) -> None:
+        """上限サイズを超えた分を古い順に削除（保存直後のエントリは残す）"""
+        if self.max_bytes is None:
+            return
+
+        entries = index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+        for entry_id in sorted(entries, key=lambda e: entries[e]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if entry_id == keep:
+                continue
+            shutil.rmtree(self.cache_dir / entry_id, ignore_errors=True)
+            total -= entries.pop(entry_id)["size"]
+
+    def stats(self) -> pd.DataFrame:
+        """
+        ステージごとのヒット・ミス数とエントリのサイズ
+
+        Returns:
+            stage, hits, misses, entries, size_mb列のDataFrame
+        """
+        index = self._load_index()
+        stages = sorted(
+            set(index["stats"]) | {e["stage"] for e in index["entries"].values()}
+        )
+        rows = []
+        for stage in stages:
+            stats = index["stats"].get(stage, {"hits": 0, "misses": 0})
+            entries = [e for e in index["entries"].values() if e["stage"] == stage]
+            rows.append(
+                {
+                    "stage": stage,
+                    "hits": stats["hits"],
+                    "misses": stats["misses"],
+                    "entries": len(entries),
+                    "size_mb": sum(e["size"] for e in entries) / 1024**2,
+                }
+            )
+        return pd.DataFrame(
+            rows, columns=["stage", "hits", "misses", "entries", "size_mb"]
+        )
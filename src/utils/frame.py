@@ -0,0 +1,33 @@
+"""DataFrameへの列の追加"""
+
+from typing import Any, Dict
+
+import pandas as pd
+
+
+def append_columns(
+    df: pd.DataFrame, new_columns: Dict[str, Any], inplace: bool = False
+) -> pd.DataFrame:
+    """
+    新しい列を追加
+
+    inplace=False の場合は元の列をコピーし、新しい列を一度に結合した
+    DataFrameを返す。inplace=True の場合はdfに新しい列の配列だけを追加して
+    dfを返す（元の列はコピーしない。列ごとにブロックが増えるため、
+    多数の列を追加したDataFrameは断片化する）。
+
+    Args:
+        df: DataFrame
+        new_columns: 列名 -> 値（配列またはdfと同じindexのSeries）
+        inplace: dfに直接追加するか
+
+    Returns:
+        新しい列を追加したDataFrame
+    """
+    if inplace:
+        for name, values in new_columns.items():
+            df[name] = values
+        return df
+    if not new_columns:
+        return df.copy()
+    return pd.concat([df, pd.DataFrame(new_columns, index=df.index)], axis=1)
@@ -0,0 +1,201 @@
+"""ステージ単位のパイプライン実行"""
+
+import inspect
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from src.utils.cache import FeatureCache, make_cache_key
+
+
+@dataclass
+class Node:
+    """
+    パイプラインのノード
+
+    funcは inputs の成果物を位置引数、params をキーワード引数として呼ばれ、
+    outputs と同じ数の値（1つの場合はそのまま、複数の場合はtuple）を返す。
+
+    Attributes:
+        name: ノード名（キャッシュのステージ名にもなる）
+        func: 実行する関数
+        inputs: 入力の成果物名
+        outputs: 出力の成果物名
+        params: funcに渡すキーワード引数（キャッシュキーに含まれる）
+        fingerprint: funcには渡さずキャッシュキーにだけ含める値（入力ファイルの指紋など）
+        code: ソースをキャッシュキーに含めるモジュールまたは関数（Noneの場合はfuncのモジュール）
+        cache: 結果をキャッシュするか
+    """
+
+    name: str
+    func: Callable
+    inputs: List[str]
+    outputs: List[str]
+    params: Dict[str, Any] = field(default_factory=dict)
+    fingerprint: Any = None
+    code: Optional[List[Any]] = None
+    cache: bool = True
+
+    def source_objects(self) -> List[Any]:
+        """キャッシュキーに含めるソースの対象"""
+        if self.code is not None:
+            return self.code
+        return [inspect.getmodule(self.func)]
+
+
+class Pipeline:
+    """
+    ノードの入出力から依存関係を解決して実行するパイプライン
+
+    各ノードのキャッシュキーは、上流ノードのキー・パラメータ・ソースから決まるため、
+    変更されたノードとその下流だけが再実行される。キャッシュにヒットしたノードより
+    上流は読み込みも実行も行わない。依存関係のないノードはスレッドで並列に実行する。
+    中間成果物は、それを入力とする全てのノードの実行が終わった時点で破棄する。
+    """
+
+    def __init__(
+        self,
+        nodes: List[Node],
+        cache: Optional[FeatureCache] = None,
+        max_workers: int = 4,
+        release_intermediates: bool = True,
+    ):
+        """
+        Args:
+            nodes: ノードのリスト
+            cache: ノード単位のキャッシュ（Noneの場合はキャッシュしない）
+            max_workers: 並列実行するノード数の上限
+            release_intermediates: Falseの場合、中間成果物をrunの終了まで保持する
+        """
+        self.nodes = {node.name: node for node in nodes}
+        self.cache = cache
+        self.max_workers = max_workers
+        self.release_intermediates = release_intermediates
+
+        self.producers: Dict[str, Node] = {}
+        for node in nodes:
+            for output in node.outputs:
+                if output in self.producers:
+                    raise ValueError(f"成果物 {output} を出力するノードが複数あります")
+                self.producers[output] = node
+        for node in nodes:
+            for name in node.inputs:
+                if name not in self.producers:
+                    raise ValueError(f"{node.name} の入力 {name} を出力するノードがありません")
+
+        self.keys = self._compute_keys()
+
+    def _compute_keys(self) -> Dict[str, str]:
+        """ノードのキャッシュキーを上流から順に計算"""
+        keys: Dict[str, str] = {}
+        visiting: Set[str] = set()
+
+        def visit(node: Node) -> str:
+            if node.name in keys:
+                return keys[node.name]
+            if node.name in visiting:
+                raise ValueError(f"ノード {node.name} を含む循環依存があります")
+            visiting.add(node.name)
+            upstream = {
+                name: f"{visit(self.producers[name])}:{name}" for name in node.inputs
+            }
+            keys[node.name] = make_cache_key(
+                inputs={"artifacts": upstream, "fingerprint": node.fingerprint},
+                params=node.params,
+                code=node.source_objects(),
+            )
+            visiting.discard(node.name)
+            return keys[node.name]
+
+        for node in self.nodes.values():
+            visit(node)
+        return keys
+
+    def _plan(self, targets: List[str], values: Dict[str, Any]) -> List[Node]:
+        """キャッシュを確認しながら、実行が必要なノードを求める"""
+        to_run: Dict[str, Node] = {}
+        stack = list(targets)
+
+        while stack:
+            artifact = stack.pop()
+            if artifact in values:
+                continue
+            node = self.producers[artifact]
+            if node.name in to_run:
+                continue
+
+            # キャッシュからは必要な成果物だけを読み込む
+            if self.cache is not None and node.cache:
+                cached = self.cache.get(
+                    node.name, self.keys[node.name], names=[artifact]
+                )
+                if cached is not None:
+                    print(f"  ✓ [{node.name}] キャッシュ読み込み: {artifact}")
+                    values.update(cached)
+                    continue
+
+            to_run[node.name] = node
+            stack.extend(node.inputs)
+
+        return list(to_run.values())
+
+    def _execute(self, node: Node, values: Dict[str, Any]) -> Dict[str, Any]:
+        """ノードを1つ実行して出力を返す"""
+        start = time.time()
+        result = node.func(*[values[name] for name in node.inputs], **node.params)
+        if len(node.outputs) == 1:
+            result = (result,)
+        outputs = dict(zip(node.outputs, result))
+
+        if self.cache is not None and node.cache:
+            self.cache.put(node.name, self.keys[node.name], outputs)
+        print(f"  ⏱️  [{node.name}] {time.time() - start:.2f}秒")
+        return outputs
+
+    def run(self, targets: List[str]) -> Dict[str, Any]:
+        """
+        指定した成果物を得るのに必要なノードだけを実行
+
+        Args:
+            targets: 取得する成果物名
+
+        Returns:
+            成果物名 -> 値（targets以外の中間成果物は含めない）
+        """
+        values: Dict[str, Any] = {}
+        pending = self._plan(targets, values)
+
+        # 成果物ごとの、まだ実行していない入力先のノード数
+        consumers: Dict[str, int] = {}
+        for node in pending:
+            for name in node.inputs:
+                consumers[name] = consumers.get(name, 0) + 1
+
+        def release(names: List[str]) -> None:
+            if not self.release_intermediates:
+                return
+            for name in names:
+                if consumers.get(name, 0) == 0 and name not in targets:
+                    values.pop(name, None)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running: Dict[Future, Node] = {}
+            while pending or running:
+                ready = [n for n in pending if all(i in values for i in n.inputs)]
+                for node in ready:
+                    pending.remove(node)
+                    running[executor.submit(self._execute, node, values)] = node
+                if not running:
+                    raise RuntimeError("実行可能なノードがありません")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    outputs = future.result()
+                    values.update(outputs)
+                    for name in node.inputs:
+                        consumers[name] -= 1
+                    release([*node.inputs, *outputs])
+
+        return {name: values[name] for name in targets}
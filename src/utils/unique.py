@@ -0,0 +1,128 @@
+"""ユニーク値単位の変換"""
+
+from typing import Any, Callable, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def factorize_column(series: pd.Series) -> Tuple[np.ndarray, pd.Series]:
+    """
+    列をユニーク値とコードに分解
+
+    Args:
+        series: 対象の列
+
+    Returns:
+        codes（欠損は-1）, ユニーク値のSeries
+    """
+    codes, uniques = pd.factorize(series)
+    return codes, pd.Series(uniques)
+
+
+def lookup_codes(uniques: pd.Series, series: pd.Series) -> np.ndarray:
+    """
+    別の列の値を factorize_column のユニーク値のコードに変換
+
+    Args:
+        uniques: factorize_columnのユニーク値
+        series: 変換する列（testデータの列など）
+
+    Returns:
+        codes（uniquesに含まれない値・欠損は-1）
+    """
+    return pd.Index(uniques).get_indexer(series)
+
+
+def broadcast_unique(
+    unique_values: Union[np.ndarray, pd.Series, sparse.spmatrix],
+    codes: np.ndarray,
+    fill_value: Any = np.nan,
+) -> Union[np.ndarray, sparse.csr_matrix]:
+    """
+    ユニーク値単位の結果をコードで行方向に展開
+
+    Args:
+        unique_values: ユニーク値ごとの結果（疎行列の場合は行単位）
+        codes: factorize_columnのコード
+        fill_value: コード-1（欠損）の行に入れる値（疎行列の場合は空行）
+
+    Returns:
+        行数分に展開した配列または疎行列
+    """
+    if sparse.issparse(unique_values):
+        n_uniques = unique_values.shape[0]
+        empty_row = sparse.csr_matrix(
+            (1, unique_values.shape[1]), dtype=unique_values.dtype
+        )
+        padded = sparse.vstack([unique_values, empty_row], format="csr")
+        return padded[np.where(codes < 0, n_uniques, codes)]
+
+    return pd.api.extensions.take(
+        np.asarray(unique_values), codes, allow_fill=True, fill_value=fill_value
+    )
+
+
+def _broadcast_series(
+    unique_result: pd.Series, codes: np.ndarray, as_category: bool, fill_value: Any
+) -> Union[np.ndarray, pd.Categorical]:
+    """ユニーク値単位のSeriesを行方向に展開"""
+    if not as_category:
+        return broadcast_unique(unique_result, codes, fill_value=fill_value)
+
+    # 結果のカテゴリを作り、コードを合成するだけで展開する
+    value_codes, categories = pd.factorize(unique_result)
+    row_codes = broadcast_unique(value_codes, codes, fill_value=-1)
+    return pd.Categorical.from_codes(row_codes, categories=categories)
+
+
+def map_unique(
+    series: pd.Series,
+    func: Callable,
+    vectorized: bool = False,
+    as_category: bool = False,
+    fill_value: Any = np.nan,
+) -> Union[pd.Series, pd.DataFrame]:
+    """
+    ユニーク値ごとに一度だけ変換し、結果を行方向に展開
+
+    住所や駅名のように行数に比べてユニーク数が少ない列で、
+    行ごとのapplyの代わりに使う。
+
+    Args:
+        series: 対象の列
+        func: 変換関数。vectorized=Falseの場合は値ごとに呼ばれ、
+            Trueの場合はユニーク値のSeriesを受け取り、同じ長さの
+            SeriesまたはDataFrameを返す
+        vectorized: funcがユニーク値のSeriesをまとめて処理するか
+        as_category: 結果をcategory型で返すか
+        fill_value: 欠損値の行に入れる値（as_category=Trueの場合は常に欠損）
+
+    Returns:
+        seriesと同じindexを持つSeriesまたはDataFrame
+    """
+    codes, uniques = factorize_column(series)
+
+    if vectorized:
+        unique_result = func(uniques)
+    else:
+        unique_result = pd.Series([func(value) for value in uniques], dtype=object)
+        unique_result = unique_result.infer_objects()
+
+    if isinstance(unique_result, pd.DataFrame):
+        return pd.DataFrame(
+            {
+                col: _broadcast_series(
+                    unique_result[col], codes, as_category, fill_value
+                )
+                for col in unique_result.columns
+            },
+            index=series.index,
+        )
+
+    return pd.Series(
+        _broadcast_series(unique_result, codes, as_category, fill_value),
+        index=series.index,
+        name=series.name,
+    )
@@ -0,0 +1,89 @@
+"""特徴量キャッシュのテスト"""
+
+import numpy as np
+import pandas as pd
+
+from src.data.preprocess import get_sparse_columns
+from src.utils.cache import FeatureCache, file_fingerprint, make_cache_key
+
+
+def _sample_values():
+    train = pd.DataFrame(
+        {
+            "a": [1.0, 2.0, 3.0],
+            "tag": pd.arrays.SparseArray(
+                np.array([0, 1, 0], dtype=np.uint8), fill_value=0
+            ),
+        }
+    )
+    target = pd.Series([0.1, 0.2, 0.3], name="money_room")
+    return {"train": train, "target": target, "cat_features": ["b"]}
+
+
+def test_cache_roundtrip_and_stats(tmp_path):
+    """保存・読み込みとヒット・ミス数のテスト"""
+    cache = FeatureCache(tmp_path / "cache")
+    key = make_cache_key(params={"n_clusters": 50})
+
+    assert cache.get("geo", key) is None
+    cache.put("geo", key, _sample_values())
+    values = cache.get("geo", key)
+
+    assert get_sparse_columns(values["train"]) == ["tag"]
+    assert values["train"]["a"].tolist() == [1.0, 2.0, 3.0]
+    assert values["target"].name == "money_room"
+    assert values["cat_features"] == ["b"]
+
+    stats = cache.stats().set_index("stage")
+    assert stats.loc["geo", "hits"] == 1
+    assert stats.loc["geo", "misses"] == 1
+    assert stats.loc["geo", "entries"] == 1
+
+
+def test_cache_key_changes(tmp_path):
+    """入力・パラメータ・コードが変わるとキーが変わることのテスト"""
+    path = tmp_path / "train.csv"
+    path.write_text("a\n1\n")
+    base = make_cache_key(
+        inputs={"train": file_fingerprint(path)},
+        params={"smoothing": 10.0},
+        code=[make_cache_key],
+    )
+
+    assert base == make_cache_key(
+        inputs={"train": file_fingerprint(path)},
+        params={"smoothing": 10.0},
+        code=[make_cache_key],
+    )
+    assert base != make_cache_key(
+        inputs={"train": file_fingerprint(path)},
+        params={"smoothing": 5.0},
+        code=[make_cache_key],
+    )
+    assert base != make_cache_key(
+        inputs={"train": file_fingerprint(path)},
+        params={"smoothing": 10.0},
+        code=[file_fingerprint],
+    )
+    path.write_text("a\n1\n2\n")
+    assert base != make_cache_key(
+        inputs={"train": file_fingerprint(path)},
+        params={"smoothing": 10.0},
+        code=[make_cache_key],
+    )
+
+
+def test_cache_lru_eviction(tmp_path):
+    """上限サイズを超えると最後に参照したのが古いエントリから削除されることのテスト"""
+    cache = FeatureCache(tmp_path / "cache")
+    cache.put("stage", "old", _sample_values())
+    entry_size = cache.stats()["size_mb"].sum() * 1024**2
+
+    cache = FeatureCache(tmp_path / "cache", max_bytes=int(entry_size * 2.5))
+    cache.put("stage", "middle", _sample_values())
+    assert cache.get("stage", "old") is not None  # oldを最近参照したことにする
+    cache.put("stage", "new", _sample_values())
+
+    assert cache.get("stage", "middle") is None
+    assert cache.get("stage", "old") is not None
+    assert cache.get("stage", "new") is not None
@@ -0,0 +1,62 @@
+"""半径内の物件数（密度）の計算のテスト"""
+
+import numpy as np
+import pandas as pd
+
+from src.features.density import count_neighbors
+from src.features.distance import haversine_distance
+from src.features.geo_features import create_density_features
+
+RADII_KM = [0.25, 0.5, 1.0]
+
+
+def test_count_neighbors_matches_brute_force():
+    """格子での件数が全組の大円距離から数えた件数と一致するテスト"""
+    rng = np.random.default_rng(0)
+    n = 2000
+    lat = rng.uniform(43.0, 43.1, n)
+    lon = rng.uniform(141.3, 141.45, n)
+    # 同じ座標の物件（同じ建物）と欠損
+    lat[20:60], lon[20:60] = lat[30], lon[30]
+    lat[5] = np.nan
+    categories = rng.integers(-1, 3, n)
+
+    distances = haversine_distance(
+        lat[:, None], lon[:, None], lat[None, :], lon[None, :]
+    )
+    np.fill_diagonal(distances, np.inf)
+    valid = ~np.isnan(lat)
+
+    # 帯の数・一度に比較する組の数を変えても結果は同じ
+    for params in [{}, {"strips_per_radius": 1}, {"max_pairs": 100, "batch_size": 300}]:
+        counts, category_counts = count_neighbors(
+            lat, lon, RADII_KM, categories=categories, n_categories=3, **params
+        )
+        for j, radius in enumerate(RADII_KM):
+            within = distances <= radius
+            assert (counts[valid, j] == within[valid].sum(axis=1)).all()
+            for code in range(3):
+                expected = (within & (categories == code)[None, :])[valid].sum(axis=1)
+                assert (category_counts[valid, j, code] == expected).all()
+        assert (counts[5] == -1).all()
+        assert (category_counts[5] == -1).all()
+
+
+def test_create_density_features_counts_train_and_test():
+    """train/testを合わせた物件数が両方に追加されるテスト"""
+    train = pd.DataFrame(
+        {
+            "lat": [35.0, 35.001, 35.1],
+            "lon": [139.0, 139.0, 139.0],
+            "building_type": [1, 2, 1],
+        }
+    )
+    test = pd.DataFrame({"lat": [35.002], "lon": [139.0], "building_type": [1]})
+
+    train_result, test_result = create_density_features(train, test, radii_km=[0.25])
+
+    assert train_result["density_250m"].tolist() == [2, 2, 0]
+    assert train_result["density_250m_building_type_1"].tolist() == [1, 2, 0]
+    assert train_result["density_250m_building_type_2"].tolist() == [1, 0, 0]
+    assert test_result["density_250m"].tolist() == [2]
+    assert test_result["density_250m_building_type_2"].tolist() == [1]
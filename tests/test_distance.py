@@ -0,0 +1,54 @@
+"""大円距離の計算のテスト"""
+
+import numpy as np
+import pandas as pd
+
+from src.features.distance import (
+    haversine_distance,
+    nearest_reference_points,
+    reference_points,
+)
+from src.features.geo_features import create_distance_features
+
+
+def test_haversine_distance_known_value():
+    """東京駅〜大阪駅の大円距離（約403km）のテスト"""
+    distance = haversine_distance(35.6812, 139.7671, 34.7025, 135.4959)
+    assert abs(distance - 403.4) < 1.0
+    assert haversine_distance(35.0, 135.0, 35.0, 135.0) == 0.0
+
+
+def test_nearest_reference_points_matches_brute_force():
+    """KD-treeの近傍が全参照地点との距離の昇順と一致するテスト"""
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(31, 44, 200)
+    lon = rng.uniform(129, 145, 200)
+    lat[3] = np.nan
+    points = reference_points("prefecture_capitals")
+
+    distances, indices = nearest_reference_points(lat, lon, points, k=3)
+
+    all_distances = haversine_distance(
+        lat[:, None], lon[:, None], points["lat"].values, points["lon"].values
+    )
+    expected = np.argsort(all_distances, axis=1)[:, :3]
+    valid = ~np.isnan(lat)
+    assert (indices[valid] == expected[valid]).all()
+    assert np.allclose(
+        distances[valid], np.take_along_axis(all_distances, expected, axis=1)[valid]
+    )
+    assert np.isnan(distances[3]).all()
+    assert (indices[3] == -1).all()
+
+
+def test_create_distance_features_reference_sets():
+    """参照地点の近傍の列が追加されるテスト"""
+    df = pd.DataFrame({"lat": [35.6812, 34.7025], "lon": [139.7671, 135.4959]})
+    result = create_distance_features(df, reference_sets=["major_stations"], k=2)
+
+    names = reference_points("major_stations")["name"]
+    assert names[result["major_stations_nearest1_id"]].tolist() == ["tokyo", "osaka"]
+    assert (result["major_stations_nearest1_km"] < 0.01).all()
+    assert (
+        result["major_stations_nearest2_km"] >= result["major_stations_nearest1_km"]
+    ).all()
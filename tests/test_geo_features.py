@@ -0,0 +1,148 @@
+"""地理空間特徴量のテスト"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+from src.features.geo_cluster import GeoClusterModel
+from src.features.geo_features import (
+    create_cluster_aggregation_features,
+    create_density_features,
+    create_derived_features,
+    create_distance_features,
+    create_kmeans_clusters,
+)
+
+
+def _sample_coords(n_rows, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "lat": rng.uniform(33.0, 36.0, n_rows),
+            "lon": rng.uniform(130.0, 140.0, n_rows),
+        }
+    )
+    df.loc[::7, "lat"] = np.nan
+    return df
+
+
+def test_minibatch_kmeans_is_deterministic():
+    """minibatchのラベルが同じシードで再現し、チャンク単位の割り当てと一致するテスト"""
+    train = _sample_coords(500, seed=0)
+    test = _sample_coords(200, seed=1)
+
+    results = [
+        create_kmeans_clusters(
+            train,
+            test,
+            n_clusters=8,
+            random_state=0,
+            engine="minibatch",
+            batch_size=64,
+            chunk_size=chunk_size,
+        )
+        for chunk_size in [1000, 37]
+    ]
+
+    for (train_a, test_a, _), (train_b, test_b, _) in zip(results, results[1:]):
+        assert train_a["geo_cluster"].tolist() == train_b["geo_cluster"].tolist()
+        assert test_a["geo_cluster"].tolist() == test_b["geo_cluster"].tolist()
+
+    train_clustered, test_clustered, _ = results[0]
+    assert (train_clustered.loc[train["lat"].isna(), "geo_cluster"] == -1).all()
+    assert (test_clustered.loc[test["lat"].notna(), "geo_cluster"] >= 0).all()
+
+
+def test_kmeans_rejects_unknown_engine():
+    """未知のengineを指定した場合のエラーのテスト"""
+    train = _sample_coords(50, seed=0)
+    with pytest.raises(ValueError):
+        create_kmeans_clusters(train, train, n_clusters=3, engine="unknown")
+
+
+def test_geo_cluster_model_roundtrip(tmp_path):
+    """保存したモデルの割り当てがK-meansのpredictと一致するテスト"""
+    train = _sample_coords(500, seed=0)
+    test = _sample_coords(300, seed=1)
+    _, test_clustered, model = create_kmeans_clusters(
+        train, test, n_clusters=10, random_state=0
+    )
+
+    model_dir = model.save(tmp_path / "geo_cluster")
+    loaded = GeoClusterModel.load(model_dir)
+    assert model_dir.name == model.version == loaded.version
+
+    labels = loaded.assign(test["lat"], test["lon"], chunk_size=64)
+    assert labels.tolist() == test_clustered["geo_cluster"].tolist()
+
+    valid = test.dropna()
+    kmeans = KMeans(n_clusters=10, random_state=0, n_init=10)
+    kmeans.fit(StandardScaler().fit_transform(train.dropna()))
+    expected = kmeans.predict(StandardScaler().fit(train.dropna()).transform(valid))
+    assert labels[valid.index].tolist() == expected.tolist()
+
+
+def test_cluster_aggregation_preserves_index():
+    """集約特徴量がgroupbyの結果と一致し、行順とindexが保たれるテスト"""
+    train = pd.DataFrame(
+        {
+            "geo_cluster": [2, 0, 2, 1, 0],
+            "house_area": [10.0, 20.0, np.nan, 40.0, 50.0],
+            "money_room": [1.0, 2.0, 3.0, 4.0, 5.0],
+        },
+        index=[50, 40, 30, 20, 10],
+    )
+    test = pd.DataFrame(
+        {"geo_cluster": [1, 9], "house_area": [0.0, 0.0]}, index=["a", "b"]
+    )
+
+    train_agg, test_agg = create_cluster_aggregation_features(
+        train, test, agg_cols=["house_area"]
+    )
+
+    assert train_agg.index.tolist() == [50, 40, 30, 20, 10]
+    assert test_agg.index.tolist() == ["a", "b"]
+    expected = train.groupby("geo_cluster")["money_room"].transform("mean")
+    assert train_agg["cluster_target_mean"].tolist() == expected.tolist()
+    assert train_agg["cluster_house_area_median"].tolist() == [
+        10.0,
+        35.0,
+        10.0,
+        40.0,
+        35.0,
+    ]
+    assert train_agg["cluster_count"].tolist() == [2, 2, 2, 1, 2]
+    assert test_agg["cluster_target_std"].isna().all()
+    assert test_agg["cluster_count"].tolist()[0] == 1
+    assert np.isnan(test_agg["cluster_count"].tolist()[1])
+
+
+def test_inplace_features_match_copies():
+    """inplace=Trueの結果がコピーした場合と一致し、元の列をコピーしないテスト"""
+    train = _sample_coords(300, seed=0)
+    test = _sample_coords(100, seed=1)
+    for df in [train, test]:
+        df["year_built"] = 2000.0
+        df["building_type"] = np.arange(len(df)) % 3
+
+    def run(train, test, inplace):
+        train, test, _ = create_kmeans_clusters(
+            train, test, n_clusters=5, random_state=0, inplace=inplace
+        )
+        train, test = create_density_features(
+            train, test, radii_km=[50.0], inplace=inplace
+        )
+        train = create_distance_features(train, inplace=inplace)
+        return create_derived_features(train, inplace=inplace), test
+
+    expected_train, expected_test = run(train, test, inplace=False)
+    assert "geo_cluster" not in train.columns
+
+    lat = train["lat"].to_numpy()
+    result_train, result_test = run(train, test, inplace=True)
+    assert result_train is train and result_test is test
+    assert np.shares_memory(result_train["lat"].to_numpy(), lat)
+    pd.testing.assert_frame_equal(result_train, expected_train)
+    pd.testing.assert_frame_equal(result_test, expected_test)
@@ -0,0 +1,80 @@
+"""fit/transform形式の地理空間特徴量のテスト"""
+
+import pickle
+
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import make_pipeline
+
+from src.features.geo_transformers import (
+    ClusterAggregationTransformer,
+    DerivedFeatureTransformer,
+    DistanceTransformer,
+    GeoClusterTransformer,
+    TargetEncodingTransformer,
+)
+
+
+def _sample_listings(n_rows, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "lat": rng.uniform(33.0, 36.0, n_rows),
+            "lon": rng.uniform(130.0, 140.0, n_rows),
+            "house_area": rng.uniform(20.0, 120.0, n_rows),
+            "year_built": rng.integers(1970, 2023, n_rows).astype(float),
+            "walk_distance1": rng.uniform(0.0, 2000.0, n_rows),
+            "money_kyoueki": rng.uniform(0.0, 20000.0, n_rows),
+            "target_ym": rng.choice(["201901", "202007", "202201"], n_rows),
+            "city": rng.choice(["a", "b", "c", None], n_rows),
+            "prefecture": rng.choice(["x", "y"], n_rows),
+            "eki_name1": rng.choice(["s1", "s2", "s3"], n_rows),
+        },
+        index=pd.RangeIndex(1000, 1000 + n_rows),
+    )
+    df.loc[::11, "lat"] = np.nan
+    return df
+
+
+def _make_pipeline():
+    return make_pipeline(
+        DerivedFeatureTransformer(),
+        GeoClusterTransformer(n_clusters=6, random_state=0),
+        ClusterAggregationTransformer(),
+        TargetEncodingTransformer(),
+        DistanceTransformer(),
+    )
+
+
+def test_pipeline_transforms_single_row_like_batch():
+    """学習済みのパイプラインで1行ずつ変換した結果がまとめて変換した結果と一致するテスト"""
+    train = _sample_listings(400, seed=0)
+    test = _sample_listings(50, seed=1)
+    target = pd.Series(np.random.default_rng(2).uniform(5e6, 5e7, len(train)))
+
+    pipeline = _make_pipeline().fit(train, target)
+    batch = pipeline.transform(test)
+
+    assert batch.index.equals(test.index)
+    assert batch["geo_cluster"].loc[test["lat"].isna()].eq(-1).all()
+    for column in ["cluster_target_mean", "city_target_encoded", "distance_to_tokyo"]:
+        assert column in batch.columns
+
+    for i in [0, 11, 49]:
+        row = pipeline.transform(test.iloc[[i]])
+        pd.testing.assert_frame_equal(row, batch.iloc[[i]])
+
+
+def test_pipeline_pickle_roundtrip():
+    """pickleで保存・読み込みしたパイプラインの変換結果が一致するテスト"""
+    train = _sample_listings(300, seed=0)
+    test = _sample_listings(30, seed=1)
+    target = pd.Series(np.random.default_rng(2).uniform(5e6, 5e7, len(train)))
+
+    pipeline = _make_pipeline().fit(train, target)
+    loaded = pickle.loads(pickle.dumps(pipeline))
+
+    pd.testing.assert_frame_equal(loaded.transform(test), pipeline.transform(test))
+    # 状態は学習データの行数に依存しない（クラスタ + 欠損の-1ごとの統計量のみ）
+    aggregation = loaded[2]
+    assert len(aggregation.stats_) == len(aggregation.keys_) <= 6 + 1
@@ -0,0 +1,136 @@
+"""近傍物件の価格の特徴量のテスト"""
+
+import numpy as np
+import pandas as pd
+
+from src.features.distance import haversine_distance
+from src.features.knn_features import OOFKNNPriceEncoder, OOFTemporalKNNEncoder
+
+
+def _brute_force(lat, lon, train_lat, train_lon, y, candidates, k, eps_km):
+    """候補の行から近いk件の統計量を全件の距離で計算"""
+    distances = haversine_distance(
+        lat, lon, train_lat[candidates], train_lon[candidates]
+    )
+    order = np.argsort(distances)[:k]
+    d = distances[order]
+    prices = y[candidates][order]
+    weights = 1.0 / (d + eps_km)
+    return (
+        prices.mean(),
+        np.median(prices),
+        (weights * prices).sum() / weights.sum(),
+        d.mean(),
+    )
+
+
+def test_oof_knn_price_encoder_matches_brute_force():
+    """自身の行と検証foldを除いた近傍が全件の距離の昇順と一致するテスト"""
+    rng = np.random.default_rng(0)
+    n = 120
+    train = pd.DataFrame(
+        {"lat": rng.uniform(35, 36, n), "lon": rng.uniform(139, 140, n)},
+        index=np.arange(n) + 1000,
+    )
+    train.loc[1005, "lat"] = np.nan
+    target = pd.Series(rng.normal(15, 1, n), index=train.index)
+    fold_ids = np.arange(n) % 3
+    test = pd.DataFrame(
+        {"lat": rng.uniform(35, 36, 20), "lon": rng.uniform(139, 140, 20)}
+    )
+
+    encoder = OOFKNNPriceEncoder(k=5).fit(train, target, fold_ids)
+    lat, lon, y = train["lat"].values, train["lon"].values, target.values
+    has_coords = ~np.isnan(lat)
+    columns = [
+        "knn5_price_mean",
+        "knn5_price_median",
+        "knn5_price_wmean",
+        "knn5_distance_mean",
+    ]
+
+    fold = 1
+    features = encoder.fold_features(fold)
+    assert list(features.columns) == columns
+    assert features.index.equals(train.index)
+    assert features.loc[1005].isna().all()
+    for i in [0, 1, 2, 10, 50]:
+        candidates = np.flatnonzero(
+            (fold_ids != fold) & (fold_ids != fold_ids[i]) & has_coords
+        )
+        assert i not in candidates
+        expected = _brute_force(lat[i], lon[i], lat, lon, y, candidates, 5, 0.05)
+        assert np.allclose(features.iloc[i].values, expected)
+
+    test_result = encoder.test_features(test, fold)
+    candidates = np.flatnonzero((fold_ids != fold) & has_coords)
+    for i in range(len(test)):
+        expected = _brute_force(
+            test["lat"].values[i],
+            test["lon"].values[i],
+            lat,
+            lon,
+            y,
+            candidates,
+            5,
+            0.05,
+        )
+        assert np.allclose(test_result.iloc[i].values, expected)
+
+    assert OOFKNNPriceEncoder(k=0).fit(train, target, fold_ids).fold_features(
+        0
+    ).shape == (n, 0)
+
+
+def test_oof_temporal_knn_encoder_uses_earlier_snapshots_only():
+    """近傍が前の時点・対象のfoldの物件のみから選ばれるテスト"""
+    rng = np.random.default_rng(1)
+    n = 300
+    yms = np.array([201901, 201907, 202001, 202007])
+    train = pd.DataFrame(
+        {
+            "lat": rng.uniform(35, 36, n),
+            "lon": rng.uniform(139, 140, n),
+            "target_ym": rng.choice(yms, n).astype(str),
+        }
+    )
+    target = pd.Series(rng.normal(15, 1, n))
+    fold_ids = np.arange(n) % 3
+    test = pd.DataFrame(
+        {
+            "lat": rng.uniform(35, 36, 10),
+            "lon": rng.uniform(139, 140, 10),
+            "target_ym": ["202007"] * 5 + ["201907"] * 5,
+        }
+    )
+
+    encoder = OOFTemporalKNNEncoder(k=4, max_lag_months=12).fit(train, target, fold_ids)
+    lat, lon, y = train["lat"].values, train["lon"].values, target.values
+    ym = train["target_ym"].astype(int).values
+    months = ym // 100 * 12 + ym % 100
+
+    def expected(lat_i, lon_i, month, candidates):
+        candidates = candidates & (months < month) & (months >= month - 12)
+        rows = np.flatnonzero(candidates)
+        stats = _brute_force(lat_i, lon_i, lat, lon, y, rows, 4, 0.05)
+        distances = haversine_distance(lat_i, lon_i, lat[rows], lon[rows])
+        lag = (month - months[rows][np.argsort(distances)[:4]]).mean()
+        return [*stats, lag]
+
+    fold = 2
+    features = encoder.fold_features(fold)
+    assert features.columns[-1] == "tknn4_months_ago_mean"
+    assert features[months == months.min()].isna().all().all()
+    for i in np.flatnonzero(months > months.min())[:20]:
+        candidates = (fold_ids != fold) & (fold_ids != fold_ids[i])
+        assert np.allclose(
+            features.iloc[i].values, expected(lat[i], lon[i], months[i], candidates)
+        )
+
+    test_result = encoder.test_features(test, fold)
+    for i in range(len(test)):
+        month = int(test["target_ym"][i]) // 100 * 12 + int(test["target_ym"][i]) % 100
+        assert np.allclose(
+            test_result.iloc[i].values,
+            expected(test["lat"][i], test["lon"][i], month, fold_ids != fold),
+        )
@@ -0,0 +1,106 @@
+"""国土数値情報の読み込みと空間結合のテスト"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from src.data.kokudo import POINT, POLYGON, load_layer
+from src.features.distance import haversine_distance
+from src.features.spatial_join import spatial_join_features
+
+
+def _write_geojson(path, features):
+    collection = {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": geometry, "properties": properties}
+            for geometry, properties in features
+        ],
+    }
+    path.write_text(json.dumps(collection, ensure_ascii=False), encoding="utf-8")
+
+
+def test_load_layer_points_and_lines(tmp_path):
+    """点と線（駅）が代表点の点のレイヤーになるテスト"""
+    path = tmp_path / "stations.geojson"
+    _write_geojson(
+        path,
+        [
+            ({"type": "Point", "coordinates": [139.7671, 35.6812]}, {"name": "東京"}),
+            (
+                {
+                    "type": "LineString",
+                    "coordinates": [[139.70, 35.69], [139.71, 35.69]],
+                },
+                {"name": "新宿"},
+            ),
+        ],
+    )
+    layer = load_layer(path, columns=["name"])
+
+    assert layer.kind == POINT
+    assert layer.attributes["name"].tolist() == ["東京", "新宿"]
+    assert np.allclose(layer.lon, [139.7671, 139.705])
+    assert layer.tree.n == 2
+
+
+def test_load_layer_polygons(tmp_path):
+    """ポリゴン（穴・マルチポリゴン）のリングのオフセットのテスト"""
+    square = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+    hole = [[0.2, 0.2], [0.4, 0.2], [0.4, 0.4], [0.2, 0.2]]
+    path = tmp_path / "zoning.geojson"
+    _write_geojson(
+        path,
+        [
+            ({"type": "Polygon", "coordinates": [square, hole]}, {"zone": 1}),
+            (
+                {"type": "MultiPolygon", "coordinates": [[square], [square]]},
+                {"zone": 2},
+            ),
+        ],
+    )
+    layer = load_layer(path)
+
+    assert layer.kind == POLYGON
+    assert layer.ring_offsets.tolist() == [0, 5, 9, 14, 19]
+    assert layer.part_offsets.tolist() == [0, 2, 4]
+    assert layer.index is not None
+    assert load_layer(path, build_index=False).index is None
+
+
+def test_spatial_join_matches_brute_force(tmp_path):
+    """バッチ処理した最寄り距離・半径内の件数・属性が全件計算と一致するテスト"""
+    rng = np.random.default_rng(0)
+    poi_lat = rng.uniform(35.5, 35.8, 300)
+    poi_lon = rng.uniform(139.5, 139.9, 300)
+    path = tmp_path / "land_price.geojson"
+    _write_geojson(
+        path,
+        [
+            ({"type": "Point", "coordinates": [lon, lat]}, {"price": i * 1000})
+            for i, (lat, lon) in enumerate(zip(poi_lat, poi_lon))
+        ],
+    )
+    layer = load_layer(path, columns=["price"])
+
+    df = pd.DataFrame(
+        {"lat": rng.uniform(35.5, 35.8, 50), "lon": rng.uniform(139.5, 139.9, 50)}
+    )
+    df.loc[7, "lat"] = np.nan
+    specs = {"land_price": {"radii_km": [1.0], "attributes": ["price"]}}
+    result = spatial_join_features(df, {"land_price": layer}, specs, batch_size=16)
+
+    distances = haversine_distance(
+        df["lat"].values[:, None], df["lon"].values[:, None], poi_lat, poi_lon
+    )
+    valid = df["lat"].notna().to_numpy()
+    nearest = np.argmin(distances[valid], axis=1)
+    assert np.allclose(
+        result["land_price_nearest_km"][valid], distances[valid].min(axis=1)
+    )
+    assert (result["land_price_price"][valid] == nearest * 1000).all()
+    assert (
+        result["land_price_count_1km"][valid] == (distances[valid] <= 1.0).sum(axis=1)
+    ).all()
+    assert result.loc[7, ["land_price_nearest_km", "land_price_count_1km"]].isna().all()
@@ -0,0 +1,85 @@
+"""データ読み込みのテスト"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.load import convert_csv_to_parquet, load_parquet_dataset, load_raw_csv
+
+
+def _write_sample_csv(path):
+    df = pd.DataFrame(
+        {
+            "target_ym": [202307, 201901, 202307, 201907, 201901],
+            "lat": [35.5, 34.25, 35.0, np.nan, 33.75],
+            "house_area": [50, 60, 70, 80, 90],
+            "full_address": ["東京都A", "大阪府B", "東京都A", None, "北海道C"],
+            "building_name": ["x", "y", "z", "w", "v"],
+        }
+    )
+    df.to_csv(path, index=False)
+    return df
+
+
+def test_load_raw_csv(tmp_path):
+    """削除対象の列のスキップと型変換のテスト"""
+    path = tmp_path / "train.csv"
+    expected = _write_sample_csv(path)
+
+    df = load_raw_csv(path)
+
+    assert "building_name" not in df.columns
+    assert isinstance(df["full_address"].dtype, pd.CategoricalDtype)
+    assert df["house_area"].dtype == np.int32
+    assert df["lat"].dtype == np.float32
+    assert np.allclose(df["lat"], expected["lat"], equal_nan=True)
+
+
+def test_parquet_dataset_roundtrip(tmp_path):
+    """Parquet変換後に列・期間を絞って元の行順で読み込めることのテスト"""
+    path = tmp_path / "train.csv"
+    expected = _write_sample_csv(path)
+    dataset_dir = tmp_path / "train_parquet"
+
+    convert_csv_to_parquet(path, dataset_dir)
+    assert sorted(p.name for p in dataset_dir.iterdir()) == [
+        "target_ym=201901",
+        "target_ym=201907",
+        "target_ym=202307",
+    ]
+
+    df = load_parquet_dataset(dataset_dir)
+    assert list(df.columns) == ["lat", "house_area", "full_address", "target_ym"]
+    assert df["target_ym"].tolist() == expected["target_ym"].tolist()
+    assert df["house_area"].tolist() == expected["house_area"].tolist()
+
+    subset = load_parquet_dataset(
+        dataset_dir, columns=["house_area", "target_ym"], target_yms=[201901]
+    )
+    assert list(subset.columns) == ["house_area", "target_ym"]
+    assert subset["house_area"].tolist() == [60, 90]
+
+
+def test_parquet_dataset_keeps_schema_across_partitions(tmp_path):
+    """ある月で全て欠損の文字列の列も共通の型で保存され、読み込めることのテスト"""
+    path = tmp_path / "train.csv"
+    pd.DataFrame(
+        {
+            "target_ym": [201901, 202001, 202001],
+            "building_create_date": [None, "2020/01/01 x", "2020/02/01 y"],
+            "lat": [35.0, 35.5, 36.0],
+        }
+    ).to_csv(path, index=False)
+    dataset_dir = tmp_path / "train_parquet"
+
+    convert_csv_to_parquet(path, dataset_dir)
+    df = load_parquet_dataset(dataset_dir)
+    assert df["building_create_date"].tolist()[1:] == ["2020/01/01 x", "2020/02/01 y"]
+    assert pd.isna(df["building_create_date"].iloc[0])
+
+    # パーティション列が欠損している行は除外せずにエラーにする
+    pd.DataFrame({"target_ym": [201901, None], "lat": [35.0, 36.0]}).to_csv(
+        path, index=False
+    )
+    with pytest.raises(ValueError):
+        convert_csv_to_parquet(path, dataset_dir)
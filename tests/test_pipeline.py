@@ -0,0 +1,77 @@
+"""パイプライン実行のテスト"""
+
+import threading
+
+import pandas as pd
+import pytest
+
+from src.utils.cache import FeatureCache
+from src.utils.pipeline import Node, Pipeline
+
+CALLS = []
+
+
+def _make_frame(n_rows):
+    CALLS.append("load")
+    return pd.DataFrame({"x": range(n_rows)})
+
+
+def _add(df, value):
+    CALLS.append(f"add{value}")
+    return df.assign(x=df["x"] + value)
+
+
+def _concat(left, right):
+    CALLS.append("concat")
+    return pd.concat([left, right], ignore_index=True)
+
+
+def _nodes(left_value=1, right_value=2):
+    return [
+        Node("load", _make_frame, [], ["raw"], params={"n_rows": 3}),
+        Node("left", _add, ["raw"], ["left"], params={"value": left_value}),
+        Node("right", _add, ["raw"], ["right"], params={"value": right_value}),
+        Node("concat", _concat, ["left", "right"], ["out"]),
+    ]
+
+
+def test_pipeline_reruns_only_changed_nodes(tmp_path):
+    """変更したノードとその下流だけが再実行されるテスト"""
+    cache = FeatureCache(tmp_path / "cache")
+
+    CALLS.clear()
+    out = Pipeline(_nodes(), cache=cache).run(["out"])["out"]
+    assert out["x"].tolist() == [1, 2, 3, 2, 3, 4]
+    assert sorted(CALLS) == ["add1", "add2", "concat", "load"]
+
+    # 全てキャッシュから読み込まれる
+    CALLS.clear()
+    Pipeline(_nodes(), cache=cache).run(["out"])
+    assert CALLS == []
+
+    # rightのパラメータを変更するとrightとconcatだけが再実行される
+    CALLS.clear()
+    out = Pipeline(_nodes(right_value=5), cache=cache).run(["out"])["out"]
+    assert out["x"].tolist() == [1, 2, 3, 5, 6, 7]
+    assert CALLS == ["add5", "concat"]
+
+
+def test_pipeline_runs_independent_nodes_in_parallel():
+    """依存関係のないノードが並列に実行されるテスト"""
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_for_other(value):
+        barrier.wait()
+        return value
+
+    nodes = [
+        Node("a", wait_for_other, [], ["a"], params={"value": 1}, code=[]),
+        Node("b", wait_for_other, [], ["b"], params={"value": 2}, code=[]),
+    ]
+    assert Pipeline(nodes, max_workers=2).run(["a", "b"]) == {"a": 1, "b": 2}
+
+
+def test_pipeline_validates_graph():
+    """入力を出力するノードがない場合のエラーのテスト"""
+    with pytest.raises(ValueError):
+        Pipeline([Node("a", _concat, ["missing", "raw"], ["out"])])
@@ -0,0 +1,124 @@
+"""格子インデックスによるポリゴンの内外判定のテスト"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from src.data.kokudo import load_layer
+from src.features import polygon_index
+from src.features.polygon_index import PolygonIndex, assign_polygons
+from src.features.spatial_join import spatial_join_features
+
+
+def _ring(cx, cy, radius, n_vertices, rng):
+    """中心の周りの星形のリング（閉じた頂点列）"""
+    angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+    radii = radius * rng.uniform(0.4, 1.0, n_vertices)
+    ring = np.column_stack([cx + radii * np.cos(angles), cy + radii * np.sin(angles)])
+    return np.vstack([ring, ring[:1]])
+
+
+def _contains(rings, lon, lat):
+    """偶奇規則による内外判定（全辺を調べる）"""
+    inside = np.zeros(len(lon), dtype=bool)
+    for ring in rings:
+        for (x1, y1), (x2, y2) in zip(ring[:-1], ring[1:]):
+            crossing = (y1 > lat) != (y2 > lat)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cross_x = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= crossing & (cross_x > lon)
+    return inside
+
+
+def test_polygon_index_matches_brute_force(tmp_path):
+    """格子インデックスの判定が全辺の偶奇判定と一致するテスト（穴・保存を含む）"""
+    rng = np.random.default_rng(0)
+    polygons = []
+    for i in range(8):
+        cx, cy = 135 + i * 0.6, 35 + (i % 2) * 0.6
+        rings = [_ring(cx, cy, 0.25, 60, rng)]
+        if i % 2 == 0:
+            rings.append(_ring(cx, cy, 0.05, 6, rng))
+        polygons.append(rings)
+
+    rings = [ring for polygon in polygons for ring in polygon]
+    coords = np.concatenate(rings)
+    ring_offsets = np.concatenate([[0], np.cumsum([len(r) for r in rings])])
+    part_offsets = np.concatenate([[0], np.cumsum([len(p) for p in polygons])])
+    index = PolygonIndex.build(coords, ring_offsets, part_offsets, cell_size=0.05)
+
+    lon = rng.uniform(134.6, 139.6, 5000)
+    lat = rng.uniform(34.6, 35.9, 5000)
+    lat[0] = np.nan
+    expected = np.full(len(lon), -1)
+    for i, polygon in enumerate(polygons):
+        expected[_contains(polygon, lon, lat)] = i
+
+    assert (index.query(lat, lon) == expected).all()
+
+    index.save(tmp_path / "index.npz")
+    loaded = PolygonIndex.load(tmp_path / "index.npz")
+    result = assign_polygons(loaded, lat, lon, batch_size=1000, n_jobs=2)
+    assert (result == expected).all()
+
+    # 保存したインデックスは作成元のポリゴン・セルの大きさとだけ一致する
+    assert loaded.matches(coords, ring_offsets, part_offsets, 0.05)
+    assert not loaded.matches(coords, ring_offsets, part_offsets, 0.1)
+    assert not loaded.matches(coords + 0.01, ring_offsets, part_offsets, 0.05)
+
+
+def test_assign_polygons_process_pool(monkeypatch):
+    """小さなバッチで複数プロセスの判定を通り、現在のプロセスの判定と一致するテスト"""
+    rng = np.random.default_rng(1)
+    polygons = [[_ring(135 + i * 0.6, 35.0, 0.25, 40, rng)] for i in range(3)]
+    rings = [ring for polygon in polygons for ring in polygon]
+    coords = np.concatenate(rings)
+    ring_offsets = np.concatenate([[0], np.cumsum([len(r) for r in rings])])
+    part_offsets = np.arange(len(polygons) + 1)
+    index = PolygonIndex.build(coords, ring_offsets, part_offsets, cell_size=0.05)
+
+    lon = rng.uniform(134.6, 136.6, 600)
+    lat = rng.uniform(34.6, 35.4, 600)
+
+    pools = []
+
+    class SpyExecutor(polygon_index.ProcessPoolExecutor):
+        def __init__(self, max_workers, **kwargs):
+            pools.append(max_workers)
+            super().__init__(max_workers, **kwargs)
+
+    monkeypatch.setattr(polygon_index, "ProcessPoolExecutor", SpyExecutor)
+
+    expected = assign_polygons(index, lat, lon, batch_size=100, n_jobs=1)
+    assert pools == []
+    result = assign_polygons(index, lat, lon, batch_size=100, n_jobs=2)
+    assert pools == [2]
+    assert (result == expected).all()
+    assert (expected >= 0).any()
+
+
+def test_spatial_join_polygon_attributes(tmp_path):
+    """点を含むポリゴンの属性が追加されるテスト"""
+    square = [[139.0, 35.0], [139.1, 35.0], [139.1, 35.1], [139.0, 35.1], [139.0, 35.0]]
+    path = tmp_path / "zoning.geojson"
+    collection = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [square]},
+                "properties": {"zone": "商業地域"},
+            }
+        ],
+    }
+    path.write_text(json.dumps(collection, ensure_ascii=False), encoding="utf-8")
+    layer = load_layer(path, columns=["zone"])
+
+    df = pd.DataFrame({"lat": [35.05, 35.2, np.nan], "lon": [139.05, 139.05, 139.0]})
+    result = spatial_join_features(
+        df, {"zoning": layer}, {"zoning": {"attributes": ["zone"], "n_jobs": 1}}
+    )
+
+    assert result["zoning_zone"].iloc[0] == "商業地域"
+    assert result["zoning_zone"].iloc[1:].isna().all()
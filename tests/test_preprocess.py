@@ -0,0 +1,165 @@
+"""前処理のテスト"""
+
+import numpy as np
+import pandas as pd
+
+from src.data.preprocess import (
+    densify_columns,
+    expand_slash_features,
+    fit_slash_vocabulary,
+    get_sparse_columns,
+    load_slash_vocabulary,
+    parse_addresses,
+    process_date_features,
+    save_slash_vocabulary,
+    sparsify_columns,
+)
+
+
+def _expand_slash_features_naive(df, columns):
+    """行ごとに分割する参照実装"""
+    new_columns = {}
+    for col in columns:
+        unique_values = set()
+        for val in df[col].dropna():
+            if isinstance(val, str) and "/" in val:
+                unique_values.update(val.split("/"))
+        for value in sorted(unique_values):
+            new_columns[f"{col}_{value}"] = df[col].apply(
+                lambda x: 1 if isinstance(x, str) and value in x.split("/") else 0
+            )
+    return pd.DataFrame(new_columns, index=df.index)
+
+
+def _sample_tag_frame():
+    return pd.DataFrame(
+        {
+            "building_tag_id": ["1/2", "2/3/3", np.nan, "4", "1/4", 5],
+            "statuses": ["a", "b", "c", np.nan, "a", "b"],
+        },
+        index=[10, 11, 12, 13, 14, 15],
+    )
+
+
+def test_expand_slash_features_matches_naive():
+    """one-hot展開が行ごとの実装と一致することのテスト"""
+    df = _sample_tag_frame()
+    columns = ["building_tag_id", "statuses", "not_exists"]
+
+    result = expand_slash_features(df, columns)
+    expected = _expand_slash_features_naive(df, ["building_tag_id", "statuses"])
+
+    new_cols = [col for col in result.columns if col not in df.columns]
+    assert new_cols == list(expected.columns)
+    assert (result.index == df.index).all()
+    for col in new_cols:
+        assert result[col].dtype == np.uint8
+        assert (result[col].to_numpy() == expected[col].to_numpy()).all()
+
+
+def test_expand_slash_features_sparse_output():
+    """Sparse出力が通常出力と同じ値を持つことのテスト"""
+    df = _sample_tag_frame()
+    columns = ["building_tag_id", "statuses"]
+
+    dense = expand_slash_features(df, columns)
+    result = expand_slash_features(df, columns, sparse_output=True)
+
+    sparse_cols = get_sparse_columns(result)
+    assert sparse_cols == [col for col in dense.columns if col not in df.columns]
+    for col in sparse_cols:
+        assert result[col].dtype == pd.SparseDtype(np.uint8, 0)
+        assert (result[col].sparse.to_dense() == dense[col]).all()
+
+    # parquet保存用の相互変換
+    restored = sparsify_columns(densify_columns(result, sparse_cols), sparse_cols)
+    assert list(restored.columns) == list(result.columns)
+    assert get_sparse_columns(restored) == sparse_cols
+
+
+def test_slash_vocabulary_roundtrip(tmp_path):
+    """学習済み語彙で展開列がバッチに依存しないことのテスト"""
+    df = _sample_tag_frame()
+    columns = ["building_tag_id", "statuses"]
+
+    vocabulary = fit_slash_vocabulary(df, columns)
+    path = tmp_path / "tag_vocabulary.json"
+    save_slash_vocabulary(vocabulary, path)
+    loaded = load_slash_vocabulary(path)
+    assert loaded == vocabulary
+
+    # 未知タグを含む1行だけのバッチでも同じ列が得られる
+    batch = pd.DataFrame({"building_tag_id": ["9/2"], "statuses": ["a"]})
+    full = expand_slash_features(df, columns)
+    result = expand_slash_features(batch, columns, vocabulary=loaded)
+    new_cols = [col for col in full.columns if col not in df.columns]
+    assert [col for col in result.columns if col not in batch.columns] == new_cols
+    assert result["building_tag_id_2"].iloc[0] == 1
+    assert result[new_cols].to_numpy().sum() == 1
+
+
+def test_process_date_features_formats():
+    """日付フォーマットごとに年・月が抽出されることのテスト"""
+    df = pd.DataFrame(
+        {
+            "building_create_date": [
+                "2019-01-15 10:00:00",
+                np.nan,
+                "2021-12-01 00:00:00",
+            ],
+            "reform_date": [201903.0, np.nan, 20201130.0],
+            "usable_date": ["2020/07/01", "2020/08/01", np.nan],
+        }
+    )
+    timings = {}
+    result = process_date_features(df, timings=timings)
+
+    assert not set(df.columns) & set(result.columns)
+    assert result["building_create_date_year"].dtype == "Int16"
+    assert result["building_create_date_ym"].dtype == "Int32"
+    assert result["building_create_date_ym"].tolist() == [201901, pd.NA, 202112]
+    assert result["reform_date_year"].tolist() == [2019, pd.NA, 2020]
+    assert result["reform_date_month"].tolist() == [3, pd.NA, 11]
+    assert result["usable_date_month"].tolist() == [7, 8, pd.NA]
+    assert timings["building_create_date"][0] == "%Y-%m-%d %H:%M:%S"
+    assert timings["reform_date"][0] == "numeric"
+    assert timings["usable_date"][0] == "%Y/%m/%d"
+
+
+def test_parse_addresses():
+    """住所の分割（4文字の県、郡部、政令指定都市の区、市の後ろの「郡」）のテスト"""
+    addresses = pd.Series(
+        [
+            "神奈川県横浜市中区山下町",
+            "東京都新宿区市谷本村町",
+            "和歌山県西牟婁郡白浜町",
+            "三重県四日市市諏訪町",
+            np.nan,
+            "神奈川県横浜市中区山下町",
+            "鹿児島県鹿児島市郡元町1-1",
+            "大阪府高槻市郡家新町",
+            "愛知県名古屋市中村区名駅",
+        ],
+        index=[5, 6, 7, 8, 9, 10, 11, 12, 13],
+    )
+    result = parse_addresses(addresses)
+
+    assert (result.index == addresses.index).all()
+    assert all(isinstance(dtype, pd.CategoricalDtype) for dtype in result.dtypes)
+    assert result["prefecture"].tolist()[:4] == ["神奈川県", "東京都", "和歌山県", "三重県"]
+    assert result["city"].tolist()[:4] == [
+        "神奈川県横浜市",
+        "東京都新宿区",
+        "和歌山県西牟婁郡白浜町",
+        "三重県四日市市",
+    ]
+    assert result["ward"].iloc[0] == "神奈川県横浜市中区"
+    assert result["ward"].iloc[1:5].isna().all()
+    assert result.iloc[4].isna().all()
+    assert result.iloc[5].tolist() == result.iloc[0].tolist()
+    # 市の後ろの「郡」は郡部と誤らない
+    assert result["city"].tolist()[6:8] == ["鹿児島県鹿児島市", "大阪府高槻市"]
+    assert result["ward"].iloc[6:8].isna().all()
+    # 「村」「町」を含む区
+    assert result["city"].iloc[8] == "愛知県名古屋市"
+    assert result["ward"].iloc[8] == "愛知県名古屋市中村区"
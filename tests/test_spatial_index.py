@@ -0,0 +1,53 @@
+"""空間インデックスのテスト"""
+
+import numpy as np
+import pandas as pd
+
+from src.features.geo_features import create_cluster_aggregation_features
+from src.features.spatial_index import add_spatial_cells, geohash_encode, jis_mesh_code
+
+
+def test_geohash_encode_known_values():
+    """既知のgeohashと一致するテスト"""
+    lat = np.array([57.64911, 35.681236, np.nan])
+    lon = np.array([10.40744, 139.767125, 139.0])
+
+    assert geohash_encode(lat, lon, precision=11).tolist() == [
+        "u4pruydqqvj",
+        "xn76urx6606",
+        "missing",
+    ]
+    assert geohash_encode(lat[1:2], lon[1:2], precision=5).tolist() == ["xn76u"]
+
+
+def test_jis_mesh_code_known_values():
+    """既知の地域メッシュコード（東京駅・メッシュの境界）と一致するテスト"""
+    lat = np.array([35.681236, 35.0, np.nan])
+    lon = np.array([139.767125, 135.0, 139.0])
+
+    assert jis_mesh_code(lat, lon, level=1).tolist() == [5339, 5235, -1]
+    assert jis_mesh_code(lat, lon, level=2).tolist() == [533946, 523540, -1]
+    assert jis_mesh_code(lat, lon, level=3).tolist() == [53394611, 52354000, -1]
+
+
+def test_spatial_cells_as_aggregation_key():
+    """格子セルをクラスター集約のキーに使えるテスト"""
+    train = pd.DataFrame(
+        {
+            "lat": [35.6812, 35.6813, 34.70],
+            "lon": [139.7671, 139.7672, 135.50],
+            "money_room": [10.0, 12.0, 8.0],
+        }
+    )
+    test = pd.DataFrame({"lat": [35.6814, np.nan], "lon": [139.7670, 139.0]})
+
+    train = add_spatial_cells(train, geohash_precisions=[6], mesh_levels=[3])
+    test = add_spatial_cells(test, geohash_precisions=[6], mesh_levels=[3])
+    train, test = create_cluster_aggregation_features(
+        train, test, cluster_col="mesh3", agg_cols=[]
+    )
+
+    assert train["mesh3_target_mean"].tolist() == [11.0, 11.0, 8.0]
+    assert test["mesh3_target_mean"].iloc[0] == 11.0
+    assert np.isnan(test["mesh3_target_mean"].iloc[1])
+    assert test["geohash6"].tolist()[1] == "missing"
@@ -0,0 +1,257 @@
+"""OOFの目的変数の統計量のテスト"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.model_selection import KFold
+
+from src.features.geo_pipeline import build_geo_pipeline, run_target_encoding
+from src.features.target_stats import OOFTargetEncoder, TargetStatsStore
+from src.models.train_catboost import make_fold_ids
+from src.utils.pipeline import Node, Pipeline
+
+
+def _sample_data(n_rows=300, seed=0):
+    rng = np.random.default_rng(seed)
+    train = pd.DataFrame(
+        {
+            "geo_cluster": rng.integers(0, 6, n_rows).astype(str),
+            "city": rng.choice(["a", "b", "c", None], n_rows),
+        },
+        index=np.arange(n_rows) * 10,
+    )
+    target = pd.Series(rng.normal(10, 1, n_rows), index=train.index)
+    return train, target
+
+
+def test_make_fold_ids_matches_kfold():
+    """make_fold_idsがKFoldの分割と一致するテスト"""
+    fold_ids = make_fold_ids(50, n_splits=3, random_state=42)
+    kf = KFold(n_splits=3, shuffle=True, random_state=42)
+    for fold, (_, valid_idx) in enumerate(kf.split(np.empty((50, 1)))):
+        assert (np.flatnonzero(fold_ids == fold) == valid_idx).all()
+
+
+def test_oof_target_encoder_matches_naive():
+    """foldごとの統計量が、該当foldを除いてgroupbyした結果と一致するテスト"""
+    train, target = _sample_data()
+    fold_ids = make_fold_ids(len(train), n_splits=4, random_state=0)
+    encoder = OOFTargetEncoder(["geo_cluster", "city"], smoothing=5.0)
+    encoder.fit(train, target, fold_ids)
+
+    fold = 1
+    features = encoder.fold_features(fold)
+    assert features.index.equals(train.index)
+
+    for row in [0, 7, 123]:
+        row_fold = fold_ids[row]
+        used = (fold_ids != fold) & (fold_ids != row_fold)
+        same_key = (train["city"] == train["city"].iloc[row]).to_numpy()
+        values = target[used & same_key]
+        assert np.isclose(features["city_target_mean"].iloc[row], values.mean())
+        assert np.isclose(features["city_target_std"].iloc[row], values.std())
+        assert features["city_count"].iloc[row] == len(values)
+
+        prior = target[used].mean()
+        encoded = (values.sum() + prior * 5.0) / (len(values) + 5.0)
+        assert np.isclose(features["city_target_encoded"].iloc[row], encoded)
+
+    # キーが欠損している行は平均が欠損、平滑化した値は事前分布
+    missing = train["city"].isna().to_numpy()
+    assert features.loc[missing, "city_target_mean"].isna().all()
+    assert (features.loc[missing, "city_count"] == 0).all()
+
+    test = pd.DataFrame({"geo_cluster": ["0", "unseen"], "city": ["a", "a"]})
+    test_features = encoder.test_features(test, fold)
+    used = fold_ids != fold
+    expected = target[used & (train["geo_cluster"] == "0").to_numpy()].mean()
+    assert np.isclose(test_features["cluster_target_mean"].iloc[0], expected)
+    assert np.isnan(test_features["cluster_target_mean"].iloc[1])
+    assert test_features["cluster_count"].tolist()[1] == 0
+    assert np.isclose(
+        test_features["cluster_target_encoded"].iloc[1], target[used].mean()
+    )
+
+
+def test_target_stats_store_incremental_merge(tmp_path):
+    """月ごとの更新・統合・保存後の統計量が一括集計と一致するテスト"""
+    train, target = _sample_data()
+    key_cols = ["geo_cluster", "city"]
+    full = TargetStatsStore().update(train, target, key_cols)
+
+    first = TargetStatsStore()
+    first.update(train.iloc[:100], target.iloc[:100], key_cols, batch_id="1")
+    first.update(train.iloc[100:200], target.iloc[100:200], key_cols, batch_id="2")
+    second = TargetStatsStore()
+    second.update(train.iloc[200:], target.iloc[200:], key_cols, batch_id="3")
+    first.merge(second)
+    first.save(tmp_path / "target_stats.parquet")
+    loaded = TargetStatsStore.load(tmp_path / "target_stats.parquet")
+
+    assert loaded.batches == ["1", "2", "3"]
+    test = pd.DataFrame({"geo_cluster": ["0", "unseen"], "city": ["a", None]})
+    for smoothing in [0.0, 5.0]:
+        expected = full.encode(test, "city", smoothing)
+        pd.testing.assert_frame_equal(loaded.encode(test, "city", smoothing), expected)
+
+    encoded = loaded.encode(test, "geo_cluster", 5.0)
+    values = target[(train["geo_cluster"] == "0").to_numpy()]
+    assert np.isclose(encoded["mean"].iloc[0], values.mean())
+    assert np.isclose(encoded["std"].iloc[0], values.std())
+    assert encoded["count"].iloc[1] == 0
+    assert np.isclose(encoded["encoded"].iloc[1], target.mean())
+
+    with pytest.raises(ValueError):
+        loaded.update(train, target, key_cols, batch_id="2")
+
+
+def test_oof_target_encoder_combination_and_hierarchy():
+    """組み合わせキーの統計量と、未知のキーが上位の階層に戻るテスト"""
+    train, target = _sample_data()
+    fold_ids = make_fold_ids(len(train), n_splits=3, random_state=0)
+    encoder = OOFTargetEncoder(
+        [["city", "geo_cluster"]],
+        smoothing=5.0,
+        hierarchies=[["city", "geo_cluster"]],
+        count_cols=[],
+    )
+    encoder.fit(train, target, fold_ids)
+
+    test = pd.DataFrame({"geo_cluster": ["0", "unseen"], "city": ["a", "a"]})
+    features = encoder.test_features(test, fold=0)
+    assert not any(col.endswith("_count") for col in features.columns)
+    used = fold_ids != 0
+    same_key = ((train["city"] == "a") & (train["geo_cluster"] == "0")).to_numpy()
+    values = target[used & same_key]
+    assert np.isclose(features["city_x_cluster_target_mean"].iloc[0], values.mean())
+
+    # 下位の階層の事前分布は上位の階層の平滑化した平均
+    city_encoded = features["city_hier_target_encoded"]
+    expected = (values.sum() + city_encoded.iloc[0] * 5.0) / (len(values) + 5.0)
+    assert np.isclose(features["cluster_hier_target_encoded"].iloc[0], expected)
+    assert np.isclose(
+        features["cluster_hier_target_encoded"].iloc[1], city_encoded.iloc[1]
+    )
+
+    # 学習データの特徴量もテストデータと同じ列を持つ
+    assert encoder.fold_features(0).columns.equals(features.columns)
+
+
+def test_oof_target_encoder_all_missing_key():
+    """キー列が全て欠損の場合、全行が事前分布の値になるテスト"""
+    train, target = _sample_data()
+    train["city"] = None
+    fold_ids = make_fold_ids(len(train), n_splits=3, random_state=0)
+    encoder = OOFTargetEncoder(
+        ["city", ["city", "geo_cluster"]],
+        smoothing=5.0,
+        hierarchies=[["city", "geo_cluster"]],
+    )
+    encoder.fit(train, target, fold_ids)
+
+    features = encoder.fold_features(0)
+    assert features["city_target_mean"].isna().all()
+    used = (fold_ids != 0) & (fold_ids != fold_ids[1])
+    assert np.isclose(features["city_target_encoded"].iloc[1], target[used].mean())
+
+    test = pd.DataFrame({"geo_cluster": ["0"], "city": ["a"]})
+    test_features = encoder.test_features(test, fold=0)
+    assert np.isclose(
+        test_features["city_target_encoded"].iloc[0], target[fold_ids != 0].mean()
+    )
+
+
+def test_target_encoding_from_saved_store(tmp_path):
+    """保存した統計量からのTarget Encodingが学習データから集計した結果と一致するテスト"""
+    train, target = _sample_data()
+    train["money_room"] = target
+    test = pd.DataFrame({"geo_cluster": ["0", "9"], "city": ["a", "unseen"]})
+    params = {"categorical_cols": ["geo_cluster", "city"], "smoothing": 5.0}
+
+    TargetStatsStore().update(train, target, ["geo_cluster", "city"], "1").save(
+        tmp_path / "target_stats.parquet"
+    )
+    store = TargetStatsStore.load(tmp_path / "target_stats.parquet")
+
+    expected = run_target_encoding(train, test, **params)
+    result = run_target_encoding(train, test, store, **params)
+    for expected_df, result_df in zip(expected, result):
+        pd.testing.assert_frame_equal(result_df, expected_df)
+
+    # 学習データにあるがstoreにない列はエラー
+    with pytest.raises(ValueError):
+        run_target_encoding(
+            train.assign(prefecture="x"), test, store, categorical_cols=["prefecture"]
+        )
+
+    # 学習データにない列はstoreを渡さない場合と同様に除外する
+    params = {"categorical_cols": ["geo_cluster", "city", "unused"], "smoothing": 5.0}
+    expected = run_target_encoding(train, test, **params)
+    result = run_target_encoding(train, test, store, **params)
+    for expected_df, result_df in zip(expected, result):
+        pd.testing.assert_frame_equal(result_df, expected_df)
+
+
+def test_geo_pipeline_reads_target_stats_store(tmp_path):
+    """build_geo_pipelineのTarget Encodingが保存した統計量を使い、OOFとは併用できないテスト"""
+    train, target = _sample_data()
+    train["money_room"] = target
+    test = pd.DataFrame({"geo_cluster": ["0", "9"], "city": ["a", "unseen"]})
+    for name in ["train.csv", "test.csv"]:
+        (tmp_path / name).touch()
+    path = tmp_path / "target_stats.parquet"
+    # 学習データと異なる統計量を保存し、storeから計算されたことを確かめる
+    TargetStatsStore().update(train, target + 1.0, ["geo_cluster", "city"], "1").save(
+        path
+    )
+
+    geo_params = {
+        "n_clusters": 5,
+        "random_state": 0,
+        "agg_cols": [],
+        "target_encoding_cols": ["geo_cluster", "city"],
+        "smoothing": 5.0,
+        "target_stats_path": str(path),
+    }
+    nodes = {
+        node.name: node
+        for node in build_geo_pipeline(
+            tmp_path / "train.csv",
+            tmp_path / "test.csv",
+            {"target_col": "money_room"},
+            geo_params,
+        )
+    }
+    assert nodes["target_encoding"].inputs[-1] == "target_stats"
+
+    # クラスター集約の結果の代わりに学習・テストデータを与えて実行
+    source = Node(
+        "cluster_aggregation",
+        lambda: (train.copy(), test.copy()),
+        inputs=[],
+        outputs=["train_cluster_agg", "test_cluster_agg"],
+        cache=False,
+    )
+    pipeline = Pipeline([source, nodes["load_target_stats"], nodes["target_encoding"]])
+    result = pipeline.run(["train_target_encoded", "test_target_encoded"])
+
+    store = TargetStatsStore.load(path)
+    expected = run_target_encoding(
+        train, test, store, categorical_cols=["geo_cluster", "city"], smoothing=5.0
+    )
+    pd.testing.assert_frame_equal(result["train_target_encoded"], expected[0])
+    pd.testing.assert_frame_equal(result["test_target_encoded"], expected[1])
+    assert not np.allclose(
+        result["train_target_encoded"]["city_target_encoded"].to_numpy(),
+        run_target_encoding(train, test, categorical_cols=["city"], smoothing=5.0)[0][
+            "city_target_encoded"
+        ].to_numpy(),
+    )
+
+    with pytest.raises(ValueError):
+        build_geo_pipeline(
+            tmp_path / "train.csv",
+            tmp_path / "test.csv",
+            {"target_col": "money_room"},
+            {**geo_params, "oof_target_stats": True},
+        )
@@ -0,0 +1,52 @@
+"""ユニーク値単位の変換のテスト"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.utils.unique import broadcast_unique, factorize_column, map_unique
+
+
+def test_map_unique_matches_apply():
+    """値ごとの変換がapplyと一致することのテスト"""
+    series = pd.Series(["a", "bb", np.nan, "a", "ccc"], index=[3, 1, 4, 1, 5])
+    calls = []
+
+    def length(value):
+        calls.append(value)
+        return len(value)
+
+    result = map_unique(series, length, fill_value=-1)
+    expected = series.apply(lambda x: len(x) if isinstance(x, str) else -1)
+
+    assert result.tolist() == expected.tolist()
+    assert (result.index == series.index).all()
+    assert sorted(calls) == ["a", "bb", "ccc"]
+
+
+def test_map_unique_vectorized_category():
+    """DataFrameを返す変換のcategory展開のテスト"""
+    series = pd.Series(["x-1", "y-2", None, "x-1"])
+    result = map_unique(
+        series,
+        lambda uniques: uniques.str.split("-", expand=True),
+        vectorized=True,
+        as_category=True,
+    )
+
+    assert isinstance(result[0].dtype, pd.CategoricalDtype)
+    assert result[0].tolist()[:2] == ["x", "y"]
+    assert result[1].tolist()[3] == "1"
+    assert result.iloc[2].isna().all()
+
+
+def test_broadcast_unique_sparse():
+    """疎行列の展開で欠損行が空行になることのテスト"""
+    codes, uniques = factorize_column(pd.Series(["b", None, "a", "b"]))
+    unique_matrix = sparse.csr_matrix(np.eye(len(uniques), dtype=np.uint8))
+
+    result = broadcast_unique(unique_matrix, codes).toarray()
+
+    assert result.shape == (4, 2)
+    assert result[1].sum() == 0
+    assert (result[0] == result[3]).all()